@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Description:
+    asyncio versions of the DAQ_commands.py calls used between connect and
+    the scan loop. Every call awaits the DAQ instead of blocking, so one
+    process can drive many DAQs from a single event loop.
+
+Usage:
+    daq_conn, daq_prompt, daq_identity, latencies = await handshake("10.193.64.232", 5024, 10)
+"""
+
+import asyncio
+import re
+import time
+import DAQ_commands as DAQ_cmd
+import DAQ_errors
+from DAQ_transport import DAQTransport
+
+# A lone "1" from *OPC? on its own line, used to find our place again after a cancelled request
+OPC_REPLY_RE = re.compile(rb"(?:^|\n)(?:[0-9A-Z]+> )*\+?1\r?\n[0-9A-Z]+> ")
+
+
+async def connect_daq(ip, port, timeout_num):
+    """Connect to DAQ and return the connection
+    """
+    try:
+        daq_conn = await DAQTransport.open(ip, port, timeout_num)
+    except (OSError, asyncio.TimeoutError):
+        print("Telnet to %s %s timed out." % (ip, port))
+        return False
+    return daq_conn
+
+
+async def sync_daq_time_local_clock(daq_conn):
+    """Set the DAQ date and time from the local machine
+    """
+    localtime = time.localtime(time.time())
+    await execute_daq_batches(daq_conn, [[":SYSTem:DATE %d, %d, %d" % localtime[0:3], "DAQ"],
+                                         [":SYSTem:TIME %d, %d, %d" % localtime[3:6], "DAQ"]])
+    return True
+
+
+async def welcome_daq(daq_conn, timeout=DAQ_cmd.CMD_TIMEOUT):
+    """Collect logon response of DAQ and return it as lines, the prompt is the last line
+    """
+    m_index, obj_returned, response = await daq_conn.expect([DAQ_cmd.DAQ_PROMPT_RE], timeout)
+    if m_index < 0:
+        print("Timed out waiting for the DAQ logon message")
+        return False
+    return response.decode('ascii', errors='replace').split("\n")
+
+
+async def handshake(ip, port, timeout_num=10):
+    """Connect, wait for the logon prompt and identify the DAQ
+    See DAQ_commands.handshake, many DAQs can shake hands at once with asyncio.gather
+    """
+    start = time.perf_counter()
+    daq_conn = await connect_daq(ip, port, timeout_num)
+    if not daq_conn:
+        return False
+    connected = time.perf_counter()
+    prompt = ""
+    daq_identity = False
+    try:
+        welcome = await welcome_daq(daq_conn)
+    except (EOFError, OSError):
+        welcome = False
+    banner = time.perf_counter()
+    if welcome:
+        prompt = welcome[-1]
+        try:
+            daq_identity = await get_idn(daq_conn)
+        except (EOFError, OSError):
+            daq_identity = False
+    idn = time.perf_counter()
+    DAQ_cmd.check_model(prompt, daq_identity)
+    return [daq_conn, prompt, daq_identity, [connected - start, banner - connected, idn - banner]]
+
+
+async def resync(daq_conn, timeout=DAQ_cmd.CMD_TIMEOUT):
+    """Throw away the answer to a cancelled request by waiting for an *OPC? reply
+    """
+    daq_conn.read_very_eager()
+    daq_conn.write(b"*OPC?\n")
+    m_index, obj_returned, response = await daq_conn.expect([OPC_REPLY_RE], timeout)
+    daq_conn.needs_resync = m_index < 0
+    return m_index >= 0
+
+
+async def _request(daq_conn, daq_cmd, pattern, timeout):
+    """Send one command and wait for pattern, one request on a connection at a time
+    """
+    async with daq_conn.lock:
+        if daq_conn.needs_resync:
+            await resync(daq_conn, timeout)
+        daq_conn.read_very_eager()
+        daq_conn.write(daq_cmd.encode() + b"\n")
+        try:
+            return await daq_conn.expect([pattern], timeout)
+        except asyncio.CancelledError:
+            daq_conn.needs_resync = True
+            raise
+
+
+async def execute_daq_cmd(daq_conn, daq_cmd, timeout=DAQ_cmd.CMD_TIMEOUT):
+    """Execute the DAQ command and wait for the prompt that shows it has finished
+    """
+    m_index, obj_returned, response = await _request(daq_conn, daq_cmd, DAQ_cmd.DAQ_PROMPT_RE, timeout)
+    if m_index < 0:
+        print("Timed out waiting for the DAQ to finish: %s" % daq_cmd)
+        return False
+    return True
+
+
+async def query_daq(daq_conn, daq_query, timeout=DAQ_cmd.CMD_TIMEOUT):
+    """Send a query and return the response line, False on timeout
+    """
+    response_and_prompt = re.compile(DAQ_cmd.DAQ_RESPONSE_RE.pattern + DAQ_cmd.DAQ_PROMPT_RE.pattern)
+    m_index, obj_returned, response = await _request(daq_conn, daq_query, response_and_prompt, timeout)
+    if m_index < 0:
+        print("Timed out waiting for a response to: %s" % daq_query)
+        return False
+    return obj_returned.group(1).decode('ascii').strip()
+
+
+async def wait_for_opc(daq_conn, daq_cmd, timeout=DAQ_cmd.CMD_TIMEOUT):
+    """Run a long command followed by *OPC? and wait for it to complete
+    """
+    response = await query_daq(daq_conn, daq_cmd + ";*OPC?", timeout)
+    return bool(response) and response.lstrip("+") == "1"
+
+
+async def get_idn(daq_conn):
+    """Fetch the IDN from the DAQ
+    Agilent Technologies,34980A,MY53151561,2.51-2.43-2.07-1.05
+    """
+    response = await query_daq(daq_conn, "*IDN?", 10)
+    if not response:
+        return False
+    line = response.split(",")
+    if len(line) < 4:
+        print("Did not understand the IDN: %s" % response)
+        return False
+    return line[0], line[1], line[2], line[3].strip()
+
+
+async def collect_errors(daq_conn, command=None, count=True):
+    """Drain the DAQ error queue and return the errors found as DAQ_errors.SCPIError
+    """
+    errors = []
+    error = await query_daq(daq_conn, ":SYSTem:ERRor?")
+    while error and not "No error" in error:
+        errors.append(DAQ_errors.decode_error(error, command, count))
+        error = await query_daq(daq_conn, ":SYSTem:ERRor?")
+    return errors
+
+
+async def execute_daq_batches(daq_conn, cmd_list, max_batch_bytes=DAQ_cmd.MAX_BATCH_BYTES):
+    """Send [command, channel] pairs in batches with one error drain per batch
+    See DAQ_commands.execute_daq_batches
+    """
+    errors = []
+    for batch in DAQ_cmd.build_cmd_batches(cmd_list, max_batch_bytes):
+        batch_cmd = ";".join(cmd for cmd, channel in batch)
+        await execute_daq_cmd(daq_conn, batch_cmd)
+        batch_errors = await collect_errors(daq_conn, batch_cmd, count=len(batch) == 1)
+        if not batch_errors:
+            continue
+        if len(batch) == 1:
+            for error in batch_errors:
+                errors.append([batch[0][0], batch[0][1], error])
+            continue
+        for cmd, channel in batch:
+            await execute_daq_cmd(daq_conn, cmd)
+            for error in await collect_errors(daq_conn, cmd):
+                errors.append([cmd, channel, error])
+
+    for cmd, channel, error in errors:
+        print("Error configuring channel %s: %s -> %s" % (channel, cmd, error))
+    return errors
+
+
+async def collect_sensor_response(daq_conn, timeout=DAQ_cmd.READ_TIMEOUT):
+    """Read from DAQ and return the raw comma separated response of one sweep, "" if nothing came back
+    """
+    response = await query_daq(daq_conn, ":READ?", timeout)
+    if not response:
+        return ""
+    return response
+
+
+async def collect_sensor_line(daq_conn, daq_prompt, timeout=DAQ_cmd.READ_TIMEOUT):
+    """Read from DAQ and return a raw list of sensor values, date, time, and channel number
+    """
+    response = await collect_sensor_response(daq_conn, timeout)
+    if not response:
+        return []
+    return response.split(",")
+
+
+async def is_alive(daq_conn, timeout=DAQ_cmd.CMD_TIMEOUT):
+    """Check the DAQ still answers with an *OPC?, also keeps an idle session open
+    """
+    try:
+        response = await query_daq(daq_conn, "*OPC?", timeout)
+    except (EOFError, OSError):
+        return False
+    return bool(response) and response.lstrip("+") == "1"
+
+
+async def daq_config_state(daq_conn, chan_numbers):
+    """Read back the scan list and a fingerprint of the channel and scan setup the DAQ holds
+    See DAQ_commands.daq_config_state
+    """
+    scan = await query_daq(daq_conn, ":ROUTe:SCAN?")
+    config = await query_daq(daq_conn, ":CONFigure? (%s)" % chan_numbers) if chan_numbers else ""
+    scan_state = await query_daq(daq_conn, ";".join(DAQ_cmd.SCAN_STATE_QUERIES))
+    if scan is False or config is False or scan_state is False:
+        return False
+    return DAQ_cmd.config_state_fingerprint(scan, config, scan_state)
+
+
+async def reset_daq_factory_cfg(daq_conn):
+    """Reset DAQ to factory config and wait for *OPC?
+    """
+    if await wait_for_opc(daq_conn, "*RST", DAQ_cmd.RESET_TIMEOUT):
+        return True
+    print("Issue resetting the DAQ")
+    return False
+
+
+async def configure_daq_channels(daq_conn, chan_list, max_batch_bytes=DAQ_cmd.MAX_BATCH_BYTES):
+    """Configure the channels in groups and return the channel list to scan
+    """
+    cmd_list, channels = DAQ_cmd.plan_channel_config(chan_list)
+    await execute_daq_batches(daq_conn, cmd_list, max_batch_bytes)
+    return DAQ_cmd.compress_channel_list(channels)
+
+
+async def configure_daq(daq_conn, chan_list, reading_format="full"):
+    """Set up DAQ for logging not individual channels
+    """
+    return not await execute_daq_batches(daq_conn, DAQ_cmd.scan_setup_cmds(chan_list, reading_format=reading_format))
+
+
+async def put_in_local_mode(daq_conn):
+    """Give the DAQ back to the front panel
+    """
+    if await execute_daq_cmd(daq_conn, "SYSTem:LOCal"):
+        return True
+    print("Issue putting DAQ into local mode")
+    return False
@@ -12,9 +12,42 @@ Agilent Technologies,34980A,MY53151561,2.51-2.43-2.07-1.05
 Use this to id the unit and the connection
 """
 
-import telnetlib
+import hashlib
 import re
 import time
+import DAQ_errors
+import parse_config_file as pcf
+from DAQ_transport import DAQConnection
+
+# Largest program message sent in one write. The 34972A and 34980A input
+# buffers hold more than this, it leaves room for the telnet line handling.
+MAX_BATCH_BYTES = 512
+
+# The DAQ prints its prompt (34980A> or 34972A> ) once it is ready for the next command
+DAQ_PROMPT_RE = re.compile(rb"[0-9A-Z]+> ")
+# A query response is one line, possibly behind prompts left over from earlier commands
+DAQ_RESPONSE_RE = re.compile(rb"(?:[0-9A-Z]+> )*([^\r\n]+)\r?\n")
+# The prompt names the model, "34980A> " or "34972A> "
+DAQ_MODEL_RE = re.compile(r"([0-9]{5}[A-Z])>$")
+
+# Seconds to wait for a command to finish
+CMD_TIMEOUT = 5
+# *RST and *RCL can take several seconds on a fully loaded 34980A
+RESET_TIMEOUT = 15
+# A :READ? waits for the whole scan, slow NPLC settings on many channels take a while
+READ_TIMEOUT = 60
+# Most readings taken from DAQ memory by one R? in a buffered scan
+BUFFER_FETCH_READINGS = 1000
+
+# Fields the DAQ sends per reading in each reading format
+# full     - value, year, month, day, hour, minute, second, channel
+# relative - value, seconds since the scan started
+# values   - value only
+# Channel numbers and timestamps left off the wire are rebuilt from the scan list and the host clock
+READING_FORMATS = {"full": 8, "relative": 2, "values": 1}
+# Scan settings read back to tell whether the DAQ still holds our configuration
+SCAN_STATE_QUERIES = [":TRIGger:SOURce?", ":TRIGger:COUNt?", ":FORMat:READing:CHANnel?",
+                      ":FORMat:READing:TIME?", ":FORMat:READing:TIME:TYPE?", ":FORMat:READing:UNIT?"]
 
 def sync_daq_time_local_clock(daq_conn):
     """Set the DAQ time
@@ -28,13 +61,13 @@ def sync_daq_time_local_clock(daq_conn):
     year =  str(localtime[0])
     month = str(localtime[1])
     day =   str(localtime[2])
-    execute_daq_cmd(daq_conn, ":SYSTem:DATE " + year + ", " + month + ", " + day, 1)
+    execute_daq_cmd(daq_conn, ":SYSTem:DATE " + year + ", " + month + ", " + day)
     collect_errors(daq_conn)
     localtime = time.localtime(time.time())
     hour =    str(localtime[3])
     minute =  str(localtime[4])
     seconds = str(localtime[5])
-    execute_daq_cmd(daq_conn, ":SYSTem:TIME " + hour + ", " + minute + ", " + seconds, 1)
+    execute_daq_cmd(daq_conn, ":SYSTem:TIME " + hour + ", " + minute + ", " + seconds)
     collect_errors(daq_conn)
     print("Synced to local machine time: %s/%s/%s %s:%s:%s" % (month, day, year, hour, minute, seconds))
     return True
@@ -44,35 +77,84 @@ def connect_daq(ip, port, timeout_num):
     """Connect to DAQ and return the connection and telnet terminal prompt
     """
     try:
-        telnet_conn = telnetlib.Telnet(ip, port, timeout=timeout_num)
+        telnet_conn = DAQConnection(ip, port, timeout_num)
         telnet_conn.write(b"\n")
     except:
-        print("Telnet to %s %s timed out."% (daq_ip_address, daq_port_address))
+        print("Telnet to %s %s timed out."% (ip, port))
         return False
     return telnet_conn
 
 
-def welcome_daq(daq_conn):
-    """Collect logon response of DAQ and return the prompt after first connection
+def welcome_daq(daq_conn, timeout=CMD_TIMEOUT):
+    """Wait for the logon message of the DAQ and return it as lines, the prompt is the last line
+    False if no prompt arrives within timeout seconds
     """
-    output = False
-    while not output:
-        response = daq_conn.read_very_eager()
-        response_str = response.decode('ascii')
+    m_index, obj_returned, response = daq_conn.expect([DAQ_PROMPT_RE], timeout)
+    if m_index < 0:
+        print("Timed out waiting for the DAQ logon message")
+        return False
+    return response.decode('ascii', errors='replace').split("\n")
+
+
+def prompt_model(prompt):
+    """The DAQ model named by its prompt, "34980A> " -> "34980A", False for anything else
+    """
+    found = DAQ_MODEL_RE.match(prompt.strip())
+    if not found:
+        return False
+    return found.group(1)
+
 
-        if response_str:
-            output = response_str.split("\n")
-    return output
+def check_model(prompt, daq_identity):
+    """Warn when the model in the prompt is not the model the DAQ identifies as
+    """
+    model = prompt_model(prompt)
+    if prompt and not model:
+        print("Unknown DAQ prompt: %s" % prompt.strip())
+    elif model and daq_identity and daq_identity[1] != model:
+        print("DAQ prompt says %s but it identifies as %s" % (model, daq_identity[1]))
+
+
+def handshake(ip, port, timeout_num=10):
+    """Connect, wait for the logon prompt and identify the DAQ, every step waits on
+    the connection with its own deadline instead of polling.
+    Returns [connection, prompt, identity, [connect, banner, IDN seconds]] or
+    False if the DAQ cannot be reached. identity is False if the DAQ did not identify.
+    """
+    start = time.perf_counter()
+    daq_conn = connect_daq(ip, port, timeout_num)
+    if not daq_conn:
+        return False
+    connected = time.perf_counter()
+    prompt = ""
+    daq_identity = False
+    try:
+        welcome = welcome_daq(daq_conn)
+    except (EOFError, OSError):
+        welcome = False
+    banner = time.perf_counter()
+    if welcome:
+        prompt = welcome[-1]
+        try:
+            daq_identity = get_idn(daq_conn)
+        except (EOFError, OSError):
+            daq_identity = False
+    idn = time.perf_counter()
+    check_model(prompt, daq_identity)
+    return [daq_conn, prompt, daq_identity, [connected - start, banner - connected, idn - banner]]
+
+
+def handshake_report(latencies):
+    """One line with the connect, banner and IDN latencies of a handshake
+    """
+    return "connect %.1f ms, banner %.1f ms, IDN %.1f ms" % tuple(latency * 1000 for latency in latencies)
 
 
 def reset_daq_factory_cfg(daq_conn, daq_prompt):
     """Reset DAQ to factory config
+    Waits on *OPC? so we return as soon as the reset has finished
     """
-    prompt = daq_prompt.encode()
-    daq_conn.write(b"*RST\n")
-    time.sleep(1)
-    result = daq_conn.read_until(prompt, 5)
-    if result:
+    if wait_for_opc(daq_conn, "*RST", RESET_TIMEOUT):
         return True
     else:
         print("Issue resetting the DAQ")
@@ -82,12 +164,7 @@ def reset_daq_factory_cfg(daq_conn, daq_prompt):
 def put_in_local_mode(daq_conn, daq_prompt):
     """Put DAQ into remote mode
     """
-    #daq_prompt = b"34980A> "
-    prompt = daq_prompt.encode()
-    daq_conn.write(b"SYSTem:LOCal\n")
-    time.sleep(1)
-    result = daq_conn.read_until(prompt, 5)
-    if result:
+    if execute_daq_cmd(daq_conn, "SYSTem:LOCal"):
         return True
     else:
         print("Issue putting DAQ into local mode")
@@ -99,29 +176,27 @@ def get_idn(daq_conn):
     Agilent Technologies,34980A,MY53151561,2.51-2.43-2.07-1.05
     [\w\s]*,[\w\s]*,[\w\s]*,[\w\s.-]*
     """
-    #idn_regex = re.compile(b"[\w\s]*,[\w]*,[\w]*,[\d.-]*\r\n")
-    # idn_regex = re.compile(b"[\w\s]*,[\w]*,[\w]*,[\d.-]*\r\n")
-    idn_regex = [b"\w\s]+,\w+,\w+,[\d.\-]+"]
-
-    daq_conn.write(b"*IDN?\n")
-    time.sleep(0.2)
-    m_index, obj_returned, bytes_matched = daq_conn.expect(idn_regex, 10)
-    # m_index, obj_returned, bytes_matched = daq_conn.expect(b"[\w\s]*,[\w]*,[\w]*,[\d.-]*\r\n", 10)
+    response = query_daq(daq_conn, "*IDN?", 10)
+    if not response:
+        return False
 
-    line = bytes_matched.decode('ascii').split(",")
-    manufacturer_line = line[0].split("> ")
-    manufacturer = manufacturer_line[1]
+    line = response.split(",")
+    if len(line) < 4:
+        print("Did not understand the IDN: %s" % response)
+        return False
+    manufacturer = line[0]
     daq_model = line[1]
     daq_serial_number = line[2]
     daq_firmware_version = line[3].strip()
     return manufacturer, daq_model, daq_serial_number, daq_firmware_version
 
 
-def configure_voltage(daq_conn, sensor_line):
-    """Configure a DC Voltage channel
+def voltage_cmds(sensor_line):
+    """Build the commands that configure a DC Voltage channel
+    Returns a list of [command, channel] pairs
     """
-    sleep_time = 0.1
-    chan_num = "@" + str(sensor_line[0])
+    channel = str(sensor_line[0])
+    chan_num = "@" + channel
     v_type = sensor_line[3]
     s_range = sensor_line[4]
     s_res = sensor_line[5]
@@ -130,58 +205,51 @@ def configure_voltage(daq_conn, sensor_line):
     offset = sensor_line[8]
     units = sensor_line[9]
 
-    execute_daq_cmd(daq_conn,
-                    ":CONFigure:VOLTage:" + v_type + " " + s_range + "," + s_res + ",(" + chan_num + ")", sleep_time)
-    # print(":CONFigure:VOLTage:" + v_type + " " + s_range + "," + s_res + ",(" + chan_num + ")")
-    collect_errors(daq_conn)
-    execute_daq_cmd(daq_conn, ":SENSe:VOLTage:DC:NPLCycles 10,(" + chan_num + ")", sleep_time)
-    collect_errors(daq_conn)
+    cmds = [":CONFigure:VOLTage:" + v_type + " " + s_range + "," + s_res + ",(" + chan_num + ")",
+            ":SENSe:VOLTage:DC:NPLCycles 10,(" + chan_num + ")"]
     if scale:
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:STATe ON,(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:GAIN " + gain + ",(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:OFFset " + offset + ",(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:UNIT '" + units + "',(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-    return True
+        cmds = cmds + scale_cmds(chan_num, gain, offset, units)
+    return [[cmd, channel] for cmd in cmds]
 
-# TODO configure_current function has not been tested
-def configure_current(daq_conn, sensor_line):
-    """Configure a DC Current channel
+
+def configure_voltage(daq_conn, sensor_line):
+    """Configure a DC Voltage channel
+    """
+    return not execute_daq_batches(daq_conn, voltage_cmds(sensor_line))
+
+
+# TODO current_cmds has not been tested
+def current_cmds(sensor_line):
+    """Build the commands that configure a DC Current channel
     This only works on 34901A 20 Channel Multiplexer (2/4-wire) Module (channels 21 and 22 only) at 250V 1A
     CONFigure:CURRent:DC [{<range>|AUTO|MIN|MAX|DEF}[,{<resolution>|MIN|MAX|DEF}],] (@<scan_list>)
     :CONFigure:CURRent:DC DEF,4.5,(@103)
     [SENSe:]CURRent:DC:NPLC {<PLCs>|MIN|MAX}[,(@<ch_list>)]
     """
-    sleep_time = 0.1
-    chan_num = "@" + str(sensor_line[0])
+    channel = str(sensor_line[0])
+    chan_num = "@" + channel
     s_type = sensor_line[3]
     s_range = sensor_line[4]
     s_res = sensor_line[5]
-    scale = sensor_line[6]
-    gain = sensor_line[7]
-    offset = sensor_line[8]
-    units = sensor_line[9]
 
-    chan_num = "@" + str(chan_num)
-    execute_daq_cmd(daq_conn,
-                    ":CONFigure:CURRent :" + s_type + " " + s_range + "," + s_res + ",(" + chan_num + ")", sleep_time)
-    collect_errors(daq_conn)
-    execute_daq_cmd(daq_conn, ":SENSe:CURRent:" + s_type + ":NPLCycles 10,(" + chan_num + ")", sleep_time)
-    collect_errors(daq_conn)
-    return True
+    cmds = [":CONFigure:CURRent:" + s_type + " " + s_range + "," + s_res + ",(" + chan_num + ")",
+            ":SENSe:CURRent:" + s_type + ":NPLCycles 10,(" + chan_num + ")"]
+    return [[cmd, channel] for cmd in cmds]
 
 
-def configure_frequency(daq_conn, sensor_line):
-    """Configure frequency such as RPM
+def configure_current(daq_conn, sensor_line):
+    """Configure a DC Current channel
+    """
+    return not execute_daq_batches(daq_conn, current_cmds(sensor_line))
+
+
+def frequency_cmds(sensor_line):
+    """Build the commands that configure frequency such as RPM
      Num,  Name,      Function, Type, Range, Resolution, Scale,   Gain(M), Offset(B), Units
      [104, "Fan RPM", "DFreq",  "",   "10",  "4.5",      "TRUE", "15",     "0",       "RPM"]
     """
-    sleep_time = 0.1
-    chan_num = "@" + str(sensor_line[0])
-    v_type = sensor_line[3]
+    channel = str(sensor_line[0])
+    chan_num = "@" + channel
     s_range = sensor_line[4]
     s_res = sensor_line[5]
     scale = sensor_line[6]
@@ -189,22 +257,20 @@ def configure_frequency(daq_conn, sensor_line):
     offset = sensor_line[8]
     units = sensor_line[9]
 
-    execute_daq_cmd(daq_conn, "CONFigure:FREQuency " + s_range +"," + s_res + ",(" + chan_num + ")", sleep_time)
-    collect_errors(daq_conn)
+    cmds = [":CONFigure:FREQuency " + s_range + "," + s_res + ",(" + chan_num + ")"]
     if scale:
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:STATe ON,(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:GAIN " + gain + ",(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:OFFset " + offset + ",(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-        execute_daq_cmd(daq_conn, "CALCulate:SCALe:UNIT '" + units + "',(" + chan_num + ")", sleep_time)
-        collect_errors(daq_conn)
-    return True
+        cmds = cmds + scale_cmds(chan_num, gain, offset, units)
+    return [[cmd, channel] for cmd in cmds]
 
 
-def configure_thermocouple(daq_conn, sensor_line):
-    """Configure a thermocouple channel
+def configure_frequency(daq_conn, sensor_line):
+    """Configure frequency such as RPM
+    """
+    return not execute_daq_batches(daq_conn, frequency_cmds(sensor_line))
+
+
+def thermocouple_cmds(sensor_line):
+    """Build the commands that configure a thermocouple channel
     Stuff to worry about:
     set the temp unit C or F
     Just always use internal reference T junction
@@ -213,95 +279,332 @@ def configure_thermocouple(daq_conn, sensor_line):
      Num, Name,            Function,  Type, Range, Resolution, Scale,   Gain(M),   Offset(B), Units
     [106, "REAR Amb",      "TCouple", "T",  "1",   "4.5",       "FALSE",  "1",       "0",       "C"]
     """
-    chan_num = "@" + str(sensor_line[0])
+    channel = str(sensor_line[0])
+    chan_num = "@" + channel
     TC_type = sensor_line[3]
-    s_range = sensor_line[4]
-    s_res = sensor_line[5]
-    scale = sensor_line[6]
-    gain = sensor_line[7]
-    offset = sensor_line[8]
     units = sensor_line[9]
 
-    sleep_time = 0.1
-    execute_daq_cmd(daq_conn, ":CONFigure:TEMPerature TC," + TC_type + ",(" + chan_num + ")", sleep_time)
-    execute_daq_cmd(daq_conn, ":UNIT:TEMPerature " + units + ",(" + chan_num + ")", sleep_time)
-    execute_daq_cmd(daq_conn,
-                    ":SENSe:TEMPerature:TRANsducer:TCouple:RJUNction:TYPE INTernal,(" + chan_num + ")", sleep_time)
-    execute_daq_cmd(daq_conn, ":SENSe:TEMPerature:NPLCycles 10,(" + chan_num + ")", sleep_time)
-    collect_errors(daq_conn)
-    return True
+    cmds = [":CONFigure:TEMPerature TC," + TC_type + ",(" + chan_num + ")",
+            ":UNIT:TEMPerature " + units + ",(" + chan_num + ")",
+            ":SENSe:TEMPerature:TRANsducer:TCouple:RJUNction:TYPE INTernal,(" + chan_num + ")",
+            ":SENSe:TEMPerature:NPLCycles 10,(" + chan_num + ")"]
+    return [[cmd, channel] for cmd in cmds]
 
 
-def collect_errors(daq_conn):
-    """Collect and report errors after running a DAQ command
-    TODO: Work on more descriptive errors
+def configure_thermocouple(daq_conn, sensor_line):
+    """Configure a thermocouple channel
     """
-    daq_conn.write(b":SYSTem:ERRor?\n")
-    response = daq_conn.read_until(b"\n", 5)
-    while not "No error" in response.decode():
-        #print(response)
-        daq_conn.write(b":SYSTem:ERRor?\n")
-        response = daq_conn.read_until(b"\n", 5)
+    return not execute_daq_batches(daq_conn, thermocouple_cmds(sensor_line))
+
 
+def scale_cmds(chan_num, gain, offset, units):
+    """Build the Mx+B scaling commands for a channel
+    """
+    return [":CALCulate:SCALe:STATe ON,(" + chan_num + ")",
+            ":CALCulate:SCALe:GAIN " + gain + ",(" + chan_num + ")",
+            ":CALCulate:SCALe:OFFset " + offset + ",(" + chan_num + ")",
+            ":CALCulate:SCALe:UNIT '" + units + "',(" + chan_num + ")"]
 
-def execute_daq_cmd(daq_conn, daq_cmd, interval_between_cmds):
+
+def collect_errors(daq_conn, command=None, count=True):
+    """Drain the DAQ error queue and return the errors found as DAQ_errors.SCPIError
+    command is the command the errors are blamed on, count=False keeps expected
+    errors out of the run's error counts. +0,"No error" ends the queue
+    """
+    errors = []
+    error = query_daq(daq_conn, ":SYSTem:ERRor?")
+    while error and not "No error" in error:
+        errors.append(DAQ_errors.decode_error(error, command, count))
+        error = query_daq(daq_conn, ":SYSTem:ERRor?")
+    return errors
+
+
+def build_cmd_batches(cmd_list, max_batch_bytes=MAX_BATCH_BYTES):
+    """Join [command, channel] pairs with ";" into program messages that fit the DAQ input buffer
+    Every command is rooted with ":" so joining does not change the command tree it is parsed in.
+    A max_batch_bytes of 0 puts each command in a batch of its own.
+    Returns a list of batches, each a list of [command, channel] pairs
+    """
+    batches = []
+    batch = []
+    batch_len = 0
+    for cmd, channel in cmd_list:
+        cmd_len = len(cmd) + 1  # ";" or "\n"
+        if batch and batch_len + cmd_len > max_batch_bytes:
+            batches.append(batch)
+            batch = []
+            batch_len = 0
+        batch.append([cmd, channel])
+        batch_len += cmd_len
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def execute_daq_batches(daq_conn, cmd_list, max_batch_bytes=MAX_BATCH_BYTES):
+    """Send [command, channel] pairs in as few writes as possible and drain the
+    error queue once per batch. When a batch reports errors its commands are
+    replayed one at a time so each error is tied to the command and channel that caused it.
+    Returns a list of [command, channel, error] for every error found
+    """
+    errors = []
+    for batch in build_cmd_batches(cmd_list, max_batch_bytes):
+        batch_cmd = ";".join(cmd for cmd, channel in batch)
+        execute_daq_cmd(daq_conn, batch_cmd)
+        # Errors of a batch that gets replayed are counted on the replay
+        batch_errors = collect_errors(daq_conn, batch_cmd, count=len(batch) == 1)
+        if not batch_errors:
+            continue
+        if len(batch) == 1:
+            # Nothing to replay, the errors already belong to this command
+            for error in batch_errors:
+                errors.append([batch[0][0], batch[0][1], error])
+            continue
+        for cmd, channel in batch:
+            execute_daq_cmd(daq_conn, cmd)
+            for error in collect_errors(daq_conn, cmd):
+                errors.append([cmd, channel, error])
+
+    for cmd, channel, error in errors:
+        print("Error configuring channel %s: %s -> %s" % (channel, cmd, error))
+    return errors
+
+
+def execute_daq_cmd(daq_conn, daq_cmd, timeout=CMD_TIMEOUT):
     """Execute the DAQ command on the DAQ
+    The command has finished when the DAQ prints its prompt again
     """
-    daq_conn.write(daq_cmd.encode())
-    time.sleep(interval_between_cmds)
-    daq_conn.write(b"\n\n")
+    # Anything still waiting to be read belongs to an earlier command
+    daq_conn.read_very_eager()
+    daq_conn.write(daq_cmd.encode() + b"\n")
+    m_index, obj_returned, bytes_matched = daq_conn.expect([DAQ_PROMPT_RE], timeout)
+    if m_index < 0:
+        print("Timed out waiting for the DAQ to finish: %s" % daq_cmd)
+        return False
     return True
 
 
-def configure_daq(daq_conn, chan_list):
-    """Set up DAQ for logging not individual channels
+def query_daq(daq_conn, daq_query, timeout=CMD_TIMEOUT):
+    """Send a query to the DAQ and return the response line without prompts
+    Returns False if no response arrived within the timeout
+    """
+    daq_conn.read_very_eager()
+    daq_conn.write(daq_query.encode() + b"\n")
+    m_index, obj_returned, bytes_matched = daq_conn.expect([DAQ_RESPONSE_RE], timeout)
+    if m_index < 0:
+        print("Timed out waiting for a response to: %s" % daq_query)
+        return False
+    # Take the prompt that follows the response so the next command starts clean
+    daq_conn.expect([DAQ_PROMPT_RE], timeout)
+    return obj_returned.group(1).decode('ascii').strip()
+
+
+def wait_for_opc(daq_conn, daq_cmd, timeout=CMD_TIMEOUT):
+    """Run a long command followed by *OPC? and wait for the DAQ to report it complete
+    """
+    response = query_daq(daq_conn, daq_cmd + ";*OPC?", timeout)
+    if response and response.lstrip("+") == "1":
+        return True
+    return False
+
+
+def scan_setup_cmds(chan_list, scan_interval=False, scan_count="INFinity", reading_format="full"):
+    """Build the commands that set up the DAQ for logging, not individual channels
+    With a scan_interval the DAQ times the sweeps itself and keeps the readings in memory
+    reading_format picks how much the DAQ sends with each reading, see READING_FORMATS
+    Returns a list of [command, channel list] pairs
     """
-    st = 0.1
-    # Setup Trigger: The instrument will accept an immediate (continuous) trigger
-    daq_conn.write(b":TRIGger:SOURce IMMediate\n")
-    time.sleep(st)
+    if scan_interval:
+        # Setup Trigger: The instrument starts a sweep every scan_interval seconds after INIT
+        cmds = [":TRIGger:SOURce TIMer",
+                ":TRIGger:TIMer %g" % scan_interval,
+                ":TRIGger:COUNt %s" % scan_count]
+    else:
+        # Setup Trigger: The instrument will accept an immediate (continuous) trigger
+        cmds = [":TRIGger:SOURce IMMediate"]
     # Turn off unit display for reading. Stuff we have to strip off anyways
-    daq_conn.write(b":FORMat:READing:UNIT 0\n")
-    time.sleep(st)
+    cmds.append(":FORMat:READing:UNIT 0")
+    if reading_format == "full":
+        # Display the channel number with each reading
+        # Enable the inclusion of a timestamp in each reading
+        # Enable absolute time (Date and time) format for :FORM:READ:TIME
+        cmds = cmds + [":FORMat:READing:CHANnel 1",
+                       ":FORMat:READing:TIME 1",
+                       ":FORMat:READing:TIME:TYPE ABS"]
+    elif reading_format == "relative":
+        # Seconds since the start of the scan, the host adds the start time
+        cmds = cmds + [":FORMat:READing:CHANnel 0",
+                       ":FORMat:READing:TIME 1",
+                       ":FORMat:READing:TIME:TYPE REL"]
+    else:
+        # Values only, the host timestamps each sweep
+        cmds = cmds + [":FORMat:READing:CHANnel 0",
+                       ":FORMat:READing:TIME 0"]
+    cmds.append(":ROUTe:SCAN (" + chan_list + ")")
+    return [[cmd, chan_list] for cmd in cmds]
 
-    # Display the channel number with each reading
-    daq_conn.write(b":FORMat:READing:CHANnel 1\n")
-    time.sleep(st)
 
-    # Enable the inclusion of a timestamp in each reading
-    daq_conn.write(b":FORMat:READing:TIME 1\n")
-    time.sleep(st)
+def configure_daq(daq_conn, chan_list, reading_format="full"):
+    """Set up DAQ for logging not individual channels
+    """
+    return not execute_daq_batches(daq_conn, scan_setup_cmds(chan_list, reading_format=reading_format))
 
-    # Enable absolute time (Date and time) format for :FORM:READ:TIME
-    daq_conn.write(b"FORMat:READing:TIME:TYPE ABS\n")
-    time.sleep(st)
 
-    cmd = ":ROUTe:SCAN (" + chan_list + ")"
-    daq_conn.write(cmd.encode())
-    time.sleep(st)
-    daq_conn.write(b"\n\n")
+def configure_buffered_scan(daq_conn, chan_list, scan_interval, scan_count="INFinity", reading_format="full"):
+    """Set up the DAQ to time its own sweeps every scan_interval seconds
+    The readings wait in DAQ memory until fetch_buffered_readings removes them
+    """
+    return not execute_daq_batches(daq_conn, scan_setup_cmds(chan_list, scan_interval, scan_count, reading_format))
 
 
+def start_scan(daq_conn):
+    """Start a configured scan, the DAQ now sweeps on its trigger
+    No *OPC? here, the DAQ only answers it when the scan is done and an INFinity scan never is.
+    The error queue tells whether the scan started.
+    """
+    if not execute_daq_cmd(daq_conn, ":INITiate"):
+        return False
+    errors = collect_errors(daq_conn, ":INITiate")
+    for error in errors:
+        print("Error starting the scan: %s" % error)
+    return not errors
 
 
+def stop_scan(daq_conn):
+    """Stop a running scan
+    """
+    return execute_daq_cmd(daq_conn, ":ABORt")
 
-def collect_sensor_line(tel_conn, daq_prompt):
-    """Read from DAQ and return a raw list of sensor values, date, time, and channel number
+
+def parse_block(response):
+    """Strip the IEEE 488.2 definite length block header from a response
+    #3123<123 bytes of data>
+    """
+    if not response.startswith("#"):
+        return response
+    num_digits = int(response[1])
+    if num_digits == 0:
+        # Indefinite length, the data runs to the end of the line
+        return response[2:]
+    length = int(response[2:2 + num_digits])
+    return response[2 + num_digits:2 + num_digits + length]
+
+
+def fetch_buffered_response(daq_conn, max_readings=BUFFER_FETCH_READINGS, timeout=READ_TIMEOUT):
+    """Remove up to max_readings readings from DAQ memory with R? in one round trip
+    Returns the readings as one comma separated string, possibly several sweeps long
+    """
+    response = query_daq(daq_conn, "R? %d" % max_readings, timeout)
+    if not response:
+        return ""
+    return parse_block(response).strip()
+
+
+def fetch_buffered_readings(daq_conn, max_readings=BUFFER_FETCH_READINGS, timeout=READ_TIMEOUT):
+    """Remove up to max_readings readings from DAQ memory with R? in one round trip
+    Returns a raw list of fields like collect_sensor_line, possibly several sweeps long
+    """
+    data = fetch_buffered_response(daq_conn, max_readings, timeout)
+    if not data:
+        return []
+    return data.split(",")
+
+
+def drain_buffered_response(daq_conn, fields_per_reading=READING_FORMATS["full"]):
+    """Take every reading waiting in DAQ memory, as many R? as it takes
+    Returns the readings as one comma separated string
+    """
+    responses = []
+    while True:
+        data = fetch_buffered_response(daq_conn)
+        if data:
+            responses.append(data)
+        if not data or data.count(",") + 1 < BUFFER_FETCH_READINGS * fields_per_reading:
+            return ",".join(responses)
+
+
+def drain_buffered_readings(daq_conn, fields_per_reading=READING_FORMATS["full"]):
+    """Take every reading waiting in DAQ memory, as many R? as it takes
+    """
+    data = drain_buffered_response(daq_conn, fields_per_reading)
+    if not data:
+        return []
+    return data.split(",")
+
+
+def expand_channel_list(chan_list):
+    """Turn a SCPI channel list back into channel numbers
+    "@101:103,105" -> [101, 102, 103, 105]
+    """
+    channels = []
+    for chan_range in chan_list.lstrip("(@").rstrip(")").split(","):
+        if ":" in chan_range:
+            first, last = chan_range.split(":")
+            channels.extend(range(int(first), int(last) + 1))
+        elif chan_range.strip():
+            channels.append(int(chan_range))
+    return channels
+
+
+def daq_time_to_epoch(date_fields):
+    """DAQ year, month, day, hour, minute, second fields to seconds since the epoch
+    ["2019", "12", "06", "15", "59", "24.512"] -> 1575676764.512
     """
-    tel_conn.write(b":READ?\n")
-    response = tel_conn.read_until(b"\n", 5)
-    # Time between log events
-    time.sleep(0.1)
-    # Put the read_until into a list
-    response = response.strip()
-    response = response.decode('ascii')
-    response = response.split(",")
-    response[0] = response[0].strip(daq_prompt)
-    # prints the entire matched list
-    # print("Matched line: %s"%(response))
+    seconds = float(date_fields[5])
+    whole_seconds = int(seconds)
+    local = (int(date_fields[0]), int(date_fields[1]), int(date_fields[2]),
+             int(date_fields[3]), int(date_fields[4]), whole_seconds, 0, 0, -1)
+    return time.mktime(local) + seconds - whole_seconds
+
+
+def parse_sweeps(fields, channels, reading_format="full", sweep_time=0.0, sweep_interval=0.0, first_sweep=0):
+    """Turn raw reading fields into sweeps of [timestamp, channel numbers, value strings]
+    channels is the scan list in scan order. In the relative format sweep_time is
+    when the scan started. In the values format sweep number n of the scan is
+    timestamped sweep_time + n * sweep_interval, the fields start at sweep first_sweep.
+    A trailing unfinished sweep is left out.
+    """
+    fields_per_reading = READING_FORMATS[reading_format]
+    fields_per_sweep = fields_per_reading * len(channels)
+    sweeps = []
+    if not fields_per_sweep:
+        return sweeps
+    for start in range(0, len(fields) - fields_per_sweep + 1, fields_per_sweep):
+        sweep_fields = fields[start:start + fields_per_sweep]
+        values = sweep_fields[0::fields_per_reading]
+        if reading_format == "full":
+            timestamp = daq_time_to_epoch(sweep_fields[1:7])
+            sweep_channels = [int(channel) for channel in sweep_fields[7::8]]
+        elif reading_format == "relative":
+            timestamp = sweep_time + float(sweep_fields[1])
+            sweep_channels = channels
+        else:
+            timestamp = sweep_time + (first_sweep + len(sweeps)) * sweep_interval
+            sweep_channels = channels
+        sweeps.append([timestamp, sweep_channels, values])
+    return sweeps
+
+
+def collect_sensor_response(tel_conn, timeout=READ_TIMEOUT):
+    """Read from DAQ and return the raw comma separated response of one sweep, "" if nothing came back
+    The :READ? returns once the scan is done, no extra wait is needed
+    """
+    response = query_daq(tel_conn, ":READ?", timeout)
+    if not response:
+        return ""
     return response
 
 
+def collect_sensor_line(tel_conn, daq_prompt, timeout=READ_TIMEOUT):
+    """Read from DAQ and return a raw list of sensor values, date, time, and channel number
+    """
+    response = collect_sensor_response(tel_conn, timeout)
+    if not response:
+        return []
+    # Put the response into a list
+    return response.split(",")
+
+
 def return_sensor_value(raw_sensor_line, chan_config_list):
     """Finds the sensor channel number, datestamp and value in the matched list and returns it as a list
     """
@@ -312,7 +615,7 @@ def return_sensor_value(raw_sensor_line, chan_config_list):
         # Find an sensor value
         sen_line_match = sen_line.match(raw_sensor_line[i])
         if sen_line_match:
-            sensor_value = e_notation_to_dec(raw_sensor_line[i])
+            sensor_value = pcf.e_notation_to_dec(raw_sensor_line[i])
             year    = raw_sensor_line[i+1]
             month   = raw_sensor_line[i+2]
             day     = raw_sensor_line[i+3]
@@ -347,7 +650,7 @@ def welcome_get_idn(daq_conn):
     """
     welcome = welcome_daq(daq_conn)
     if welcome:
-        daq_prompt = welcome[1]
+        daq_prompt = welcome[-1]
         print(daq_prompt)
     else:
         print("Issues getting login message.")
@@ -365,41 +668,113 @@ def welcome_get_idn(daq_conn):
     return daq_prompt, daq_identity
 
 
-def configure_daq_channels(daq_conn, chan_list):
-    """Takes processed channel list and configures the channels on the DAQ
+# Command builders for each sensor function in the config file
+CMD_BUILDERS = {"TCOUPLE": thermocouple_cmds,
+                "VOLT": voltage_cmds,
+                "FREQ": frequency_cmds}
+
+
+def is_alive(daq_conn, timeout=CMD_TIMEOUT):
+    """Check the DAQ still answers with an *IDN?, also keeps an idle session open
+    Not *OPC?, the DAQ holds that answer while a buffered scan runs.
     """
-    #[1005, "my volts", "VOLT", "DC", "AUTO", "DEF"]
-    #print(chan_list)
-    chan_numbers = "@"
-    for i in range(len(chan_list)):
+    try:
+        response = query_daq(daq_conn, "*IDN?", timeout)
+    except (EOFError, OSError):
+        return False
+    return bool(response)
 
 
-        #print(chan_list[i][2])
-        #print(chan_list[i][2])
-        chan_type = chan_list[i][2].upper()
+def daq_config_state(daq_conn, chan_numbers):
+    """Read back the scan list and a fingerprint of the channel and scan setup the DAQ holds
+    Returns [scan list, fingerprint] or False if the DAQ did not answer
+    """
+    scan = query_daq(daq_conn, ":ROUTe:SCAN?")
+    config = query_daq(daq_conn, ":CONFigure? (%s)" % chan_numbers) if chan_numbers else ""
+    scan_state = query_daq(daq_conn, ";".join(SCAN_STATE_QUERIES))
+    if scan is False or config is False or scan_state is False:
+        return False
+    return config_state_fingerprint(scan, config, scan_state)
 
 
-        if chan_type == "TCOUPLE":
-            print("Configuring channel: %s"% (chan_list[i][0]))
-            configure_thermocouple(daq_conn, chan_list[i])
-            chan_numbers = chan_numbers + str(chan_list[i][0])
-            if not i >= len(chan_list)-1:
-                chan_numbers = chan_numbers + ","
+def config_fingerprint(cmd_list):
+    """Fingerprint of the [command, channel] pairs that set the DAQ up, the same config gives the same fingerprint
+    """
+    return hashlib.sha1("\n".join(cmd for cmd, channel in cmd_list).encode()).hexdigest()
 
-        elif chan_type == "VOLT":
-            print("Configuring channel: %s"% (chan_list[i][0]))
-            configure_voltage(daq_conn, chan_list[i])
-            chan_numbers = chan_numbers + str(chan_list[i][0])
-            if not i >= len(chan_list)-1:
-                chan_numbers = chan_numbers + ","
 
-        elif chan_type == "FREQ":
-            print("Configuring channel: %s"% (chan_list[i][0]))
-            configure_frequency(daq_conn, chan_list[i])
-            chan_numbers = chan_numbers + str(chan_list[i][0])
-            if not i >= len(chan_list)-1:
-                chan_numbers = chan_numbers + ","
+def config_state_fingerprint(scan, config, scan_state):
+    """Responses to :ROUTe:SCAN?, :CONFigure? and SCAN_STATE_QUERIES to [scan list, fingerprint]
+    """
+    scan_list = compress_channel_list(expand_channel_list(parse_block(scan).strip().strip('"')))
+    fingerprint = hashlib.sha1("\n".join([scan_list, config, scan_state]).encode()).hexdigest()
+    return [scan_list, fingerprint]
 
+
+def compress_channel_list(channels):
+    """Turn channel numbers into a SCPI channel list using ranges for consecutive channels
+    [101, 102, 103, 105, 201, 202] -> "@101:103,105,201:202"
+    """
+    numbers = sorted(set(int(channel) for channel in channels))
+    ranges = []
+    i = 0
+    while i < len(numbers):
+        j = i
+        while j + 1 < len(numbers) and numbers[j + 1] == numbers[j] + 1:
+            j += 1
+        if j > i:
+            ranges.append("%d:%d" % (numbers[i], numbers[j]))
+        else:
+            ranges.append("%d" % numbers[i])
+        i = j + 1
+    return "@" + ",".join(ranges)
+
+
+def plan_channel_config(chan_list):
+    """Group channels with identical settings and build one set of commands per group
+    Channels only differ by number and name inside a group, so the group is
+    configured with a single channel list such as (@101:110,201:210).
+    Returns a list of [command, channel list] pairs and the channels to scan
+    """
+    groups = {}
+    channels = []
+    for sensor_line in chan_list:
+        chan_type = sensor_line[2].upper()
+        if chan_type in CMD_BUILDERS:
+            # Num, Name, Function, Type, Range, Resolution, Scale, Gain(M), Offset(B), Units
+            settings = (chan_type,) + tuple(sensor_line[3:10])
+            groups.setdefault(settings, []).append(sensor_line)
+            channels.append(sensor_line[0])
+
+    cmd_list = []
+    for settings, sensor_lines in groups.items():
+        group_line = list(sensor_lines[0])
+        group_line[0] = compress_channel_list(line[0] for line in sensor_lines)[1:]
+        cmd_list.extend(CMD_BUILDERS[settings[0]](group_line))
+    return cmd_list, channels
+
+
+def configure_daq_channels(daq_conn, chan_list, max_batch_bytes=MAX_BATCH_BYTES, group_channels=True):
+    """Takes processed channel list and configures the channels on the DAQ
+    Channels with the same settings are configured together and the commands are sent in batches.
+    Returns the channel list to scan
+    """
+    #[1005, "my volts", "VOLT", "DC", "AUTO", "DEF"]
+    if group_channels:
+        cmd_list, channels = plan_channel_config(chan_list)
+    else:
+        cmd_list = []
+        channels = []
+        for sensor_line in chan_list:
+            chan_type = sensor_line[2].upper()
+            if chan_type in CMD_BUILDERS:
+                cmd_list.extend(CMD_BUILDERS[chan_type](sensor_line))
+                channels.append(sensor_line[0])
+
+    if channels:
+        print("Configuring channels: %s" % compress_channel_list(channels))
+    execute_daq_batches(daq_conn, cmd_list, max_batch_bytes)
+    chan_numbers = compress_channel_list(channels)
     return chan_numbers
 
 
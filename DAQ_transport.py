@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Description:
+    asyncio connection to the telnet port (5024) of a Keysight 34972A or
+    34980A DAQ. Replaces telnetlib, which blocks on every read and is no
+    longer in the standard library from Python 3.13.
+
+    DAQTransport is the asyncio connection. DAQConnection wraps it with
+    the blocking telnetlib style calls (write, read_until, expect,
+    read_very_eager) used by DAQ_commands.py and start.py.
+
+Usage:
+    transport = await DAQTransport.open("10.193.64.232", 5024, 10)
+    conn = DAQConnection("10.193.64.232", 5024, 10)
+"""
+
+import asyncio
+import re
+
+# Telnet commands the DAQ may send during option negotiation
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+
+
+class _TelnetProtocol(asyncio.Protocol):
+    """Collects bytes from the DAQ with the telnet negotiation removed
+    Every option the DAQ asks for is refused, it then talks plain text.
+    """
+    def __init__(self):
+        self.transport = None
+        self.buffer = bytearray()
+        self.pending_iac = b""
+        self.closed = False
+        self.waiter = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += self.strip_iac(self.pending_iac + data)
+        self.wake()
+
+    def connection_lost(self, exc):
+        self.closed = True
+        self.wake()
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(True)
+
+    def wait_for_data(self):
+        """Return a future that completes on the next data or on disconnect
+        """
+        self.waiter = asyncio.get_running_loop().create_future()
+        return self.waiter
+
+    def strip_iac(self, data):
+        """Remove telnet commands from the data and answer option requests
+        An incomplete command at the end is kept for the next call.
+        """
+        text = bytearray()
+        self.pending_iac = b""
+        i = 0
+        while i < len(data):
+            byte = data[i]
+            if byte != IAC:
+                text.append(byte)
+                i += 1
+                continue
+            if i + 1 >= len(data):
+                self.pending_iac = bytes(data[i:])
+                break
+            command = data[i + 1]
+            if command == IAC:
+                text.append(IAC)
+                i += 2
+            elif command in (DO, DONT, WILL, WONT):
+                if i + 2 >= len(data):
+                    self.pending_iac = bytes(data[i:])
+                    break
+                option = data[i + 2]
+                if command == DO:
+                    self.transport.write(bytes([IAC, WONT, option]))
+                elif command == WILL:
+                    self.transport.write(bytes([IAC, DONT, option]))
+                i += 3
+            elif command == SB:
+                end = data.find(bytes([IAC, SE]), i + 2)
+                if end < 0:
+                    self.pending_iac = bytes(data[i:])
+                    break
+                i = end + 2
+            else:
+                i += 2
+        return bytes(text)
+
+
+class DAQTransport:
+    """asyncio connection to a DAQ telnet port
+    One request at a time is framed by the lock, a cancelled request marks
+    the connection for a resync before the next one.
+    """
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self.protocol = protocol
+        self.lock = asyncio.Lock()
+        self.needs_resync = False
+        # "host port", tells DAQs apart in the metrics
+        self.name = "daq"
+
+    @classmethod
+    async def open(cls, host, port, timeout):
+        """Connect to host:port and return a DAQTransport
+        Raises OSError or asyncio.TimeoutError if the DAQ cannot be reached
+        """
+        loop = asyncio.get_running_loop()
+        transport, protocol = await asyncio.wait_for(
+            loop.create_connection(_TelnetProtocol, host, int(port)), timeout)
+        daq_transport = cls(transport, protocol)
+        daq_transport.name = "%s %s" % (host, port)
+        return daq_transport
+
+    @property
+    def closed(self):
+        return self.protocol.closed
+
+    def write(self, data):
+        """Queue data for the DAQ, the event loop sends it
+        """
+        if self.protocol.closed:
+            raise EOFError("telnet connection closed")
+        self.transport.write(data)
+
+    def read_very_eager(self):
+        """Return everything received so far without waiting
+        """
+        data = bytes(self.protocol.buffer)
+        del self.protocol.buffer[:]
+        return data
+
+    async def expect(self, pattern_list, timeout=None):
+        """Wait until one of the regular expressions matches the received data
+        Returns (index, match, data up to the end of the match) like telnetlib,
+        or (-1, None, data received) on timeout.
+        """
+        patterns = [re.compile(pattern) if isinstance(pattern, bytes) else pattern
+                    for pattern in pattern_list]
+        loop = asyncio.get_running_loop()
+        deadline = None
+        if timeout is not None:
+            deadline = loop.time() + timeout
+        while True:
+            received = bytes(self.protocol.buffer)
+            for i, pattern in enumerate(patterns):
+                found = pattern.search(received)
+                if found:
+                    del self.protocol.buffer[:found.end()]
+                    return i, found, received[:found.end()]
+            if self.protocol.closed:
+                del self.protocol.buffer[:]
+                if not received:
+                    raise EOFError("telnet connection closed")
+                return -1, None, received
+            if deadline is None:
+                await self.protocol.wait_for_data()
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                del self.protocol.buffer[:]
+                return -1, None, received
+            try:
+                await asyncio.wait_for(self.protocol.wait_for_data(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+    async def read_until(self, match, timeout=None):
+        """Read until the bytes in match are seen or the timeout runs out
+        """
+        m_index, obj_returned, data = await self.expect([re.compile(re.escape(match))], timeout)
+        return data
+
+    async def read_all(self):
+        """Read until the DAQ closes the connection
+        """
+        while not self.protocol.closed:
+            await self.protocol.wait_for_data()
+        return self.read_very_eager()
+
+    def close(self):
+        self.transport.close()
+
+
+class DAQConnection:
+    """Blocking wrapper around DAQTransport with the telnetlib calls the
+    rest of the logger uses. It runs a private event loop only while a call
+    is waiting on the DAQ.
+    """
+    def __init__(self, host, port, timeout):
+        self.loop = asyncio.new_event_loop()
+        try:
+            self.transport = self.loop.run_until_complete(DAQTransport.open(host, port, timeout))
+        except BaseException:
+            self.loop.close()
+            raise
+        self.name = self.transport.name
+
+    def write(self, data):
+        self.transport.write(data)
+        # One pass of the loop hands the data to the socket
+        self.loop.run_until_complete(asyncio.sleep(0))
+
+    def read_very_eager(self):
+        self.loop.run_until_complete(asyncio.sleep(0))
+        return self.transport.read_very_eager()
+
+    def read_until(self, match, timeout=None):
+        return self.loop.run_until_complete(self.transport.read_until(match, timeout))
+
+    def expect(self, pattern_list, timeout=None):
+        return self.loop.run_until_complete(self.transport.expect(pattern_list, timeout))
+
+    def read_all(self):
+        return self.loop.run_until_complete(self.transport.read_all())
+
+    def close(self):
+        if self.loop.is_closed():
+            return
+        self.transport.close()
+        # Let the transport finish closing before the loop goes away
+        self.loop.run_until_complete(asyncio.sleep(0))
+        self.loop.close()
@@ -0,0 +1,732 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Benchmarks for the DAQ logger that run without lab hardware.
+
+Usage:
+    ./benchmarks.py [benchmark name ...] [--save FILE] [--baseline FILE] [--threshold 0.2]
+
+    config      - count round trips per configured channel, one command per
+                  message versus batched program messages and grouped channels
+    formats     - wire bytes and parse cost per 1000 channels for each reading format
+    parse       - the bulk reading parser against splitting and e_notation_to_dec
+                  one field at a time for 100, 1,000 and 10,000 readings
+    config_file - parse_config_file on config files of 10 to 10,000 channels
+    round_trips - configure_daq_channels against a simulated DAQ
+    sweeps      - :READ? sweep latency and throughput with collect_sensor_line
+                  against a simulated DAQ
+    readings    - return_sensor_value and e_notation_to_dec on one sweep
+    log_write   - formatting sweeps and writing them to a log file, line by line
+                  and through the background LogWriter
+    rollups     - adding sweeps to the 10 s, 1 min and 1 h min/mean/max rollups
+    sweep_ring  - publishing sweeps to the shared memory ring and reading them back
+    sweep_feed  - publishing sweeps to the live feed with and without subscribers
+    binary_log  - reading a one hour window of a day long log: the whole CSV,
+                  the CSV through log_query's index and the binary log
+    binary_sync - appending to the binary log with a sync after every sweep,
+                  the chunks must still fill to CHUNK_ROWS
+    metrics     - :READ? sweeps with the DAQ I/O uninstrumented and instrumented
+                  by daq_metrics, and the cost of recording one latency
+
+    Benchmarks that measure times return them in seconds, lower is better.
+    --save writes them to a JSON file. --baseline compares them with a saved
+    file and exits with status 1 when any got slower by more than the
+    threshold (0.2 is 20 %, timings on a busy machine easily vary by 10 %).
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import re
+import socket
+import sys
+import tempfile
+import time
+import timeit
+import DAQ_commands as DAQ_cmd
+import binary_log
+import daq_metrics
+import log_query
+import log_rollups
+import log_writer
+import parse_config_file as pcf
+import parse_readings
+import sweep_feed
+import sweep_ring
+from daq_simulator import SimulatorProfile, SimulatorRack
+
+
+class CountingConnection:
+    """Stand-in for a telnet connection to the DAQ
+    Answers queries the way the DAQ does and counts the program messages
+    (newline terminated lines) and reads the host had to make.
+    """
+    def __init__(self, prompt="34980A> "):
+        self.prompt = prompt.encode()
+        self.pending = b""
+        self.output = b""
+        self.messages = 0
+        self.reads = 0
+
+    def write(self, data):
+        self.pending = self.pending + data
+        while b"\n" in self.pending:
+            line, self.pending = self.pending.split(b"\n", 1)
+            line = line.strip()
+            if line:
+                self.messages += 1
+                self.output = self.output + self.answer(line.decode())
+            self.output = self.output + self.prompt
+
+    def answer(self, line):
+        """Respond to every query in a ";" joined program message
+        """
+        response = b""
+        for cmd in line.split(";"):
+            cmd = cmd.strip().upper()
+            if cmd.startswith(":SYST") and "ERR" in cmd and cmd.endswith("?"):
+                response = response + b'+0,"No error"\r\n'
+            elif cmd == "*IDN?":
+                response = response + b"Agilent Technologies,34980A,MY00000000,2.51-2.43-2.07-1.05\r\n"
+            elif cmd.endswith("?"):
+                response = response + b"1\r\n"
+        return response
+
+    def read_until(self, match, timeout=None):
+        self.reads += 1
+        index = self.output.find(match)
+        if index < 0:
+            data, self.output = self.output, b""
+            return data
+        index = index + len(match)
+        data, self.output = self.output[:index], self.output[index:]
+        return data
+
+    def read_very_eager(self):
+        data, self.output = self.output, b""
+        return data
+
+    def expect(self, match_list, timeout=None):
+        self.reads += 1
+        for i, pattern in enumerate(match_list):
+            found = re.search(pattern, self.output)
+            if found:
+                data, self.output = self.output[:found.end()], self.output[found.end():]
+                return i, found, data
+        data, self.output = self.output, b""
+        return -1, None, data
+
+    def close(self):
+        pass
+
+
+class PaddingClock:
+    """Replaces the time module in DAQ_commands so fixed sleeps are added up instead of slept
+    """
+    def __init__(self):
+        self.slept = 0.0
+
+    def sleep(self, seconds):
+        self.slept += seconds
+
+    def __getattr__(self, name):
+        return getattr(time, name)
+
+
+def make_chan_list(num_channels):
+    """Build a processed channel list with a mix of sensor types
+    Channels are numbered like a 34980A, 4 digits and up to 40 per module
+    """
+    templates = [["TCouple", "T",  "1",   "4.5", "FALSE", "1",   "0", "C"],
+                 ["Volt",    "DC", "DEF", "DEF", "TRUE",  "1",   "0", "Vdc"],
+                 ["Freq",    "",   "10",  "4.5", "TRUE",  "15",  "0", "RPM"]]
+    chan_list = []
+    for i in range(num_channels):
+        module = i // 40
+        channel = (module + 1) * 1000 + i % 40 + 1
+        chan_list.append([channel, '"sensor %s"' % channel] + templates[module % len(templates)])
+    return chan_list
+
+
+def bench_config(channel_counts=(10, 60, 120, 300)):
+    """Count round trips per configured channel for one command per message,
+    batched messages and batched messages with grouped channels
+    """
+    print("%8s %-10s %10s %10s %12s %12s" % ("channels", "mode", "messages", "reads", "trips/chan", "padding s"))
+    for num_channels in channel_counts:
+        chan_list = make_chan_list(num_channels)
+        modes = (("single", 0, False),
+                 ("batched", DAQ_cmd.MAX_BATCH_BYTES, False),
+                 ("grouped", DAQ_cmd.MAX_BATCH_BYTES, True))
+        for mode, max_batch_bytes, group_channels in modes:
+            daq_conn = CountingConnection()
+            clock = PaddingClock()
+            real_time = DAQ_cmd.time
+            DAQ_cmd.time = clock
+            try:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    DAQ_cmd.configure_daq_channels(daq_conn, chan_list, max_batch_bytes, group_channels)
+            finally:
+                DAQ_cmd.time = real_time
+            print("%8d %-10s %10d %10d %12.2f %12.1f" %
+                  (num_channels, mode, daq_conn.messages, daq_conn.reads,
+                   daq_conn.messages / num_channels, clock.slept))
+
+
+def make_sweep_response(channels, reading_format):
+    """Build the :READ? response line the DAQ sends for one sweep in reading_format
+    """
+    readings = []
+    for i, channel in enumerate(channels):
+        value = "%+.8E" % (20.0 + (i % 50) * 0.137)
+        if reading_format == "full":
+            readings.append("%s,2026,10,18,12,00,01.%03d,%d" % (value, i % 1000, channel))
+        elif reading_format == "relative":
+            readings.append("%s,%013.3f" % (value, i * 0.001))
+        else:
+            readings.append(value)
+    return ",".join(readings)
+
+
+def bench_formats(num_channels=1000, repeat=5, number=20):
+    """Wire bytes and host parse time per sweep of 1000 channels for each reading format
+    framing - split the response and rebuild timestamps and channel numbers
+    total   - framing plus converting every value with e_notation_to_dec
+    """
+    channels = DAQ_cmd.expand_channel_list(DAQ_cmd.compress_channel_list(
+        [(i // 40 + 1) * 1000 + i % 40 + 1 for i in range(num_channels)]))
+    print("%-10s %12s %18s %16s" % ("format", "bytes/sweep", "framing ms/sweep", "total ms/sweep"))
+    for reading_format in DAQ_cmd.READING_FORMATS:
+        response = make_sweep_response(channels, reading_format)
+
+        def frame():
+            return DAQ_cmd.parse_sweeps(response.split(","), channels, reading_format, time.time())
+
+        def parse():
+            return [pcf.e_notation_to_dec(value) for value in frame()[0][2]]
+
+        framing = min(timeit.repeat(frame, repeat=repeat, number=number)) / number
+        total = min(timeit.repeat(parse, repeat=repeat, number=number)) / number
+        print("%-10s %12d %18.3f %16.3f" % (reading_format, len(response) + 2, framing * 1000, total * 1000))
+
+
+def bench_parse(reading_counts=(100, 1000, 10000), repeat=5, number=10):
+    """Time the bulk parser against parse_sweeps and e_notation_to_dec on full format responses
+    Every value and timestamp is checked against the one field at a time path before timing
+    """
+    if parse_readings.np is None:
+        print("numpy is not installed, the bulk parser needs it: pip install numpy")
+        return
+    channels = list(range(101, 121))
+    results = {}
+    print("%10s %14s %14s %10s" % ("readings", "per field ms", "bulk ms", "speedup"))
+    for num_readings in reading_counts:
+        num_sweeps = num_readings // len(channels)
+        response = ",".join([make_sweep_response(channels, "full")] * num_sweeps)
+
+        def per_field():
+            sweeps = DAQ_cmd.parse_sweeps(response.split(","), channels, "full")
+            return [[sweep[0], [pcf.e_notation_to_dec(value) for value in sweep[2]]] for sweep in sweeps]
+
+        def bulk():
+            return parse_readings.parse_buffer(response, channels, "full")
+
+        values, timestamps, channel_ids, leftover = bulk()
+        if [[row[0], list(values)] for row, values in zip(timestamps.tolist(), values.tolist())] != per_field():
+            print("Bulk parser differs from parse_sweeps and e_notation_to_dec at %d readings" % num_readings)
+            return
+        old = min(timeit.repeat(per_field, repeat=repeat, number=number)) / number
+        new = min(timeit.repeat(bulk, repeat=repeat, number=number)) / number
+        print("%10d %14.3f %14.3f %9.1fx" % (num_readings, old * 1000, new * 1000, old / new))
+        results["parse/per_field/%d" % num_readings] = old
+        results["parse/bulk/%d" % num_readings] = new
+    return results
+
+
+def best_time(function, repeat=5):
+    """Seconds per call of function, the best of repeat runs each long enough to time (timeit's autorange)
+    """
+    timer = timeit.Timer(function)
+    number, elapsed = timer.autorange()
+    return min([elapsed] + timer.repeat(repeat - 1, number)) / number
+
+
+def make_config_lines(num_channels, ip_addr="127.0.0.1", ip_port=5024):
+    """Config file lines for one DAQ with num_channels channels, as file_to_list returns them
+    """
+    lines = ["# Benchmark config", "Address: %s %d" % (ip_addr, ip_port)]
+    for sensor_line in make_chan_list(num_channels):
+        lines.append(", ".join(str(field) for field in sensor_line))
+    return lines
+
+
+def free_port():
+    """A TCP port nothing is listening on, for a simulated DAQ
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def simulated_daq(profile=None):
+    """Connection to a 34980A simulated in a background thread, with no simulated latency by default
+    so only the host side and the loopback socket are measured. Yields the connection and the SimulatedDAQ
+    """
+    if profile is None:
+        profile = SimulatorProfile(command_latency=0.0, channel_delay=0.0, time_scale=0.0)
+    address = ["127.0.0.1", free_port()]
+    rack = SimulatorRack([address], "34980A", profile, seed=1).start()
+    handshake = DAQ_cmd.handshake(address[0], address[1])
+    try:
+        yield handshake[0], rack.daqs[0]
+    finally:
+        handshake[0].close()
+        rack.stop()
+
+
+def bench_config_file(channel_counts=(10, 100, 1000, 10000)):
+    """Time parse_config_file and sensors_to_list on config files of 10 to 10,000 channels
+    """
+    results = {}
+    print("%10s %14s %16s" % ("channels", "parse ms", "us per channel"))
+    for num_channels in channel_counts:
+        lines = make_config_lines(num_channels)
+
+        def parse():
+            sensor_list, error_list = pcf.parse_config_file(lines)
+            return pcf.sensors_to_list(sensor_list)
+
+        seconds = best_time(parse)
+        print("%10d %14.3f %16.2f" % (num_channels, seconds * 1000, seconds / num_channels * 1e6))
+        results["config_file/%d" % num_channels] = seconds
+    return results
+
+
+def bench_round_trips(channel_counts=(10, 60, 120, 300)):
+    """Time configure_daq_channels against a simulated DAQ and count the program messages it sends
+    """
+    results = {}
+    print("%10s %12s %14s %16s" % ("channels", "messages", "configure ms", "ms per channel"))
+    with simulated_daq() as (daq_conn, daq):
+        for num_channels in channel_counts:
+            chan_list = make_chan_list(num_channels)
+
+            def configure():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    DAQ_cmd.configure_daq_channels(daq_conn, chan_list)
+
+            messages = daq.stats["messages"]
+            configure()
+            messages = daq.stats["messages"] - messages
+            seconds = best_time(configure)
+            print("%10d %12d %14.3f %16.3f" % (num_channels, messages, seconds * 1000,
+                                               seconds / num_channels * 1000))
+            results["round_trips/%d" % num_channels] = seconds
+    return results
+
+
+def bench_sweeps(channel_counts=(10, 100, 300), num_sweeps=200):
+    """Time :READ? sweeps with collect_sensor_line against a simulated DAQ
+    Latency is per sweep, throughput is readings per second over all sweeps.
+    Only the mean is kept in the results, the tail is too noisy to compare runs.
+    """
+    results = {}
+    print("%10s %12s %12s %12s %14s" % ("channels", "mean ms", "p95 ms", "max ms", "readings/s"))
+    with simulated_daq() as (daq_conn, daq):
+        for num_channels in channel_counts:
+            chan_list = make_chan_list(num_channels)
+            with contextlib.redirect_stdout(io.StringIO()):
+                chan_numbers = DAQ_cmd.configure_daq_channels(daq_conn, chan_list)
+                DAQ_cmd.configure_daq(daq_conn, chan_numbers)
+            latencies = []
+            readings = 0
+            for i in range(num_sweeps):
+                start = time.perf_counter()
+                sensor_line = DAQ_cmd.collect_sensor_line(daq_conn, "34980A> ")
+                latencies.append(time.perf_counter() - start)
+                readings += len(sensor_line) // DAQ_cmd.READING_FORMATS["full"]
+            latencies.sort()
+            mean = sum(latencies) / len(latencies)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print("%10d %12.3f %12.3f %12.3f %14.0f" % (num_channels, mean * 1000, p95 * 1000,
+                                                         latencies[-1] * 1000, readings / sum(latencies)))
+            results["sweeps/%d" % num_channels] = mean
+    return results
+
+
+def bench_readings(channel_counts=(100, 1000)):
+    """Time return_sensor_value and e_notation_to_dec on one full format sweep
+    """
+    results = {}
+    print("%10s %22s %20s" % ("channels", "return_sensor_value ms", "e_notation_to_dec ms"))
+    for num_channels in channel_counts:
+        chan_list = make_chan_list(num_channels)
+        channels = [sensor_line[0] for sensor_line in chan_list]
+        fields = make_sweep_response(channels, "full").split(",")
+        values = fields[0::DAQ_cmd.READING_FORMATS["full"]]
+
+        def sensor_values():
+            return DAQ_cmd.return_sensor_value(fields, chan_list)
+
+        def decimals():
+            return [pcf.e_notation_to_dec(value) for value in values]
+
+        sensor_seconds = best_time(sensor_values)
+        decimal_seconds = best_time(decimals)
+        print("%10d %22.3f %20.3f" % (num_channels, sensor_seconds * 1000, decimal_seconds * 1000))
+        results["readings/return_sensor_value/%d" % num_channels] = sensor_seconds
+        results["readings/e_notation_to_dec/%d" % num_channels] = decimal_seconds
+    return results
+
+
+def bench_log_write(num_channels=100, num_sweeps=1000):
+    """Time formatting num_sweeps sweeps with sweep_to_text and writing them to a log file
+    then the same sweeps through a LogWriter, put() on the caller's side and all of it up to close()
+    """
+    channels = [sensor_line[0] for sensor_line in make_chan_list(num_channels)]
+    response = ",".join([make_sweep_response(channels, "full")] * num_sweeps)
+    sweeps, leftover = parse_readings.parse_response(response, channels, "full")
+    log_dir = tempfile.mkdtemp()
+    log_file_name = os.path.join(log_dir, "benchmark_log.txt")
+
+    def write_log():
+        with open(log_file_name, 'w') as log_file:
+            for sweep in sweeps:
+                log_file.write(log_writer.sweep_to_text(sweep) + "\n")
+
+    put_times = []
+
+    def writer_log():
+        writer = log_writer.LogWriter(log_file_name, {}, "every-N", sync_sweeps=num_sweeps)
+        start = time.perf_counter()
+        for sweep in sweeps:
+            writer.put(sweep)
+        put_times.append(time.perf_counter() - start)
+        writer.close()
+
+    try:
+        seconds = best_time(write_log)
+        log_bytes = os.path.getsize(log_file_name)
+        writer_seconds = best_time(writer_log)
+    finally:
+        os.remove(log_file_name)
+        os.rmdir(log_dir)
+    put_seconds = min(put_times)
+    print("%d sweeps of %d channels: %.3f ms, %.1f us per sweep, %.1f MB/s" %
+          (num_sweeps, num_channels, seconds * 1000, seconds / num_sweeps * 1e6, log_bytes / seconds / 1e6))
+    print("LogWriter: %.3f ms to close, put() %.2f us per sweep" %
+          (writer_seconds * 1000, put_seconds / num_sweeps * 1e6))
+    return {"log_write/%dx%d" % (num_sweeps, num_channels): seconds,
+            "log_write/writer/%dx%d" % (num_sweeps, num_channels): writer_seconds}
+
+
+def bench_rollups(num_channels=100, num_sweeps=1000):
+    """Time adding sweeps to the 10 s, 1 min and 1 h rollups, one second apart so periods end as they would
+    """
+    channels = [sensor_line[0] for sensor_line in make_chan_list(num_channels)]
+    response = ",".join([make_sweep_response(channels, "full")] * num_sweeps)
+    sweeps, leftover = parse_readings.parse_response(response, channels, "full")
+    start_time = time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1))
+    sweeps = [[start_time + i, sweep[1], sweep[2]] for i, sweep in enumerate(sweeps)]
+    log_dir = tempfile.mkdtemp()
+    log_file_name = os.path.join(log_dir, "benchmark_log.csv")
+    resolutions = (10, 60, 3600)
+
+    def add_sweeps():
+        rollups = log_rollups.RollupSet(log_file_name, resolutions, {})
+        for sweep in sweeps:
+            rollups.add(None, sweep)
+        rollups.close()
+
+    try:
+        seconds = best_time(add_sweeps)
+    finally:
+        for name in os.listdir(log_dir):
+            os.remove(os.path.join(log_dir, name))
+        os.rmdir(log_dir)
+    print("%d sweeps of %d channels at %d resolutions: %.1f us per sweep" %
+          (num_sweeps, num_channels, len(resolutions), seconds / num_sweeps * 1e6))
+    return {"rollups/%dx%d" % (num_sweeps, num_channels): seconds}
+
+
+def bench_sweep_ring(num_channels=100, num_sweeps=1000):
+    """Time publishing sweeps to a sweep ring and reading the latest 1000 of them back
+    latest() hands out views on the shared memory, read_latest() copies 5 columns and checks them.
+    """
+    channels = [sensor_line[0] for sensor_line in make_chan_list(num_channels)]
+    response = ",".join([make_sweep_response(channels, "full")] * num_sweeps)
+    sweeps, leftover = parse_readings.parse_response(response, channels, "full")
+    name = "benchmark_%d" % os.getpid()
+    publisher = sweep_ring.SweepPublisher(name, {}, slots=num_sweeps + 1)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            publisher.publish(sweeps[0])
+
+        def publish():
+            for sweep in sweeps:
+                publisher.publish(sweep)
+
+        publish_seconds = best_time(publish) / num_sweeps
+        with sweep_ring.SweepRing(name) as ring:
+            view_seconds = best_time(lambda: ring.latest(num_sweeps))
+            read_seconds = best_time(lambda: ring.read_latest(num_sweeps, channels[:5]))
+    finally:
+        publisher.close()
+        os.remove(sweep_ring.ring_file_name(name))
+    print("publish: %.1f us per sweep of %d channels" % (publish_seconds * 1e6, num_channels))
+    print("latest %d sweeps: views %.1f us, copies of 5 channels %.1f us" %
+          (num_sweeps, view_seconds * 1e6, read_seconds * 1e6))
+    return {"sweep_ring/publish/%d" % num_channels: publish_seconds,
+            "sweep_ring/latest/%d" % num_sweeps: view_seconds,
+            "sweep_ring/read_latest/%d" % num_sweeps: read_seconds}
+
+
+def bench_sweep_feed(num_channels=100, num_sweeps=1000, num_subscribers=3):
+    """Time publish() to the sweep feed with no subscribers and with subscribers that never read
+    Their queues fill and drop their oldest frames, publish() must not slow down.
+    """
+    channels = [sensor_line[0] for sensor_line in make_chan_list(num_channels)]
+    response = ",".join([make_sweep_response(channels, "full")] * num_sweeps)
+    sweeps, leftover = parse_readings.parse_response(response, channels, "full")
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    address = "udp:127.0.0.1:%d" % sock.getsockname()[1]
+    sock.close()
+    with contextlib.redirect_stdout(io.StringIO()):
+        feed = sweep_feed.start_feed(address, {}, buffer_frames=100)
+    subscribers = []
+    try:
+        def publish():
+            for sweep in sweeps:
+                feed.publish(sweep)
+
+        alone = best_time(publish) / num_sweeps
+        subscribers = [sweep_feed.SweepSubscriber(address) for i in range(num_subscribers)]
+        while len(feed.subscribers) < num_subscribers:
+            time.sleep(0.01)
+        subscribed = best_time(publish) / num_sweeps
+        dropped = sum(stat["dropped"] for stat in feed.stats())
+    finally:
+        for subscriber in subscribers:
+            subscriber.close()
+        feed.close()
+    print("publish: %.1f us per sweep of %d channels alone, %.1f us with %d subscribers not reading (%d dropped)" %
+          (alone * 1e6, num_channels, subscribed * 1e6, num_subscribers, dropped))
+    return {"sweep_feed/publish/%d" % num_channels: alone,
+            "sweep_feed/publish_subscribed/%d" % num_channels: subscribed}
+
+
+def bench_binary_log(num_channels=20, num_sweeps=86400):
+    """Time reading a one hour window of 5 channels from a day of one second sweeps
+    The CSV log has to be read whole, the binary log only where its chunk index points.
+    log_query.py reads the CSV log from its offset index, the first query builds the index.
+    """
+    chan_list = make_chan_list(num_channels)
+    channels = [sensor_line[0] for sensor_line in chan_list]
+    columns = [{"channel": channel, "name": "", "units": "", "function": ""} for channel in channels]
+    start_time = time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1))
+    values = [float(channel) for channel in channels]
+    log_dir = tempfile.mkdtemp()
+    csv_file_name = os.path.join(log_dir, "benchmark_log.csv")
+    binary_file_name = os.path.join(log_dir, "benchmark_log.dlog")
+    try:
+        with open(csv_file_name, 'w') as csv_file, binary_log.BinaryLogWriter(binary_file_name, columns) as log:
+            csv_file.write("Date Time, %s, \n" % ", ".join(str(channel) for channel in channels))
+            for i in range(num_sweeps):
+                csv_file.write(log_writer.sweep_to_text([start_time + i, channels, values]) + "\n")
+                log.append(start_time + i, values)
+        window = (start_time + 43200, start_time + 43200 + 3599)
+
+        def read_csv():
+            titles, sweeps = binary_log.read_csv_log(csv_file_name)
+            return [sweep for sweep in sweeps if window[0] <= sweep[0] <= window[1]]
+
+        def read_binary():
+            with binary_log.BinaryLogReader(binary_file_name) as log:
+                return log.read_window(window[0], window[1], channels[:5])
+
+        def query_csv():
+            titles, rows = log_query.query_log(csv_file_name, window[0], window[1], channels[:5])
+            return list(rows)
+
+        csv_seconds = best_time(read_csv, repeat=3)
+        start = time.perf_counter()
+        query_csv()
+        index_seconds = time.perf_counter() - start
+        query_seconds = best_time(query_csv)
+        binary_seconds = best_time(read_binary)
+        sizes = (os.path.getsize(csv_file_name), os.path.getsize(binary_file_name))
+    finally:
+        for file_name in (csv_file_name, binary_file_name, log_query.index_name(csv_file_name)):
+            if os.path.exists(file_name):
+                os.remove(file_name)
+        os.rmdir(log_dir)
+    print("%d sweeps of %d channels, CSV %.1f MB, binary %.1f MB" %
+          (num_sweeps, num_channels, sizes[0] / 1e6, sizes[1] / 1e6))
+    print("one hour of 5 channels: CSV %.1f ms, binary %.3f ms, %.0fx" %
+          (csv_seconds * 1000, binary_seconds * 1000, csv_seconds / binary_seconds))
+    print("indexed CSV: %.1f ms, %.1f ms building the index first" % (query_seconds * 1000, index_seconds * 1000))
+    return {"binary_log/csv_window": csv_seconds,
+            "binary_log/csv_query_window": query_seconds,
+            "binary_log/binary_window": binary_seconds}
+
+
+def bench_binary_sync(num_channels=20, num_sweeps=3 * binary_log.CHUNK_ROWS):
+    """Time appending sweeps to a binary log flushed after every one, as "every-T" does with slow sweeps
+    The flushes rewrite the tail, the chunks stay CHUNK_ROWS long and a row costs its bytes, not a chunk.
+    """
+    channels = [sensor_line[0] for sensor_line in make_chan_list(num_channels)]
+    columns = [{"channel": channel, "name": "", "units": "", "function": ""} for channel in channels]
+    start_time = time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1))
+    values = [float(channel) for channel in channels]
+    log_dir = tempfile.mkdtemp()
+    binary_file_name = os.path.join(log_dir, "benchmark_log.dlog")
+    try:
+        start = time.perf_counter()
+        with binary_log.BinaryLogWriter(binary_file_name, columns) as log:
+            for i in range(num_sweeps):
+                log.append(start_time + i, values)
+                log.flush()
+        seconds = (time.perf_counter() - start) / num_sweeps
+        with binary_log.BinaryLogReader(binary_file_name) as log:
+            chunk_rows = [chunk.rows for chunk in log.chunks]
+            row_bytes = os.path.getsize(binary_file_name) / log.rows
+    finally:
+        os.remove(binary_file_name)
+        os.rmdir(log_dir)
+    print("%d sweeps of %d channels flushed one by one: %.1f us per sweep, %d chunks of %.0f rows, %.0f bytes per row" %
+          (num_sweeps, num_channels, seconds * 1e6, len(chunk_rows), num_sweeps / len(chunk_rows), row_bytes))
+    if len(chunk_rows) > math.ceil(num_sweeps / binary_log.CHUNK_ROWS):
+        print("CHECK FAILED: flushes cut the chunks short, expected %d rows each" % binary_log.CHUNK_ROWS)
+    return {"binary_sync/append_flush/%d" % num_channels: seconds}
+
+
+def bench_metrics(num_channels=100, num_sweeps=500):
+    """Time :READ? sweeps against a simulated DAQ with metrics off and on, best of 5 runs each
+    Off must cost nothing, the I/O functions are the originals until instrument_module() wraps them.
+    """
+    chan_list = make_chan_list(num_channels)
+    metrics = daq_metrics.Metrics()
+    with simulated_daq() as (daq_conn, daq):
+        with contextlib.redirect_stdout(io.StringIO()):
+            chan_numbers = DAQ_cmd.configure_daq_channels(daq_conn, chan_list)
+            DAQ_cmd.configure_daq(daq_conn, chan_numbers)
+
+        def sweeps():
+            start = time.perf_counter()
+            for i in range(num_sweeps):
+                DAQ_cmd.collect_sensor_response(daq_conn)
+            return (time.perf_counter() - start) / num_sweeps
+
+        # Off and on take turns so both see the same machine
+        original = {name: getattr(DAQ_cmd, name) for name in daq_metrics.IO_FUNCTIONS}
+        off = []
+        on = []
+        for i in range(5):
+            off.append(sweeps())
+            metrics.instrument_module(DAQ_cmd)
+            try:
+                on.append(sweeps())
+            finally:
+                for name, function in original.items():
+                    setattr(DAQ_cmd, name, function)
+        off = min(off)
+        on = min(on)
+    histogram = daq_metrics.LatencyHistogram()
+    record = best_time(lambda: histogram.record(0.0123))
+    print("%d channels, %d sweeps: off %.3f ms, on %.3f ms per sweep (%+.1f%%), one latency recorded in %.2f us" %
+          (num_channels, num_sweeps, off * 1000, on * 1000, (on / off - 1.0) * 100, record * 1e6))
+    return {"metrics/off/%d" % num_channels: off,
+            "metrics/on/%d" % num_channels: on}
+
+
+def save_results(file_name, results):
+    """Write benchmark results to a JSON file with what they were run on
+    """
+    with open(file_name, 'w') as results_file:
+        json.dump({"created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "python": platform.python_version(),
+                   "machine": platform.machine(),
+                   "numpy": parse_readings.np is not None,
+                   "results": results}, results_file, indent=1, sort_keys=True)
+
+
+def compare_results(results, baseline, threshold=0.2):
+    """Compare results with a saved baseline, both {name: seconds}
+    Prints every benchmark found in both and returns the names that got
+    slower by more than threshold.
+    """
+    regressions = []
+    print("%-40s %12s %12s %9s" % ("benchmark", "baseline ms", "now ms", "change"))
+    for name in results:
+        if name not in baseline or not baseline[name]:
+            continue
+        change = results[name] / baseline[name] - 1.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print("%-40s %12.3f %12.3f %+8.1f%%%s" % (name, baseline[name] * 1000, results[name] * 1000,
+                                                  change * 100, flag))
+    return regressions
+
+
+def main():
+    benchmarks = {"config": bench_config,
+                  "formats": bench_formats,
+                  "parse": bench_parse,
+                  "config_file": bench_config_file,
+                  "round_trips": bench_round_trips,
+                  "sweeps": bench_sweeps,
+                  "readings": bench_readings,
+                  "log_write": bench_log_write,
+                  "rollups": bench_rollups,
+                  "sweep_ring": bench_sweep_ring,
+                  "sweep_feed": bench_sweep_feed,
+                  "binary_log": bench_binary_log,
+                  "binary_sync": bench_binary_sync,
+                  "metrics": bench_metrics}
+    parser = argparse.ArgumentParser(description="Benchmarks for the DAQ logger that run without lab hardware")
+    parser.add_argument("names", nargs="*", metavar="benchmark",
+                        help="benchmarks to run, all of them by default: %s" % ", ".join(benchmarks))
+    parser.add_argument("--save", metavar="FILE", help="save the results as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with results saved earlier")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="slow down that counts as a regression, 0.2 is 20%%")
+    options = parser.parse_args()
+
+    names = options.names or list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            print("Unknown benchmark '%s'. Choose from: %s" % (name, ", ".join(benchmarks)))
+            sys.exit(1)
+    results = {}
+    for name in names:
+        print("### %s ###" % name)
+        results.update(benchmarks[name]() or {})
+
+    if options.save:
+        save_results(options.save, results)
+        print("Saved %d results to %s" % (len(results), options.save))
+    if options.baseline:
+        try:
+            with open(options.baseline, 'r') as baseline_file:
+                baseline = json.load(baseline_file)["results"]
+        except (OSError, ValueError, KeyError):
+            print("Could not read the baseline %s" % options.baseline)
+            sys.exit(1)
+        print("### compared with %s ###" % options.baseline)
+        regressions = compare_results(results, baseline, options.threshold)
+        if regressions:
+            print("%d benchmarks slower than the baseline by more than %.0f%%: %s" %
+                  (len(regressions), options.threshold * 100, ", ".join(regressions)))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
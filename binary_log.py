@@ -0,0 +1,676 @@
+#!/usr/bin/env python3
+"""
+Description:
+    A binary test log that stays quick to slice on multi-week tests. Each
+    channel is a column of fixed width floats (float32 or float64) next to a
+    column of int64 timestamps, microseconds since the epoch. Sweeps are
+    appended in chunks, each chunk ends with an index of its time range and
+    the min and max of every column.
+
+    The reader memory-maps the file and walks the chunk headers only, so
+    loading a time window or a few columns touches just those bytes. Chunks
+    whose index is outside the window are never read, inside a chunk the
+    window is found by binary search on the timestamps. The columns are handed
+    out as numpy arrays on the mapped file when numpy is installed and as
+    array.array otherwise.
+
+    File layout, native byte order, every part a multiple of 8 bytes:
+        "DAQLOG\\0\\1", header length (uint32), 4 spare bytes, JSON schema
+        per chunk: "CHNK", rows (uint32)
+                   timestamps (int64 x rows)
+                   one column per channel (float x rows), padded to 8 bytes
+                   t_min, t_max (int64), min and max of every column (float64)
+                   rows (uint32), "CEND"
+    A chunk cut short by a crash is ignored by the reader and dropped when
+    the file is opened to append.
+
+    Only full chunks of chunk_rows are sealed. flush() writes the sweeps of
+    the chunk still filling as a whole chunk at the end of the file, the tail,
+    so they are on disk and readable. The next flush writes the tail again
+    over the same place with the sweeps added since, until the chunk is full
+    and sealed. How often the log is synced does not change the chunk size.
+
+    open_log() reads a log rotated by log_rotation.py as one log. Segments
+    outside a time window are skipped by the spans in the manifest, a
+    compressed segment is decompressed into memory instead of mapped.
+
+    The schema lists the columns as {"channel", "name", "units", "function"}
+    taken from the parsed config.
+
+Usage:
+    log = BinaryLogWriter("logs/test.dlog", schema_from_sensors(sensors))
+    log.append(sweep[0], sweep[2])
+    log.close()
+
+    with open_log("logs/test.dlog") as log:
+        timestamps, columns = log.read_window(start, end, ["101", "Fan Voltage"])
+
+    ./binary_log.py to-binary logs/mytest2.csv logs/mytest2.dlog --config config/myconfigfile.txt
+    ./binary_log.py to-csv logs/mytest2.dlog logs/mytest2_copy.csv
+    ./binary_log.py info logs/mytest2.dlog
+"""
+
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+import time
+from array import array
+from collections import namedtuple
+import log_rotation
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+FILE_MAGIC = b"DAQLOG\x00\x01"
+FILE_HEADER = struct.Struct("<8sI4x")
+CHUNK_HEADER = struct.Struct("<4sI")
+CHUNK_MAGIC = b"CHNK"
+CHUNK_END = struct.Struct("<I4s")
+CHUNK_END_MAGIC = b"CEND"
+# Column types and their array typecode
+DTYPES = {"float32": "f", "float64": "d"}
+# numpy dtype of each array typecode
+NUMPY_TYPES = {"q": "i8", "f": "f4", "d": "f8"}
+# Sweeps per chunk, a chunk is sealed once it is full, flush() writes the rows before that as the tail
+CHUNK_ROWS = 1024
+# Datestamps of the CSV log, see log_writer.sweep_to_text
+CSV_DATESTAMP = "%m/%d/%Y %H:%M:%S"
+# "101 Front Ambient (C)" or "Lateness (s)" in a CSV log header
+CSV_COLUMN_RE = re.compile(r"^(?:(\d+) )?(.*?)(?: \(([^()]*)\))?$")
+
+# Where a chunk is in the file and what its index says
+ChunkIndex = namedtuple("ChunkIndex", ["offset", "rows", "t_min", "t_max", "mins", "maxs"])
+
+
+def pad8(size):
+    return (size + 7) & ~7
+
+
+def to_micros(seconds):
+    """Seconds since the epoch as int64 microseconds
+    """
+    return int(round(float(seconds) * 1000000))
+
+
+def to_float(value):
+    """A reading as a float, NaN when it is not a number
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def schema_from_sensors(sensors, channels=None, extra_columns=()):
+    """Columns for the channels of a Sensor list
+    channels is the scan order, all configured channels in channel number order
+    (the order the DAQ scans them) when not given. extra_columns are names of
+    columns that are not channels, such as the sweep lateness.
+    """
+    by_channel = {}
+    for sensor in sensors:
+        if sensor.channel.isdigit():
+            by_channel[int(sensor.channel)] = sensor
+    if channels is None:
+        channels = sorted(by_channel)
+    columns = []
+    for channel in channels:
+        sensor = by_channel.get(int(channel))
+        if sensor is None:
+            columns.append({"channel": int(channel), "name": "", "units": "", "function": ""})
+        else:
+            columns.append({"channel": int(channel), "name": sensor.name.strip('"'), "units": sensor.sen_units,
+                            "function": sensor.sen_func})
+    for column in extra_columns:
+        name, units = CSV_COLUMN_RE.match(column).group(2, 3)
+        columns.append({"channel": None, "name": name, "units": units or "", "function": ""})
+    return columns
+
+
+def daq_log_name(log_file_name, daq):
+    """File of one DAQ's binary log, logs/test.dlog -> logs/test_10.0.0.5_5024.dlog, log_file_name itself for None
+    """
+    if daq is None:
+        return str(log_file_name)
+    stem, suffix = os.path.splitext(str(log_file_name))
+    return "%s_%s%s" % (stem, daq.replace(" ", "_"), suffix)
+
+
+def column_numbers(columns, wanted_columns, source):
+    """Positions in a schema of the columns asked for by channel number or name, all of them for None
+    Raises KeyError naming source for a column it does not have.
+    """
+    if wanted_columns is None:
+        return list(range(len(columns)))
+    numbers = []
+    for wanted in wanted_columns:
+        for number, column in enumerate(columns):
+            if str(column["channel"]) == str(wanted) or column["name"] == wanted:
+                numbers.append(number)
+                break
+        else:
+            raise KeyError("No column %s in %s" % (wanted, source))
+    return numbers
+
+
+def column_title(column):
+    """Header text of a column as the CSV log has it, "101 Front Ambient (C)"
+    """
+    title = column["name"]
+    if column["channel"] is not None:
+        title = ("%d %s" % (column["channel"], title)).strip()
+    if column["units"]:
+        title = "%s (%s)" % (title, column["units"])
+    return title
+
+
+class BinaryLogWriter:
+    """Append sweeps to a binary log in chunks of chunk_rows
+    With append=True an existing log with the same columns is continued.
+    """
+    def __init__(self, log_file_name, columns, dtype="float64", chunk_rows=CHUNK_ROWS, append=False):
+        if dtype not in DTYPES:
+            raise ValueError("Column type must be one of: %s" % ", ".join(DTYPES))
+        self.log_file_name = log_file_name
+        self.columns = list(columns)
+        self.dtype = dtype
+        self.typecode = DTYPES[dtype]
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.chunks = 0
+        self.rows = 0
+        self.closed = False
+        # Rows of the open chunk already in the tail
+        self.tail_rows = 0
+        self.clear()
+        if append and os.path.isfile(log_file_name) and os.path.getsize(log_file_name):
+            with BinaryLogReader(log_file_name) as existing:
+                if existing.columns != self.columns or existing.dtype != dtype:
+                    raise ValueError("%s holds different columns, cannot append" % log_file_name)
+                end = existing.end
+                self.chunks = len(existing.chunks)
+                self.rows = existing.rows
+            self.log_file = open(log_file_name, 'r+b')
+            # Anything after the last whole chunk is a chunk cut short, a tail left by the last run stays a short chunk
+            self.log_file.truncate(end)
+            self.log_file.seek(end)
+            self.sealed = end
+        else:
+            self.log_file = open(log_file_name, 'wb')
+            schema = json.dumps({"version": 1, "dtype": dtype, "byteorder": sys.byteorder,
+                                 "created": time.strftime("%Y-%m-%d %H:%M:%S"), "columns": self.columns})
+            schema = schema.encode()
+            schema = schema + b" " * (pad8(len(schema)) - len(schema))
+            self.log_file.write(FILE_HEADER.pack(FILE_MAGIC, len(schema)) + schema)
+            self.sealed = self.log_file.tell()
+
+    def clear(self):
+        self.timestamps = array("q")
+        self.values = [array(self.typecode) for column in self.columns]
+        # Kept as sweeps come so a flush does not go over the open chunk again, low > high while a column has no numbers
+        self.lows = [math.inf] * len(self.columns)
+        self.highs = [-math.inf] * len(self.columns)
+        self.tail_rows = 0
+
+    def append(self, timestamp, values):
+        """Add one sweep, timestamp in seconds since the epoch and one value per column
+        """
+        if len(values) != len(self.columns):
+            raise ValueError("%d values for %d columns" % (len(values), len(self.columns)))
+        self.timestamps.append(to_micros(timestamp))
+        lows = self.lows
+        highs = self.highs
+        for number, (column, value) in enumerate(zip(self.values, values)):
+            column.append(to_float(value))
+            # The value as stored, float32 rounds it
+            value = column[-1]
+            if value < lows[number]:
+                lows[number] = value
+            if value > highs[number]:
+                highs[number] = value
+        if len(self.timestamps) >= self.chunk_rows:
+            self.write_chunk()
+
+    def write_chunk(self, seal=True):
+        """Write the sweeps appended so far as one chunk with its index over the tail
+        With seal=False it is the new tail, the next chunk written goes in its place.
+        """
+        rows = len(self.timestamps)
+        if not rows or (not seal and rows == self.tail_rows):
+            return
+        parts = [CHUNK_HEADER.pack(CHUNK_MAGIC, rows), self.timestamps.tobytes()]
+        column_bytes = 0
+        for column in self.values:
+            parts.append(column.tobytes())
+            column_bytes += len(parts[-1])
+        mins = [low if low <= high else math.nan for low, high in zip(self.lows, self.highs)]
+        maxs = [high if low <= high else math.nan for low, high in zip(self.lows, self.highs)]
+        parts.append(b"\x00" * (pad8(column_bytes) - column_bytes))
+        parts.append(struct.pack("<qq%dd" % (2 * len(self.columns)), min(self.timestamps), max(self.timestamps),
+                                 *(mins + maxs)))
+        parts.append(CHUNK_END.pack(rows, CHUNK_END_MAGIC))
+        self.log_file.seek(self.sealed)
+        self.log_file.write(b"".join(parts))
+        # The tail only ever grows, this drops nothing but a stale end
+        self.log_file.truncate()
+        if not seal:
+            self.tail_rows = rows
+            return
+        self.sealed = self.log_file.tell()
+        self.chunks += 1
+        self.rows += rows
+        self.clear()
+
+    def flush(self):
+        """Write what is waiting as the tail and flush the file, the chunk stays open for more rows
+        """
+        self.write_chunk(seal=False)
+        self.log_file.flush()
+
+    def fileno(self):
+        return self.log_file.fileno()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.write_chunk()
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BinaryLogReader:
+    """Memory-mapped binary log
+    chunks is the index of every whole chunk, columns the schema, rows the sweeps in the log.
+    A compressed segment of a rotated log is read into memory instead.
+    """
+    def __init__(self, log_file_name):
+        self.log_file_name = log_file_name
+        if log_rotation.compression_of(log_file_name):
+            self.log_file = None
+            with log_rotation.open_segment(log_file_name, 'rb') as segment:
+                self.map = segment.read()
+        else:
+            self.log_file = open(log_file_name, 'rb')
+            try:
+                self.map = mmap.mmap(self.log_file.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                self.log_file.close()
+                raise ValueError("%s is empty" % log_file_name)
+        if len(self.map) < FILE_HEADER.size:
+            self.close()
+            raise ValueError("%s is empty" % log_file_name)
+        magic, schema_size = FILE_HEADER.unpack_from(self.map, 0)
+        if magic != FILE_MAGIC:
+            self.close()
+            raise ValueError("%s is not a binary DAQ log" % log_file_name)
+        schema = json.loads(bytes(self.map[FILE_HEADER.size:FILE_HEADER.size + schema_size]))
+        if schema["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError("%s was written with %s endian numbers" % (log_file_name, schema["byteorder"]))
+        self.schema = schema
+        self.columns = schema["columns"]
+        self.dtype = schema["dtype"]
+        self.typecode = DTYPES[self.dtype]
+        self.itemsize = array(self.typecode).itemsize
+        self.chunks = []
+        self.rows = 0
+        self.end = FILE_HEADER.size + schema_size
+        self.read_index()
+
+    def read_index(self):
+        """Walk the chunk headers and read the index of every whole chunk
+        """
+        num_columns = len(self.columns)
+        footer = struct.Struct("<qq%dd" % (2 * num_columns))
+        offset = self.end
+        size = len(self.map)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, rows = CHUNK_HEADER.unpack_from(self.map, offset)
+            footer_offset = offset + CHUNK_HEADER.size + 8 * rows + pad8(self.itemsize * rows * num_columns)
+            chunk_end = footer_offset + footer.size + CHUNK_END.size
+            if magic != CHUNK_MAGIC or chunk_end > size:
+                break
+            if CHUNK_END.unpack_from(self.map, footer_offset + footer.size) != (rows, CHUNK_END_MAGIC):
+                break
+            index = footer.unpack_from(self.map, footer_offset)
+            self.chunks.append(ChunkIndex(offset, rows, index[0], index[1], index[2:2 + num_columns],
+                                          index[2 + num_columns:]))
+            self.rows += rows
+            offset = chunk_end
+        self.end = offset
+
+    def column_numbers(self, columns=None):
+        """Positions of the columns asked for by channel number or name, all of them for None
+        """
+        return column_numbers(self.columns, columns, self.log_file_name)
+
+    def view(self, offset, count, typecode):
+        """count items at offset in the mapped file without copying them
+        """
+        if np is not None:
+            return np.frombuffer(self.map, dtype=NUMPY_TYPES[typecode], count=count, offset=offset)
+        size = array(typecode).itemsize
+        return memoryview(self.map)[offset:offset + count * size].cast(typecode)
+
+    def chunk_timestamps(self, chunk):
+        return self.view(chunk.offset + CHUNK_HEADER.size, chunk.rows, "q")
+
+    def chunk_column(self, chunk, number):
+        offset = chunk.offset + CHUNK_HEADER.size + 8 * chunk.rows + number * self.itemsize * chunk.rows
+        return self.view(offset, chunk.rows, self.typecode)
+
+    def read_window(self, start=None, end=None, columns=None):
+        """Sweeps from start up to and including end, seconds since the epoch, None for no limit
+        columns picks columns by channel number or name, all of them for None.
+        Returns the timestamps in int64 microseconds and {column title: values}
+        """
+        numbers = self.column_numbers(columns)
+        first = -2 ** 63 if start is None else to_micros(start)
+        last = 2 ** 63 - 1 if end is None else to_micros(end)
+        timestamp_parts = []
+        column_parts = [[] for number in numbers]
+        for chunk in self.chunks:
+            if chunk.t_max < first or chunk.t_min > last:
+                continue
+            timestamps = self.chunk_timestamps(chunk)
+            if np is not None:
+                low = int(np.searchsorted(timestamps, first, "left"))
+                high = int(np.searchsorted(timestamps, last, "right"))
+            else:
+                low = bisect.bisect_left(timestamps, first)
+                high = bisect.bisect_right(timestamps, last)
+            if low >= high:
+                continue
+            timestamp_parts.append(timestamps[low:high])
+            for parts, number in zip(column_parts, numbers):
+                parts.append(self.chunk_column(chunk, number)[low:high])
+        titles = [column_title(self.columns[number]) for number in numbers]
+        return (self.join(timestamp_parts, "q"),
+                {title: self.join(parts, self.typecode) for title, parts in zip(titles, column_parts)})
+
+    def join(self, parts, typecode):
+        """One array from the slices of several chunks, only the window is copied
+        """
+        if np is not None:
+            if not parts:
+                return np.empty(0, dtype=NUMPY_TYPES[typecode])
+            return np.concatenate(parts)
+        joined = array(typecode)
+        for part in parts:
+            joined.frombytes(part.cast("B"))
+        return joined
+
+    def sweeps(self):
+        """Every sweep in order as (timestamp in seconds, [values])
+        """
+        for chunk in self.chunks:
+            timestamps = self.chunk_timestamps(chunk)
+            columns = [self.chunk_column(chunk, number) for number in range(len(self.columns))]
+            for row in range(chunk.rows):
+                yield int(timestamps[row]) / 1000000.0, [float(column[row]) for column in columns]
+
+    def close(self):
+        if self.log_file is None:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            # Arrays handed out still point into the map, it closes when they are gone
+            pass
+        self.log_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class BinaryLogSet:
+    """The segments of a rotated binary log read as one log, see BinaryLogReader
+    Segments are opened the first time they are needed.
+    """
+    def __init__(self, log_file_name, daq=None):
+        self.log_file_name = log_file_name
+        self.entries = log_rotation.segment_entries(log_file_name, daq)
+        if not self.entries:
+            raise ValueError("%s has no segments%s" % (log_file_name, " for %s" % daq if daq else ""))
+        self.readers = {}
+        first = self.reader(0)
+        self.schema = first.schema
+        self.columns = first.columns
+        self.dtype = first.dtype
+        self.typecode = first.typecode
+
+    def reader(self, number):
+        if number not in self.readers:
+            self.readers[number] = BinaryLogReader(self.entries[number]["file"])
+        return self.readers[number]
+
+    def all_readers(self):
+        return [self.reader(number) for number in range(len(self.entries))]
+
+    @property
+    def rows(self):
+        return sum(reader.rows for reader in self.all_readers())
+
+    @property
+    def chunks(self):
+        return [chunk for reader in self.all_readers() for chunk in reader.chunks]
+
+    def read_window(self, start=None, end=None, columns=None):
+        """Sweeps from start up to and including end from the segments that span part of it, see BinaryLogReader
+        """
+        timestamp_parts = []
+        column_parts = {}
+        for number, entry in enumerate(self.entries):
+            # A segment still being written has no span yet
+            if entry["last"] is not None and start is not None and entry["last"] < start:
+                continue
+            if entry["first"] is not None and end is not None and entry["first"] > end:
+                continue
+            timestamps, values = self.reader(number).read_window(start, end, columns)
+            timestamp_parts.append(timestamps)
+            for title, column in values.items():
+                column_parts.setdefault(title, []).append(column)
+        if not timestamp_parts:
+            return self.reader(0).read_window(1, 0, columns)
+        first = self.reader(0)
+        return (first.join(timestamp_parts, "q"),
+                {title: first.join(parts, self.typecode) for title, parts in column_parts.items()})
+
+    def sweeps(self):
+        for number in range(len(self.entries)):
+            yield from self.reader(number).sweeps()
+
+    def close(self):
+        for reader in self.readers.values():
+            reader.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_log(log_file_name, daq=None):
+    """Open a binary log, rotated or not, daq picks one DAQ's log from a run of several
+    """
+    if log_rotation.load_manifest(log_file_name) is not None:
+        return BinaryLogSet(log_file_name, daq)
+    return BinaryLogReader(daq_log_name(log_file_name, daq))
+
+
+def read_csv_log(csv_file_name, daq=None):
+    """Read a CSV log written by log_writer.py or an older one without a header
+    A rotated log is read segment by segment as one log.
+    daq picks the lines of one DAQ from a log of several, they start with "<ip> <port>, ".
+    Returns the column titles of the header, [] without one, and a list of (timestamp, [values])
+    """
+    titles = []
+    sweeps = []
+    for segment in log_rotation.segment_files(csv_file_name):
+        with log_rotation.open_segment(segment, 'rt') as csv_file:
+            read_csv_lines(csv_file, daq, titles, sweeps)
+    return titles, sweeps
+
+
+def read_csv_lines(csv_file, daq, titles, sweeps):
+    """Add the sweeps of one CSV file to sweeps, the header to titles
+    Every segment of a rotated log repeats the header.
+    """
+    for line in csv_file:
+        fields = [field.strip() for field in line.rstrip("\n").split(",")]
+        if fields and not fields[-1]:
+            fields.pop()
+        if not fields:
+            continue
+        if daq is not None:
+            if fields[0] != daq:
+                continue
+            fields = fields[1:]
+        if fields[0] == "Date Time":
+            titles[:] = fields[1:]
+            continue
+        try:
+            timestamp = time.mktime(time.strptime(fields[0], CSV_DATESTAMP))
+        except ValueError:
+            continue
+        sweeps.append((timestamp, fields[1:]))
+
+
+def csv_to_binary(csv_file_name, log_file_name, sensors=None, dtype="float64", daq=None):
+    """Convert a CSV log to a binary log
+    The columns come from the CSV header, names and units from sensors (a Sensor list)
+    when given. A CSV without a header needs sensors, its columns are the
+    configured channels in scan order. Returns the number of sweeps converted.
+    """
+    titles, sweeps = read_csv_log(csv_file_name, daq)
+    if titles:
+        channels = []
+        extra_columns = []
+        for title in titles:
+            channel = CSV_COLUMN_RE.match(title).group(1)
+            if channel is None:
+                extra_columns.append(title)
+            else:
+                channels.append(int(channel))
+        if sensors is None:
+            columns = []
+            for title in titles:
+                channel, name, units = CSV_COLUMN_RE.match(title).groups()
+                columns.append({"channel": int(channel) if channel else None, "name": name, "units": units or "",
+                                "function": ""})
+        else:
+            columns = schema_from_sensors(sensors, channels, extra_columns)
+    elif sensors is not None:
+        columns = schema_from_sensors(sensors)
+    else:
+        raise ValueError("%s has no header, the config file it was logged with is needed" % csv_file_name)
+
+    with BinaryLogWriter(log_file_name, columns, dtype) as log:
+        for timestamp, values in sweeps:
+            if len(values) != len(columns):
+                print("Skipped a sweep of %d values at %s, the log has %d columns" %
+                      (len(values), time.strftime(CSV_DATESTAMP, time.localtime(timestamp)), len(columns)))
+                continue
+            log.append(timestamp, values)
+    return log.rows
+
+
+def binary_to_csv(log_file_name, csv_file_name, daq=None):
+    """Convert a binary log, rotated or not, to a CSV log like log_writer.py writes, header first
+    Returns the number of sweeps converted.
+    """
+    with open_log(log_file_name, daq) as log:
+        if log.dtype == "float32":
+            text = lambda value: "%.7g" % value
+        else:
+            text = repr
+        with open(csv_file_name, 'w') as csv_file:
+            csv_file.write("Date Time, %s, \n" % ", ".join(column_title(column) for column in log.columns))
+            for timestamp, values in log.sweeps():
+                datestamp = time.strftime(CSV_DATESTAMP, time.localtime(timestamp))
+                csv_file.write("%s, %s, \n" % (datestamp, ", ".join("nan" if value != value else text(value)
+                                                                      for value in values)))
+        return log.rows
+
+
+def describe(log_file_name, daq=None):
+    """Print the schema and chunk index of a binary log
+    """
+    with open_log(log_file_name, daq) as log:
+        print("%s: %d sweeps in %d chunks, %s, created %s" % (log_file_name, log.rows, len(log.chunks), log.dtype,
+                                                             log.schema["created"]))
+        if isinstance(log, BinaryLogSet):
+            for entry in log.entries:
+                print("    segment %s: %d sweeps, %s" % (entry["file"], entry["sweeps"],
+                                                        entry["compression"] or "not compressed"))
+        for column in log.columns:
+            print("    %-30s %s" % (column_title(column), column["function"]))
+        if log.chunks:
+            print("from %s to %s" % (time.strftime(CSV_DATESTAMP, time.localtime(log.chunks[0].t_min / 1e6)),
+                                     time.strftime(CSV_DATESTAMP, time.localtime(log.chunks[-1].t_max / 1e6))))
+
+
+def main():
+    import handle_config_file
+    import parse_config_file as pcf
+
+    parser = argparse.ArgumentParser(description="Convert DAQ logs between CSV and the binary log format")
+    commands = parser.add_subparsers(dest="command", required=True)
+    to_binary = commands.add_parser("to-binary", help="CSV log to binary log")
+    to_binary.add_argument("csv_file")
+    to_binary.add_argument("log_file")
+    to_binary.add_argument("--config", help="config file the log was taken with, for names, units and functions")
+    to_binary.add_argument("--daq", help="'<ip> <port>' of the DAQ to take from a log of several")
+    to_binary.add_argument("--float32", action="store_true", help="store the readings as float32")
+    to_csv = commands.add_parser("to-csv", help="binary log to CSV log")
+    to_csv.add_argument("log_file")
+    to_csv.add_argument("csv_file")
+    to_csv.add_argument("--daq", help="'<ip> <port>' of the DAQ to take from a run of several")
+    info = commands.add_parser("info", help="show the columns and time range of a binary log")
+    info.add_argument("log_file")
+    info.add_argument("--daq", help="'<ip> <port>' of the DAQ to describe from a run of several")
+    options = parser.parse_args()
+
+    if options.command == "to-binary":
+        sensors = None
+        if options.config:
+            with open(options.config, 'r') as config_file:
+                sensor_list, error_list = pcf.parse_config_file(handle_config_file.file_to_list(config_file))
+            daq_list = pcf.split_by_daq(sensor_list)
+            sensors = sensor_list
+            for ip_addr, ip_port, daq_sensors in daq_list:
+                if "%s %s" % (ip_addr, ip_port) == options.daq or (options.daq is None and len(daq_list) == 1):
+                    sensors = daq_sensors
+        try:
+            count = csv_to_binary(options.csv_file, options.log_file, sensors,
+                                  "float32" if options.float32 else "float64", options.daq)
+        except ValueError as error:
+            print(error)
+            sys.exit(1)
+        print("%d sweeps written to %s" % (count, options.log_file))
+    elif options.command == "to-csv":
+        count = binary_to_csv(options.log_file, options.csv_file, options.daq)
+        print("%d sweeps written to %s" % (count, options.csv_file))
+    else:
+        describe(options.log_file, options.daq)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Where the time of a run goes. Latencies are kept per stage and per DAQ
+    in HdrHistogram style histograms: microsecond counts in log-linear
+    buckets, 128 per power of two, so any percentile is within 1 % of the
+    real latency and a histogram stays a few hundred buckets no matter how
+    long the run is. Counters add up sweeps, readings, bytes received,
+    errors the DAQ reported and requests that timed out.
+
+    Stages timed in the DAQ I/O functions once instrument_module() wraps them:
+    scan       - :READ? round trip, the DAQ scanning the channels included
+    fetch      - R? round trip draining DAQ memory in buffered mode
+    round_trip - any other query
+    command    - a command up to the prompt that shows it finished
+    The logger loop times its own stages with a Stopwatch: wait and acquire.
+    The stages of sweep_pipeline.py time every item they take: parse,
+    enrich, console, file and network.
+
+    Nothing here runs when metrics are off, the I/O functions are only
+    wrapped when a Metrics is created for the run.
+
+    serve_metrics() answers on http://127.0.0.1:<port>/ with a text table and
+    on /metrics in the Prometheus text format.
+
+Usage:
+    metrics = Metrics()
+    metrics.instrument_module(DAQ_commands)
+    serve_metrics(metrics, 9105)
+    stopwatch = metrics.stopwatch("192.168.1.10 5024")
+    stopwatch.lap("acquire")
+    if metrics.summary_due(60):
+        print(metrics.summary())
+"""
+
+import functools
+import http.server
+import inspect
+import threading
+import time
+
+# Buckets per power of two are 2 ** SUB_BUCKET_BITS, 7 keeps every value within 1 %
+SUB_BUCKET_BITS = 7
+# Percentiles shown in the summary line, the text table and /metrics
+PERCENTILES = (50, 90, 99, 99.9)
+# The DAQ I/O functions instrument_module() wraps, in DAQ_commands and DAQ_async
+IO_FUNCTIONS = ("query_daq", "execute_daq_cmd", "collect_errors")
+# Counters in the order they are reported
+COUNTERS = ("sweeps", "readings", "bytes", "errors", "timeouts")
+
+
+def bucket_index(micros):
+    """Bucket a latency in whole microseconds falls in
+    Values below 256 us get a bucket each, above that a power of two is split into 128 buckets
+    """
+    shift = micros.bit_length() - SUB_BUCKET_BITS - 1
+    if shift < 0:
+        shift = 0
+    return (shift << SUB_BUCKET_BITS) + (micros >> shift)
+
+
+def bucket_top(index):
+    """Highest latency in microseconds that lands in bucket index
+    """
+    shift = (index >> SUB_BUCKET_BITS) - 1
+    if shift < 0:
+        shift = 0
+    top = index - (shift << SUB_BUCKET_BITS)
+    return ((top + 1) << shift) - 1
+
+
+class LatencyHistogram:
+    """Latencies in log-linear buckets, {bucket index: count}
+    Recorded in seconds, kept in microseconds.
+    """
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = int(seconds * 1000000)
+        if micros < 0:
+            micros = 0
+        index = bucket_index(micros)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        if not self.count or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other):
+        """Add the latencies of another histogram to this one
+        """
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+        if other.count and (not self.count or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        self.count += other.count
+        self.total += other.total
+        return self
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percent):
+        """Latency in seconds that percent of the recorded latencies are at or below, 0.0 when empty
+        """
+        if not self.count:
+            return 0.0
+        wanted = max(1, int(self.count * percent / 100.0 + 0.999999))
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= wanted:
+                return min(bucket_top(index) / 1000000.0, self.max)
+        return self.max
+
+
+class Stopwatch:
+    """Times the stages of the logger loop one after the other for one DAQ
+    lap(stage) records the time since the last lap, or since start(), as that stage.
+    """
+    def __init__(self, metrics, instrument):
+        self.metrics = metrics
+        self.instrument = instrument
+        self.last = time.perf_counter()
+
+    def start(self):
+        self.last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        self.metrics.record(stage, self.instrument, now - self.last)
+        self.last = now
+
+
+class Metrics:
+    """Latency histograms keyed by (stage, instrument) and counters keyed by (counter, instrument)
+    Recording and reporting share a lock so the metrics server can read while the logger records.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.stopwatches = {}
+        self.started = time.monotonic()
+        self.last_summary = self.started
+
+    def record(self, stage, instrument, seconds):
+        with self.lock:
+            histogram = self.histograms.get((stage, instrument))
+            if histogram is None:
+                histogram = self.histograms[(stage, instrument)] = LatencyHistogram()
+            histogram.record(seconds)
+
+    def count(self, counter, instrument, amount=1):
+        with self.lock:
+            self.counters[(counter, instrument)] = self.counters.get((counter, instrument), 0) + amount
+
+    def count_sweeps(self, instrument, sweeps):
+        """Count [timestamp, channels, values] sweeps and their readings
+        """
+        self.count("sweeps", instrument, len(sweeps))
+        self.count("readings", instrument, sum(len(sweep[2]) for sweep in sweeps))
+
+    def stopwatch(self, instrument):
+        """The Stopwatch for an instrument, one per instrument for the run
+        """
+        if instrument not in self.stopwatches:
+            self.stopwatches[instrument] = Stopwatch(self, instrument)
+        return self.stopwatches[instrument]
+
+    def instrument_module(self, module):
+        """Time and count the DAQ I/O functions of DAQ_commands or DAQ_async
+        The functions are replaced on the module so calls inside it are timed too.
+        Instrumenting a module again replaces the wrappers of an earlier Metrics.
+        """
+        for name in IO_FUNCTIONS:
+            function = getattr(module, name)
+            function = getattr(function, "__wrapped__", function)
+            setattr(module, name, self.timed_io(name, function))
+
+    def timed_io(self, name, function):
+        """Wrap one DAQ I/O function, the DAQ is told apart by the name of its connection
+        """
+        metrics = self
+
+        def stage_of(args, kwargs):
+            if name != "query_daq":
+                return "command"
+            query = args[1] if len(args) > 1 else kwargs["daq_query"]
+            if query == ":READ?":
+                return "scan"
+            if query.startswith("R?"):
+                return "fetch"
+            return "round_trip"
+
+        def account(args, kwargs, started, result):
+            instrument = getattr(args[0], "name", "daq")
+            if name == "collect_errors":
+                counted = args[2] if len(args) > 2 else kwargs.get("count", True)
+                if counted and result:
+                    metrics.count("errors", instrument, len(result))
+                return
+            metrics.record(stage_of(args, kwargs), instrument, time.perf_counter() - started)
+            if result is False:
+                metrics.count("timeouts", instrument)
+            elif name == "query_daq":
+                metrics.count("bytes", instrument, len(result))
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed(*args, **kwargs):
+                started = time.perf_counter()
+                result = await function(*args, **kwargs)
+                account(args, kwargs, started, result)
+                return result
+        else:
+            @functools.wraps(function)
+            def timed(*args, **kwargs):
+                started = time.perf_counter()
+                result = function(*args, **kwargs)
+                account(args, kwargs, started, result)
+                return result
+        return timed
+
+    def snapshot(self):
+        """Copies of the histograms and counters, taken under the lock
+        """
+        with self.lock:
+            histograms = {key: LatencyHistogram().merge(histogram) for key, histogram in self.histograms.items()}
+            return histograms, dict(self.counters)
+
+    def summary_due(self, interval, now=None):
+        """True once every interval seconds, for the periodic summary line
+        """
+        if not interval:
+            return False
+        if now is None:
+            now = time.monotonic()
+        if now - self.last_summary < interval:
+            return False
+        self.last_summary = now
+        return True
+
+    def summary(self):
+        """One line with the counters and the p50/p99 of every stage over all DAQs
+        """
+        histograms, counters = self.snapshot()
+        totals = dict.fromkeys(COUNTERS, 0)
+        for (counter, instrument), amount in counters.items():
+            totals[counter] = totals.get(counter, 0) + amount
+        stages = {}
+        for (stage, instrument), histogram in histograms.items():
+            stages.setdefault(stage, LatencyHistogram()).merge(histogram)
+        line = "metrics %.0f s: %d sweeps, %d readings, %.1f kB, %d errors, %d timeouts" % (
+            time.monotonic() - self.started, totals["sweeps"], totals["readings"], totals["bytes"] / 1000.0,
+            totals["errors"], totals["timeouts"])
+        for stage, histogram in stages.items():
+            line += " | %s p50 %.2f p99 %.2f ms" % (stage, histogram.percentile(50) * 1000,
+                                                   histogram.percentile(99) * 1000)
+        return line
+
+    def text(self):
+        """Table of every stage and DAQ with the counters underneath, for people
+        """
+        histograms, counters = self.snapshot()
+        lines = [self.summary(), "",
+                 "%-12s %-24s %9s %9s %s" % ("stage", "daq", "count", "mean ms",
+                                             " ".join("%9s" % ("p%g ms" % p) for p in PERCENTILES) + "    max ms")]
+        for (stage, instrument), histogram in sorted(histograms.items()):
+            lines.append("%-12s %-24s %9d %9.3f %s %9.3f" % (
+                stage, instrument, histogram.count, histogram.mean() * 1000,
+                " ".join("%9.3f" % (histogram.percentile(p) * 1000) for p in PERCENTILES), histogram.max * 1000))
+        lines.append("")
+        lines.append("%-12s %-24s %12s" % ("counter", "daq", "total"))
+        for (counter, instrument), amount in sorted(counters.items()):
+            lines.append("%-12s %-24s %12d" % (counter, instrument, amount))
+        return "\n".join(lines) + "\n"
+
+    def prometheus_text(self):
+        """The histograms as summaries and the counters as counters in the Prometheus text format
+        """
+        histograms, counters = self.snapshot()
+        lines = ["# HELP daq_stage_seconds Latency of each stage of the logger per DAQ",
+                 "# TYPE daq_stage_seconds summary"]
+        for (stage, instrument), histogram in sorted(histograms.items()):
+            labels = 'stage="%s",daq="%s"' % (stage, instrument)
+            for percent in PERCENTILES:
+                lines.append('daq_stage_seconds{%s,quantile="%g"} %.6f' % (labels, percent / 100.0,
+                                                                           histogram.percentile(percent)))
+            lines.append("daq_stage_seconds_sum{%s} %.6f" % (labels, histogram.total))
+            lines.append("daq_stage_seconds_count{%s} %d" % (labels, histogram.count))
+        for counter in COUNTERS:
+            lines.append("# TYPE daq_%s_total counter" % counter)
+            for (name, instrument), amount in sorted(counters.items()):
+                if name == counter:
+                    lines.append('daq_%s_total{daq="%s"} %d' % (counter, instrument, amount))
+        return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """GET / for the text table, GET /metrics for Prometheus
+    """
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            body = self.server.metrics.prometheus_text()
+            content_type = "text/plain; version=0.0.4"
+        elif path == "/":
+            body = self.server.metrics.text()
+            content_type = "text/plain"
+        else:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header("Content-Type", content_type + "; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # The console belongs to the sweeps
+        pass
+
+
+def serve_metrics(metrics, port, host="127.0.0.1"):
+    """Serve the metrics over HTTP from a background thread
+    Returns the server, server.shutdown() stops it, False if the port cannot be used
+    """
+    try:
+        server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as error:
+        print("Cannot serve metrics on %s:%d: %s" % (host, port, error))
+        return False
+    server.daemon_threads = True
+    server.metrics = metrics
+    threading.Thread(target=server.serve_forever, name="metrics server", daemon=True).start()
+    return server
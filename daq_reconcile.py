@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Bring the DAQ channel setup in line with the config file without *RST.
+    The live setup is read back with one query per setting for all channels
+    at once (CONFigure?, UNIT:TEMPerature?, CALCulate:SCALe:GAIN? ...), each
+    channel is compared with the commands the config asks for and only the
+    commands for settings that differ are sent, grouped into channel lists.
+
+    A channel whose function or range changed gets all its commands again,
+    CONFigure puts the other settings of a channel back to their defaults.
+    Resolution cannot be compared, the config gives it in digits and the DAQ
+    reports it in units of the reading. A channel that asks for a resolution
+    other than DEF, MIN or MAX gets all its commands again on every start,
+    the plan says so.
+
+Usage:
+    chan_numbers = reconcile_daq_channels(daq_conn, chan_list)
+"""
+
+import re
+import DAQ_commands as DAQ_cmd
+
+# "(@101)" at the end of a per channel command
+CHANNEL_SUFFIX_RE = re.compile(r",?\(@[0-9:,]+\)$")
+# Values in a query response, quoted strings can hold commas
+RESPONSE_VALUE_RE = re.compile(r'"[^"]*"|\'[^\']*\'|[^,]+')
+# Settings that leave the value up to the DAQ, there is nothing to compare
+NOT_COMPARED = ("DEF", "DEFAULT", "AUTO", "MIN", "MAX")
+
+
+def short_form(scpi):
+    """SCPI keyword to its short form, "TEMPerature:NPLCycles" -> "TEMP:NPLC"
+    """
+    return "".join(char for char in scpi if not char.islower()).upper()
+
+
+def same_setting(wanted, live):
+    """Compare a value from the config with the value the DAQ reports
+    "15" == "+1.500000E+01", "ON" == "1", "INTernal" == "INT", "'RPM'" == '"RPM"'
+    """
+    wanted = wanted.strip().strip("'\"")
+    live = live.strip().strip("'\"")
+    try:
+        return abs(float(wanted) - float(live)) <= 1e-6 * max(1.0, abs(float(wanted)))
+    except ValueError:
+        pass
+    switches = {"ON": "1", "OFF": "0"}
+    wanted = switches.get(wanted.upper(), wanted)
+    return live.upper() in (wanted.upper(), short_form(wanted))
+
+
+def split_command(cmd):
+    """Split ":UNIT:TEMPerature C,(@101)" into the setting ":UNIT:TEMPerature" and its arguments ["C"]
+    """
+    cmd = CHANNEL_SUFFIX_RE.sub("", cmd)
+    setting, _, arguments = cmd.partition(" ")
+    return setting, RESPONSE_VALUE_RE.findall(arguments)
+
+
+def same_function(wanted_cmd, live_config):
+    """Compare a :CONFigure command with a channel's CONFigure? response
+    ":CONFigure:TEMPerature TC,T,(@101)" and "TEMP TC,T,+1.000000E+00,+1.000000E-01"
+    The range is compared, the resolution is not, see wanted_resolution().
+    """
+    setting, arguments = split_command(wanted_cmd)
+    function = short_form(setting.split(":", 2)[2])
+    live_function, _, live_arguments = live_config.strip('"').partition(" ")
+    live_function = live_function.upper()
+    if ":" not in live_function and function.endswith(":DC"):
+        live_function = live_function + ":DC"
+    if live_function != function:
+        return False
+    live_arguments = live_arguments.split(",")
+    if function == "TEMP":
+        compared = arguments
+    else:
+        compared = arguments[:1]
+    for wanted, live in zip(compared, live_arguments):
+        if wanted.upper() not in NOT_COMPARED and not same_setting(wanted, live):
+            return False
+    return len(live_arguments) >= len(compared)
+
+
+def wanted_resolution(wanted_cmd):
+    """The resolution a :CONFigure command asks for, None when it leaves it to the DAQ
+    ":CONFigure:FREQuency 10,6.5,(@104)" -> "6.5", ":CONFigure:VOLTage:DC 10,DEF,(@102)" -> None
+    """
+    setting, arguments = split_command(wanted_cmd)
+    if short_form(setting.split(":", 2)[2]) == "TEMP" or len(arguments) < 2:
+        return None
+    resolution = arguments[1].strip()
+    if not resolution or resolution.upper() in NOT_COMPARED:
+        return None
+    return resolution
+
+
+def channel_commands(chan_list):
+    """The commands each channel needs, {channel: [command, ...]} in config order
+    """
+    wanted = {}
+    for sensor_line in chan_list:
+        chan_type = sensor_line[2].upper()
+        if chan_type in DAQ_cmd.CMD_BUILDERS:
+            wanted[int(sensor_line[0])] = [cmd for cmd, channel in DAQ_cmd.CMD_BUILDERS[chan_type](sensor_line)]
+    return wanted
+
+
+def read_live_settings(daq_conn, wanted):
+    """Ask the DAQ for every setting the wanted commands touch, one query per setting for all its channels
+    Returns {(channel, setting): live value}, settings the DAQ did not answer are left out
+    """
+    channels_by_setting = {}
+    for channel, cmds in wanted.items():
+        for cmd in cmds:
+            channels_by_setting.setdefault(split_command(cmd)[0], []).append(channel)
+
+    live = {}
+    for setting, channels in channels_by_setting.items():
+        chan_numbers = DAQ_cmd.compress_channel_list(channels)
+        if setting.upper().startswith(":CONF"):
+            query = ":CONFigure? (%s)" % chan_numbers
+        else:
+            query = "%s? (%s)" % (setting, chan_numbers)
+        response = DAQ_cmd.query_daq(daq_conn, query)
+        if not response:
+            continue
+        values = RESPONSE_VALUE_RE.findall(response)
+        ordered = DAQ_cmd.expand_channel_list(chan_numbers)
+        if len(values) != len(ordered):
+            continue
+        for channel, value in zip(ordered, values):
+            live[(channel, setting)] = value
+    # Settings a channel does not have leave errors behind
+    DAQ_cmd.collect_errors(daq_conn, count=False)
+    return live
+
+
+def plan_reconfiguration(wanted, live):
+    """Compare the wanted commands with the live settings
+    Returns the [command, channel list] pairs to send and a plan of what changes as text lines
+    """
+    changes = {}
+    for channel, cmds in wanted.items():
+        configure_cmd = cmds[0]
+        live_config = live.get((channel, split_command(configure_cmd)[0]))
+        resolution = wanted_resolution(configure_cmd)
+        if live_config is None or not same_function(configure_cmd, live_config):
+            changed = [[cmd, "was %s" % live_config if live_config else ""] for cmd in cmds]
+        elif resolution:
+            # The resolution the DAQ holds cannot be checked, CONFigure sets it and the rest follow
+            note = "resolution %s digits cannot be read back" % resolution
+            changed = [[cmd, note] for cmd in cmds]
+        else:
+            changed = []
+            for cmd in cmds[1:]:
+                setting, arguments = split_command(cmd)
+                live_value = live.get((channel, setting))
+                if live_value is None or not arguments or not same_setting(arguments[0], live_value):
+                    changed.append([cmd, "was %s" % live_value if live_value else ""])
+        for cmd, note in changed:
+            # Channels with the same change share one command
+            changes.setdefault((CHANNEL_SUFFIX_RE.sub("", cmd), note), []).append(channel)
+
+    cmd_list = []
+    plan = []
+    sent = {}
+    for (cmd, note), channels in changes.items():
+        sent.setdefault(cmd, []).extend(channels)
+        note = " (%s)" % note if note else ""
+        plan.append("%s -> %s%s" % (DAQ_cmd.compress_channel_list(channels), cmd, note))
+    # CONFigure resets the other settings of a channel so it goes first
+    for cmd in sorted(sent, key=lambda cmd: not cmd.upper().startswith(":CONF")):
+        chan_numbers = DAQ_cmd.compress_channel_list(sent[cmd])
+        cmd_list.append(["%s,(%s)" % (cmd, chan_numbers), chan_numbers[1:]])
+    return cmd_list, plan
+
+
+def reconcile_daq_channels(daq_conn, chan_list, max_batch_bytes=DAQ_cmd.MAX_BATCH_BYTES):
+    """Send only the commands that bring the DAQ channels in line with chan_list, no *RST
+    Prints the plan first. Returns the channel list to scan like configure_daq_channels
+    """
+    wanted = channel_commands(chan_list)
+    live = read_live_settings(daq_conn, wanted)
+    cmd_list, plan = plan_reconfiguration(wanted, live)
+    changed_channels = set()
+    for cmd, chan_numbers in cmd_list:
+        changed_channels.update(DAQ_cmd.expand_channel_list(chan_numbers))
+    print("######### reconfiguration plan ##########")
+    print("%d of %d channels change" % (len(changed_channels), len(wanted)))
+    for line in plan:
+        print("    %s" % line)
+    DAQ_cmd.execute_daq_batches(daq_conn, cmd_list, max_batch_bytes)
+    return DAQ_cmd.compress_channel_list(wanted)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Description:
+    A connection to one DAQ that survives a dropped telnet session. Long
+    waits between sweeps are broken up with keepalives so the DAQ does not
+    close an idle session. When the session drops anyway the DAQ is
+    reconnected with an exponential backoff.
+
+    After a reconnect the DAQ is checked with *IDN?, the scan list and a
+    fingerprint of its channel and scan setup. If it still holds our
+    configuration scanning resumes straight away, only a DAQ that was reset
+    or power cycled goes through *RST and the channel setup again.
+
+Usage:
+    session = DAQSession("10.193.64.232", 5024, setup_scan)
+    session.start()
+    response = session.call(DAQ_cmd.collect_sensor_response)
+    session.sleep(seconds)
+"""
+
+import time
+import DAQ_commands as DAQ_cmd
+
+# Seconds a session may sit idle before we check on the DAQ
+KEEPALIVE_INTERVAL = 30
+# Seconds between reconnect attempts, doubled after each failure up to the maximum
+RECONNECT_FIRST_WAIT = 1
+RECONNECT_MAX_WAIT = 60
+
+
+class DAQSession:
+    """Telnet session to one DAQ that reconnects by itself
+    setup(conn) configures a freshly reset DAQ for scanning and returns the
+    SCPI scan list. outages holds [seconds without the DAQ, resumed] for
+    every reconnect, resumed is False when the DAQ had to be set up again.
+    """
+    def __init__(self, ip_addr, ip_port, setup, timeout=10):
+        self.ip_addr = ip_addr
+        self.ip_port = ip_port
+        self.setup = setup
+        self.timeout = timeout
+        self.conn = False
+        self.prompt = ""
+        self.identity = False
+        self.model = False
+        # Seconds taken to connect, get the logon prompt and the *IDN? answer
+        self.handshake_times = []
+        self.chan_numbers = ""
+        self.config_state = False
+        self.last_contact = 0.0
+        self.outages = []
+
+    def connect(self):
+        """Connect, wait for the logon prompt and identify the DAQ
+        """
+        handshake = DAQ_cmd.handshake(self.ip_addr, self.ip_port, self.timeout)
+        if not handshake:
+            self.conn = False
+            return False
+        self.conn, self.prompt, self.identity, self.handshake_times = handshake
+        self.model = DAQ_cmd.prompt_model(self.prompt)
+        self.last_contact = time.monotonic()
+        return bool(self.identity)
+
+    def start(self):
+        """Connect and set the DAQ up for scanning, False if it cannot be reached
+        """
+        if not self.connect():
+            return False
+        self.configure()
+        return True
+
+    def configure(self):
+        """Run the setup and remember the configuration it left on the DAQ
+        A session that drops during the setup is reconnected, which sets the DAQ up again.
+        """
+        try:
+            self.run_setup()
+        except (EOFError, OSError):
+            print("Lost the DAQ during setup")
+            self.config_state = False
+            self.reconnect()
+
+    def run_setup(self):
+        self.chan_numbers = self.setup(self.conn)
+        self.config_state = DAQ_cmd.daq_config_state(self.conn, self.chan_numbers)
+        self.last_contact = time.monotonic()
+
+    def holds_config(self, identity):
+        """Check a reconnected DAQ is the same unit and still has our configuration
+        """
+        if not identity or not self.identity or identity[2] != self.identity[2]:
+            return False
+        config_state = DAQ_cmd.daq_config_state(self.conn, self.chan_numbers)
+        return bool(config_state) and config_state == self.config_state
+
+    def reconnect(self):
+        """Reconnect with an exponential backoff until the DAQ answers again
+        Returns True if scanning resumed with the configuration left on the DAQ
+        """
+        lost = time.monotonic()
+        identity = self.identity
+        self.close()
+        wait = RECONNECT_FIRST_WAIT
+        while True:
+            print("Reconnecting to %s %s" % (self.ip_addr, self.ip_port))
+            if self.connect():
+                print("Handshake %s" % DAQ_cmd.handshake_report(self.handshake_times))
+                try:
+                    resumed = self.holds_config(identity)
+                    if resumed:
+                        print("DAQ still holds the configuration, scanning resumed")
+                    else:
+                        print("DAQ lost the configuration, setting it up again")
+                        self.run_setup()
+                    break
+                except (EOFError, OSError):
+                    print("Lost the DAQ again")
+            self.close()
+            time.sleep(wait)
+            wait = min(wait * 2, RECONNECT_MAX_WAIT)
+        outage = time.monotonic() - lost
+        self.outages.append([outage, resumed])
+        print("DAQ back after %.1f s" % outage)
+        return resumed
+
+    def call(self, daq_function, *args):
+        """Run daq_function(conn, *args) and reconnect and try again once if the session dropped
+        A function that returns nothing counts as dropped when the DAQ then fails a keepalive.
+        """
+        result = self.call_until_done(daq_function, *args)
+        # keepalive reconnects when the DAQ has gone quiet
+        if result or self.keepalive():
+            self.last_contact = time.monotonic()
+            return result
+        return self.call_until_done(daq_function, *args)
+
+    def call_until_done(self, daq_function, *args):
+        """Run daq_function(conn, *args), reconnecting as often as the session drops under it
+        """
+        while True:
+            try:
+                return daq_function(self.conn, *args)
+            except (EOFError, OSError):
+                self.reconnect()
+
+    def keepalive(self):
+        """Check the DAQ still answers, reconnect if it does not
+        """
+        if DAQ_cmd.is_alive(self.conn):
+            self.last_contact = time.monotonic()
+            return True
+        self.reconnect()
+        return False
+
+    def sleep(self, seconds):
+        """Sleep with a keepalive whenever the session has been idle for KEEPALIVE_INTERVAL
+        """
+        end = time.monotonic() + seconds
+        while True:
+            now = time.monotonic()
+            if now - self.last_contact >= KEEPALIVE_INTERVAL:
+                self.keepalive()
+                now = time.monotonic()
+            if now >= end:
+                return
+            time.sleep(max(0.0, min(end, self.last_contact + KEEPALIVE_INTERVAL) - now))
+
+    def hand_back(self, stop_scan=False):
+        """Stop the scan if asked, give the DAQ back to the front panel and log off
+        Nothing is sent if the session is down.
+        """
+        if not self.conn:
+            return
+        try:
+            if stop_scan:
+                DAQ_cmd.stop_scan(self.conn)
+            DAQ_cmd.put_in_local_mode(self.conn, self.prompt)
+            self.conn.write(b"\x04")
+        except (EOFError, OSError):
+            pass
+
+    def close(self):
+        if self.conn:
+            try:
+                self.conn.close()
+            except (EOFError, OSError):
+                pass
+        self.conn = False
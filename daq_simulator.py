@@ -0,0 +1,802 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Stand-in for Keysight 34972A and 34980A DAQs on the telnet port so the
+    logger can be run and load tested without lab hardware. Every simulated
+    DAQ sends the logon banner and prompt and answers *IDN?, *RST, *OPC?
+    (only once a running scan is done, never for an INFinity scan),
+    *SAV/*RCL, the CONFigure, SENSe, UNIT, CALCulate:SCALe, FORMat:READing,
+    TRIGger and ROUTe:SCAN commands and queries, :READ?, INITiate, ABORt,
+    FETCh?, R?, DATA:POINts?, DATA:REMove? and SYSTem:ERRor?.
+
+    Readings are synthetic, a slow sine, a random walk or a constant per
+    channel plus noise, scaled with Mx+B when scaling is on. Each command
+    takes command_latency seconds and a sweep takes the integration time of
+    every channel (NPLC / line frequency) plus channel_delay, all multiplied
+    by time_scale so benchmarks can run faster than real hardware. A buffered
+    scan started with INITiate fills memory on its timer as time passes.
+
+    Faults are injected per program message or per reading at the given
+    rates: dropped sessions, power cycles that lose the configuration,
+    stalls, errors in the error queue and overload readings.
+
+    All the DAQs run in one asyncio event loop, one listening socket each,
+    so hundreds of them fit in one process. They listen on consecutive
+    ports or, with --spread hosts, on consecutive loopback addresses all on
+    port 5024.
+
+Usage:
+    ./daq_simulator.py                                   one 34980A on 127.0.0.1 5024
+    ./daq_simulator.py --count 200 --port 6000           200 DAQs on ports 6000 to 6199
+    ./daq_simulator.py --count 50 --spread hosts         50 DAQs on 127.0.0.1 to 127.0.0.50 port 5024
+    ./daq_simulator.py --count 20 --write-config config/sim_rack.txt --channels 40
+    ./daq_simulator.py --time-scale 0.01 --drop-rate 0.001 --error-rate 0.01
+
+    rack = SimulatorRack(simulator_addresses(100, "127.0.0.1", 6000))
+    rack.start()
+    ...
+    rack.stop()
+"""
+
+import argparse
+import asyncio
+import copy
+import math
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+MODELS = ("34972A", "34980A")
+BANNERS = {"34972A": "Welcome to Agilent's 34972A Data Acquisition / Switch Unit",
+           "34980A": "Welcome to Agilent's 34980A Multifunction Switch/Measure Unit"}
+FIRMWARE = {"34972A": "1.17-1.12-02-02",
+            "34980A": "2.51-2.43-2.07-1.05"}
+# Readings the DAQ memory holds, the oldest are overwritten when it is full
+MEMORY_READINGS = {"34972A": 50000, "34980A": 500000}
+# Errors the error queue holds, the last one becomes -350 when it overflows
+ERROR_QUEUE_LENGTH = {"34972A": 10, "34980A": 20}
+LINE_FREQUENCY = 60.0
+OVERLOAD = "+9.90000000E+37"
+SIGNALS = ("sine", "walk", "constant")
+
+# Long SCPI keywords to their short form, short forms map to themselves
+SHORT_FORMS = {"ABORT": "ABOR", "APERTURE": "APER", "CALCULATE": "CALC", "CHANNEL": "CHAN",
+               "CONFIGURE": "CONF", "COUNT": "COUN", "CURRENT": "CURR", "DEFAULT": "DEF",
+               "ERROR": "ERR", "FETCH": "FETC", "FORMAT": "FORM", "FREQUENCY": "FREQ",
+               "IMMEDIATE": "IMM", "INFINITY": "INF", "INITIATE": "INIT", "INTERNAL": "INT",
+               "LOCAL": "LOC", "MAXIMUM": "MAX", "MEMORY": "MEM", "MINIMUM": "MIN",
+               "NPLCYCLES": "NPLC", "OFFSET": "OFFS", "POINTS": "POIN", "READING": "READ",
+               "REMOTE": "REM", "REMOVE": "REM", "RESISTANCE": "RES", "RJUNCTION": "RJUN",
+               "ROUTE": "ROUT", "SCALE": "SCAL", "SENSE": "SENS", "SOURCE": "SOUR",
+               "STATE": "STAT", "SYSTEM": "SYST", "TCOUPLE": "TC", "TEMPERATURE": "TEMP",
+               "TIMER": "TIM", "TRANSDUCER": "TRAN", "TRIGGER": "TRIG", "VOLTAGE": "VOLT"}
+
+# Settings of the whole DAQ after *RST, values as the DAQ reports them
+SCAN_DEFAULTS = {"TRIG:SOUR": "IMM",
+                 "TRIG:COUN": "+1.00000000E+00",
+                 "TRIG:TIM": "+1.00000000E+01",
+                 "FORM:READ:CHAN": "0",
+                 "FORM:READ:TIME": "0",
+                 "FORM:READ:TIME:TYPE": "ABS",
+                 "FORM:READ:UNIT": "1"}
+# Settings of a channel after CONFigure
+CHANNEL_DEFAULTS = {"UNIT:TEMP": "C",
+                    "TEMP:NPLC": "+1.00000000E+00",
+                    "VOLT:DC:NPLC": "+1.00000000E+00",
+                    "FREQ:APER": "+1.00000000E-01",
+                    "TEMP:TRAN:TC:RJUN:TYPE": "INT",
+                    "CALC:SCAL:STAT": "0",
+                    "CALC:SCAL:GAIN": "+1.00000000E+00",
+                    "CALC:SCAL:OFFS": "+0.00000000E+00",
+                    "CALC:SCAL:UNIT": '""'}
+# Signal level, swing and noise of a reading for each function before scaling
+SIGNAL_LEVELS = {"TEMP": (22.0, 3.0, 0.05),
+                 "VOLT:DC": (5.0, 0.5, 0.001),
+                 "FREQ": (1000.0, 50.0, 0.5)}
+UNIT_SUFFIX = {"VOLT:DC": "VDC", "FREQ": "HZ"}
+
+# "(@101:103,105)" anywhere in the arguments
+CHANNEL_LIST_RE = re.compile(r"\(@([0-9:,\s]*)\)")
+# Arguments of a command, quoted strings can hold commas
+ARGUMENT_RE = re.compile(r'"[^"]*"|\'[^\']*\'|[^,]+')
+# Program message units, ";" inside quoted strings does not split
+MESSAGE_UNIT_RE = re.compile(r'(?:"[^"]*"|\'[^\']*\'|[^;"\'])+')
+
+
+class SimulatorProfile:
+    """Timing, signal and fault settings shared by the simulated DAQs
+    Times are seconds before time_scale is applied, rates are the chance per
+    program message (readings for overload_rate).
+    """
+    def __init__(self, command_latency=0.002, channel_delay=0.001, time_scale=1.0, signal="sine",
+                 noise=1.0, drop_rate=0.0, power_cycle_rate=0.0, stall_rate=0.0, stall_time=10.0,
+                 error_rate=0.0, overload_rate=0.0):
+        if signal not in SIGNALS:
+            raise ValueError("Signal must be one of: %s" % ", ".join(SIGNALS))
+        self.command_latency = command_latency
+        self.channel_delay = channel_delay
+        self.time_scale = time_scale
+        self.signal = signal
+        self.noise = noise
+        self.drop_rate = drop_rate
+        self.power_cycle_rate = power_cycle_rate
+        self.stall_rate = stall_rate
+        self.stall_time = stall_time
+        self.error_rate = error_rate
+        self.overload_rate = overload_rate
+
+
+def short_form(keyword):
+    """Keyword to its short form, "CONFigure" or "CONFIGURE" -> "CONF"
+    """
+    keyword = keyword.upper()
+    return SHORT_FORMS.get(keyword, keyword)
+
+
+def setting_value(text):
+    """A setting the way the DAQ reports it back
+    "10" -> "+1.00000000E+01", "ON" -> "1", "INTernal" -> "INT", "'RPM'" -> '"RPM"'
+    """
+    text = text.strip()
+    if text[:1] in ("'", '"'):
+        return '"%s"' % text.strip("'\"")
+    upper = short_form(text)
+    if upper in ("ON", "OFF"):
+        return "1" if upper == "ON" else "0"
+    if upper == "INF":
+        return "+9.90000000E+37"
+    try:
+        return "%+.8E" % float(text)
+    except ValueError:
+        return upper
+
+
+def switch_value(value):
+    """On/off settings are reported as "1" or "0" however they were set
+    """
+    if value in ("0", "1"):
+        return value
+    return "1" if setting_number(value) else "0"
+
+
+def setting_number(value, default=0.0):
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+def expand_channels(chan_list):
+    """Channel list to channel numbers, "101:103,105" -> [101, 102, 103, 105]
+    """
+    channels = []
+    for chan_range in chan_list.split(","):
+        chan_range = chan_range.strip()
+        if ":" in chan_range:
+            first, last = chan_range.split(":")
+            channels.extend(range(int(first), int(last) + 1))
+        elif chan_range:
+            channels.append(int(chan_range))
+    return channels
+
+
+def compress_channels(channels):
+    """Channel numbers to a channel list, [101, 102, 103, 105] -> "@101:103,105"
+    """
+    ranges = []
+    for channel in channels:
+        if ranges and channel == ranges[-1][1] + 1:
+            ranges[-1][1] = channel
+        else:
+            ranges.append([channel, channel])
+    return "@" + ",".join("%d" % first if first == last else "%d:%d" % (first, last) for first, last in ranges)
+
+
+def valid_channel(model, channel):
+    """34972A channels are slot + 2 digits (101-322), 34980A channels slot + 3 digits (1001-8999)
+    """
+    if model == "34972A":
+        return 1 <= channel // 100 <= 3 and 1 <= channel % 100 <= 22
+    return 1 <= channel // 1000 <= 8 and 1 <= channel % 1000 <= 999
+
+
+def block(data):
+    """IEEE 488.2 definite length block, "#3123<123 bytes>"
+    """
+    length = "%d" % len(data)
+    return "#%d%s%s" % (len(length), length, data)
+
+
+class SimulatedDAQ:
+    """State and command handling of one simulated DAQ
+    execute() runs one program message and returns the response line, the
+    seconds the DAQ takes and the fault to act on ("drop", "power_cycle" or None).
+    """
+    def __init__(self, model="34980A", serial_number="SIM00001", profile=None, seed=None):
+        if model not in MODELS:
+            raise ValueError("Model must be one of: %s" % ", ".join(MODELS))
+        self.model = model
+        self.serial_number = serial_number
+        self.profile = profile or SimulatorProfile()
+        self.random = random.Random(seed)
+        # Seconds between the host clock and the DAQ clock set with SYSTem:DATE and :TIME
+        self.clock_offset = 0.0
+        self.errors = deque()
+        self.states = {}
+        self.state_names = {}
+        self.stats = {"connections": 0, "messages": 0, "queries": 0, "readings": 0, "faults": 0}
+        self.reset()
+
+    def reset(self):
+        """*RST, what a power cycle also does. Stored states survive
+        """
+        self.channels = {}
+        self.scan = []
+        self.settings = dict(SCAN_DEFAULTS)
+        self.memory = deque(maxlen=MEMORY_READINGS[self.model])
+        self.scanning = False
+        self.scan_start = 0.0
+        self.sweeps_done = 0
+        self.walk = {}
+
+    def now(self):
+        return time.time() + self.clock_offset
+
+    def banner(self):
+        return "%s\r\n%s> " % (BANNERS[self.model], self.model)
+
+    def add_error(self, error):
+        if len(self.errors) >= ERROR_QUEUE_LENGTH[self.model]:
+            self.errors[-1] = '-350,"Queue overflow"'
+        else:
+            self.errors.append(error)
+
+    def execute(self, message):
+        """Run one program message, ";" separated commands
+        Returns (response line or None, seconds it takes, fault or None)
+        """
+        profile = self.profile
+        self.stats["messages"] += 1
+        if profile.drop_rate and self.random.random() < profile.drop_rate:
+            self.stats["faults"] += 1
+            return None, 0.0, "drop"
+        if profile.power_cycle_rate and self.random.random() < profile.power_cycle_rate:
+            self.stats["faults"] += 1
+            self.reset()
+            return None, 0.0, "power_cycle"
+
+        responses = []
+        delay = 0.0
+        for unit in MESSAGE_UNIT_RE.findall(message):
+            unit = unit.strip()
+            if not unit:
+                continue
+            delay += profile.command_latency * self.random.uniform(0.5, 1.5)
+            response, busy = self.command(unit)
+            delay += busy
+            if response is not None:
+                responses.append(response)
+            elif profile.error_rate and not unit.endswith("?") and self.random.random() < profile.error_rate:
+                self.stats["faults"] += 1
+                self.add_error('-221,"Settings conflict"')
+        if profile.stall_rate and self.random.random() < profile.stall_rate:
+            self.stats["faults"] += 1
+            delay += profile.stall_time
+        if responses:
+            self.stats["queries"] += 1
+            return ";".join(responses), delay * profile.time_scale, None
+        return None, delay * profile.time_scale, None
+
+    def command(self, unit):
+        """Run one command, returns (response or None, seconds it keeps the DAQ busy)
+        """
+        header, _, arguments = unit.partition(" ")
+        query = header.endswith("?")
+        channels = []
+        found = CHANNEL_LIST_RE.search(arguments)
+        if found:
+            channels = expand_channels(found.group(1))
+            arguments = arguments[:found.start()] + arguments[found.end():]
+            bad = [channel for channel in channels if not valid_channel(self.model, channel)]
+            if bad:
+                self.add_error('-224,"Illegal parameter value"')
+                return None, 0.0
+        arguments = [argument.strip() for argument in ARGUMENT_RE.findall(arguments) if argument.strip()]
+        nodes = [short_form(node) for node in header.strip().lstrip(":").rstrip("?").split(":") if node]
+        if nodes and nodes[0] == "SENS":
+            nodes = nodes[1:]
+        if nodes[:2] == ["CONF", "VOLT"] and len(nodes) == 2:
+            nodes.append("DC")
+        path = ":".join(nodes)
+
+        if path.startswith("*"):
+            return self.common_command(path, query, arguments)
+        if path.startswith("CONF"):
+            if query:
+                return ",".join(self.channel_config(channel) for channel in channels), 0.0
+            return self.configure(path[5:], arguments, channels), 0.0
+        if path == "ROUT:SCAN":
+            if query:
+                return block("(%s)" % compress_channels(self.scan) if self.scan else "(@)"), 0.0
+            self.scan = channels
+            return None, 0.0
+        if path in self.settings:
+            if query:
+                return self.settings[path], 0.0
+            if arguments:
+                value = setting_value(arguments[0])
+                self.settings[path] = switch_value(value) if SCAN_DEFAULTS[path] in ("0", "1") else value
+            return None, 0.0
+        if channels:
+            return self.channel_setting(path, query, arguments, channels), 0.0
+        if path in ("READ", "INIT", "ABOR", "FETC", "R", "DATA:POIN", "DATA:REM"):
+            return self.scan_command(path, arguments)
+        if path == "SYST:ERR" and query:
+            return self.errors.popleft() if self.errors else '+0,"No error"', 0.0
+        if path in ("SYST:DATE", "SYST:TIME"):
+            return self.clock_command(path, query, arguments), 0.0
+        if path in ("SYST:LOC", "SYST:REM", "SYST:RWL") and not query:
+            return None, 0.0
+        if path == "MEM:STAT:NAME":
+            slot = arguments[0] if arguments else "1"
+            if query:
+                return '"%s"' % self.state_names.get(slot, ""), 0.0
+            if len(arguments) > 1:
+                self.state_names[slot] = arguments[1].strip("'\"")
+            return None, 0.0
+        self.add_error('-113,"Undefined header"')
+        return None, 0.0
+
+    def common_command(self, path, query, arguments):
+        if path == "*IDN" and query:
+            return "Agilent Technologies,%s,%s,%s" % (self.model, self.serial_number, FIRMWARE[self.model]), 0.0
+        if path == "*OPC" and query:
+            # Like the DAQ the answer waits for a running scan to finish, forever for an INFinity scan
+            return "1", self.scan_remaining()
+        if path == "*RST":
+            self.reset()
+            return None, 0.2
+        if path == "*CLS":
+            self.errors.clear()
+            return None, 0.0
+        if path in ("*SAV", "*RCL") and arguments:
+            slot = arguments[0]
+            if path == "*SAV":
+                self.states[slot] = copy.deepcopy([self.channels, self.scan, self.settings])
+                return None, 0.05
+            if slot not in self.states:
+                self.add_error('-221,"Settings conflict"')
+                return None, 0.0
+            self.channels, self.scan, self.settings = copy.deepcopy(self.states[slot])
+            return None, 0.1
+        if path in ("*OPC", "*ESE", "*SRE", "*WAI", "*TRG"):
+            return None, 0.0
+        self.add_error('-113,"Undefined header"')
+        return None, 0.0
+
+    def configure(self, function, arguments, channels):
+        """CONFigure:<function> puts every other setting of the channels back to its default
+        """
+        if function not in ("TEMP", "VOLT:DC", "FREQ"):
+            self.add_error('-113,"Undefined header"')
+            return None
+        if function == "TEMP" and len(arguments) < 2:
+            self.add_error('-109,"Missing parameter"')
+            return None
+        for channel in channels:
+            self.channels[channel] = dict(CHANNEL_DEFAULTS, function=function, arguments=arguments)
+        return None
+
+    def channel_config(self, channel):
+        """A channel's answer to CONFigure?, "TEMP TC,T,+1.000000E+00,+1.000000E-01"
+        """
+        config = self.channels.get(channel)
+        if not config:
+            return '"VOLT +1.000000E+01,+3.000000E-06"'
+        arguments = config["arguments"]
+        if config["function"] == "TEMP":
+            return '"TEMP %s,%s,+1.000000E+00,+1.000000E-01"' % (short_form(arguments[0]), short_form(arguments[1]))
+        level = setting_number(arguments[0], 10.0) if arguments else 10.0
+        return '"%s %+.6E,+3.000000E-06"' % (config["function"].split(":")[0], level)
+
+    def channel_setting(self, path, query, arguments, channels):
+        """Set or query a per channel setting, answers list every channel in order
+        """
+        if query:
+            if path not in CHANNEL_DEFAULTS:
+                self.add_error('-113,"Undefined header"')
+                return None
+            return ",".join(self.channels.get(channel, CHANNEL_DEFAULTS).get(path, CHANNEL_DEFAULTS[path])
+                            for channel in channels)
+        if not arguments:
+            self.add_error('-109,"Missing parameter"')
+            return None
+        value = setting_value(arguments[0])
+        if CHANNEL_DEFAULTS.get(path) in ("0", "1"):
+            value = switch_value(value)
+        for channel in channels:
+            self.channels.setdefault(channel, dict(CHANNEL_DEFAULTS, function="VOLT:DC", arguments=[]))[path] = value
+        return None
+
+    def clock_command(self, path, query, arguments):
+        now = time.localtime(self.now())
+        if query:
+            if path == "SYST:DATE":
+                return "%+05d,%+03d,%+03d" % now[0:3]
+            return "%+03d,%+03d,%+06.3f" % (now[3], now[4], now[5])
+        try:
+            fields = [int(float(argument)) for argument in arguments[:3]]
+            if path == "SYST:DATE":
+                wanted = time.mktime((fields[0], fields[1], fields[2]) + now[3:6] + (0, 0, -1))
+            else:
+                wanted = time.mktime(now[0:3] + (fields[0], fields[1], fields[2]) + (0, 0, -1))
+        except (ValueError, IndexError, OverflowError):
+            self.add_error('-224,"Illegal parameter value"')
+            return None
+        self.clock_offset += wanted - time.mktime(now)
+        return None
+
+    def channel_time(self, channel):
+        """Seconds to measure one channel, its integration time plus the switch delay
+        """
+        config = self.channels.get(channel, CHANNEL_DEFAULTS)
+        function = config.get("function", "VOLT:DC")
+        if function == "FREQ":
+            integration = setting_number(config.get("FREQ:APER", "0.1"), 0.1)
+        else:
+            integration = setting_number(config.get(function + ":NPLC", "1"), 1.0) / LINE_FREQUENCY
+        return integration + self.profile.channel_delay
+
+    def sweep_time(self):
+        return sum(self.channel_time(channel) for channel in self.scan)
+
+    def reading_value(self, channel, at):
+        """Synthetic reading of a channel at DAQ time at, scaled when scaling is on
+        """
+        profile = self.profile
+        if profile.overload_rate and self.random.random() < profile.overload_rate:
+            return OVERLOAD
+        config = self.channels.get(channel, CHANNEL_DEFAULTS)
+        function = config.get("function", "VOLT:DC")
+        level, swing, noise = SIGNAL_LEVELS[function]
+        if profile.signal == "sine":
+            value = level + swing * math.sin(2 * math.pi * at / 600.0 + channel)
+        elif profile.signal == "walk":
+            value = self.walk.get(channel, level) + self.random.gauss(0.0, swing * 0.01)
+            self.walk[channel] = value
+        else:
+            value = level
+        value += self.random.gauss(0.0, noise * profile.noise)
+        if function == "TEMP":
+            units = config.get("UNIT:TEMP", "C")
+            if units == "F":
+                value = value * 9.0 / 5.0 + 32.0
+            elif units == "K":
+                value = value + 273.15
+        if config.get("CALC:SCAL:STAT") == "1":
+            value = (setting_number(config.get("CALC:SCAL:GAIN", "1"), 1.0) * value +
+                     setting_number(config.get("CALC:SCAL:OFFS", "0"), 0.0))
+        return "%+.8E" % value
+
+    def sweep(self, start):
+        """Readings of one sweep of the scan list starting at DAQ time start, formatted per FORMat:READing
+        """
+        scale = self.profile.time_scale
+        readings = []
+        at = start
+        for channel in self.scan:
+            reading = self.reading_value(channel, at)
+            if self.settings["FORM:READ:UNIT"] == "1" and reading != OVERLOAD:
+                reading = reading + " " + self.unit_suffix(channel)
+            fields = [reading]
+            if self.settings["FORM:READ:TIME"] == "1":
+                if self.settings["FORM:READ:TIME:TYPE"] == "REL":
+                    fields.append("%013.3f" % (at - self.scan_start))
+                else:
+                    local = time.localtime(at)
+                    fields.append("%04d,%02d,%02d,%02d,%02d,%06.3f" %
+                                  (local[0], local[1], local[2], local[3], local[4], local[5] + at % 1))
+            if self.settings["FORM:READ:CHAN"] == "1":
+                fields.append("%d" % channel)
+            readings.append(",".join(fields))
+            at += self.channel_time(channel) * scale
+        self.stats["readings"] += len(readings)
+        return readings
+
+    def unit_suffix(self, channel):
+        config = self.channels.get(channel, CHANNEL_DEFAULTS)
+        if config.get("CALC:SCAL:STAT") == "1" and config.get("CALC:SCAL:UNIT", '""') != '""':
+            return config["CALC:SCAL:UNIT"].strip('"')
+        function = config.get("function", "VOLT:DC")
+        if function == "TEMP":
+            return config.get("UNIT:TEMP", "C")
+        return UNIT_SUFFIX[function]
+
+    def sweep_count(self):
+        count = setting_number(self.settings["TRIG:COUN"], 1.0)
+        return math.inf if count >= 9.9e37 else int(count)
+
+    def sweep_interval(self, sweep_time):
+        """Seconds from the start of one sweep of a buffered scan to the next
+        """
+        if self.settings["TRIG:SOUR"] == "TIM":
+            return max(setting_number(self.settings["TRIG:TIM"], 1.0), sweep_time, 1e-6)
+        return max(sweep_time, 1e-6)
+
+    def scan_remaining(self):
+        """Seconds until the running scan is done, before the time scale, math.inf for an INFinity scan
+        """
+        self.advance()
+        if not self.scanning:
+            return 0.0
+        count = self.sweep_count()
+        if count == math.inf:
+            return math.inf
+        sweep_time = self.sweep_time()
+        elapsed = (self.now() - self.scan_start) / max(self.profile.time_scale, 1e-6)
+        return max(0.0, (count - 1) * self.sweep_interval(sweep_time) + sweep_time - elapsed)
+
+    def advance(self):
+        """Put the sweeps a running buffered scan has finished by now into memory
+        Sweeps that would only be overwritten again are skipped.
+        """
+        if not self.scanning or not self.scan:
+            return
+        sweep_time = self.sweep_time()
+        interval = self.sweep_interval(sweep_time)
+        scale = max(self.profile.time_scale, 1e-6)
+        elapsed = (self.now() - self.scan_start) / scale
+        due = min(self.sweep_count(), int((elapsed - sweep_time) // interval) + 1 if elapsed >= sweep_time else 0)
+        sweeps_kept = self.memory.maxlen // len(self.scan) + 1
+        first = max(self.sweeps_done, due - sweeps_kept)
+        for sweep_number in range(first, due):
+            self.memory.extend(self.sweep(self.scan_start + sweep_number * interval * scale))
+        self.sweeps_done = max(self.sweeps_done, due)
+        if self.sweeps_done >= self.sweep_count():
+            self.scanning = False
+
+    def scan_command(self, path, arguments):
+        """:READ?, INITiate, ABORt and taking readings out of memory
+        """
+        if path == "READ":
+            count = self.sweep_count()
+            if count == math.inf or not self.scan:
+                self.add_error('-221,"Settings conflict"')
+                return None, 0.0
+            self.memory.clear()
+            self.scanning = False
+            self.scan_start = self.now()
+            readings = []
+            sweep_time = self.sweep_time()
+            interval = sweep_time
+            if self.settings["TRIG:SOUR"] == "TIM":
+                interval = max(setting_number(self.settings["TRIG:TIM"], 1.0), sweep_time)
+            for sweep_number in range(count):
+                readings.extend(self.sweep(self.scan_start + sweep_number * interval * self.profile.time_scale))
+            # execute() applies the time scale to the seconds returned
+            return ",".join(readings), (count - 1) * interval + sweep_time
+        if path == "INIT":
+            self.memory.clear()
+            self.scan_start = self.now()
+            self.sweeps_done = 0
+            self.scanning = True
+            return None, 0.0
+        if path == "ABOR":
+            self.advance()
+            self.scanning = False
+            return None, 0.0
+
+        self.advance()
+        if path == "DATA:POIN":
+            return "%+d" % len(self.memory), 0.0
+        if path == "FETC":
+            return ",".join(self.memory), 0.0
+        wanted = int(setting_number(arguments[0], 1.0)) if arguments else 1
+        if path == "DATA:REM" and wanted > len(self.memory):
+            self.add_error('-222,"Data out of range"')
+            return None, 0.0
+        taken = [self.memory.popleft() for _ in range(min(wanted, len(self.memory)))]
+        if path == "R":
+            return block(",".join(taken)), 0.0
+        return ",".join(taken), 0.0
+
+
+async def serve_daq(daq, reader, writer):
+    """Talk to one telnet session the way the DAQ does, one program message per line
+    """
+    daq.stats["connections"] += 1
+    writer.write(daq.banner().encode())
+    prompt = ("%s> " % daq.model).encode()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line or b"\x04" in line:
+                break
+            message = line.decode("ascii", errors="replace").strip()
+            if not message:
+                writer.write(prompt)
+                continue
+            response, delay, fault = daq.execute(message)
+            if fault:
+                break
+            if delay == math.inf:
+                # *OPC? on a scan that never finishes, the DAQ does not answer again until the session ends
+                while await reader.read(4096):
+                    pass
+                break
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if response is not None:
+                writer.write(response.encode() + b"\r\n")
+            writer.write(prompt)
+            await writer.drain()
+    except (ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+
+def simulator_addresses(count, host="127.0.0.1", port=5024, spread="ports"):
+    """Addresses for count DAQs, consecutive ports on host or consecutive hosts on port
+    """
+    if spread == "hosts":
+        first = [int(part) for part in host.split(".")]
+        base = (first[0] << 24) + (first[1] << 16) + (first[2] << 8) + first[3]
+        return [["%d.%d.%d.%d" % ((address >> 24) & 255, (address >> 16) & 255, (address >> 8) & 255, address & 255),
+                 port] for address in range(base, base + count)]
+    return [[host, port + i] for i in range(count)]
+
+
+def make_daqs(addresses, model="34980A", profile=None, seed=None):
+    """A SimulatedDAQ for every address, "mixed" alternates the 34972A and 34980A
+    """
+    daqs = []
+    for i, address in enumerate(addresses):
+        if model == "mixed":
+            daq_model = MODELS[i % len(MODELS)]
+        else:
+            daq_model = model
+        daqs.append(SimulatedDAQ(daq_model, "SIM%05d" % (i + 1), profile,
+                                 None if seed is None else seed + i))
+    return daqs
+
+
+async def start_servers(addresses, daqs):
+    """Start listening for every DAQ, returns the asyncio servers
+    """
+    servers = []
+    for (host, port), daq in zip(addresses, daqs):
+        def handler(reader, writer, daq=daq):
+            return serve_daq(daq, reader, writer)
+        servers.append(await asyncio.start_server(handler, host, port))
+    return servers
+
+
+class SimulatorRack:
+    """Simulated DAQs served from a background thread with its own event loop
+    so blocking code such as DAQ_commands.py can be tested against them.
+    """
+    def __init__(self, addresses, model="34980A", profile=None, seed=None):
+        self.addresses = addresses
+        self.daqs = make_daqs(addresses, model, profile, seed)
+        self.loop = None
+        self.thread = None
+        self.servers = []
+
+    def start(self):
+        """Start the servers and return once every DAQ is listening
+        """
+        ready = threading.Event()
+        failed = []
+
+        def run():
+            self.loop = asyncio.new_event_loop()
+            try:
+                self.servers = self.loop.run_until_complete(start_servers(self.addresses, self.daqs))
+            except OSError as error:
+                failed.append(error)
+                ready.set()
+                self.loop.close()
+                return
+            ready.set()
+            self.loop.run_forever()
+            for server in self.servers:
+                server.close()
+            self.loop.run_until_complete(asyncio.sleep(0))
+            self.loop.close()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        ready.wait()
+        if failed:
+            raise failed[0]
+        return self
+
+    def stop(self):
+        if self.loop and self.thread and self.thread.is_alive():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+
+def write_config(file_name, addresses, daqs, channels_per_daq=20):
+    """Write a logger config file scanning channels_per_daq channels on every simulated DAQ
+    The channels cycle through thermocouples, DC volts and frequency like a real rack.
+    """
+    templates = [["TCouple", "T",  "1",   "4.5", "FALSE", "1",  "0", "C"],
+                 ["Volt",    "DC", "DEF", "DEF", "TRUE",  "1",  "0", "Vdc"],
+                 ["Freq",    "",   "10",  "4.5", "TRUE",  "15", "0", "RPM"]]
+    lines = ["# Simulated DAQs written by daq_simulator.py"]
+    for (host, port), daq in zip(addresses, daqs):
+        lines.append("")
+        lines.append("# DAQ %s %s" % (daq.model, daq.serial_number))
+        lines.append("Address: %s %d" % (host, port))
+        slot_size = 20 if daq.model == "34972A" else 40
+        first_channel = 101 if daq.model == "34972A" else 1001
+        for i in range(channels_per_daq):
+            channel = first_channel + (i // slot_size) * (first_channel - 1) + i % slot_size
+            lines.append(", ".join(["%d" % channel, '"sim %d"' % channel] + templates[i % len(templates)]))
+    with open(file_name, 'w') as config_file:
+        config_file.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulated Keysight 34972A/34980A DAQs on the telnet port")
+    parser.add_argument("--count", type=int, default=1, help="number of DAQs")
+    parser.add_argument("--host", default="127.0.0.1", help="address of the first DAQ")
+    parser.add_argument("--port", type=int, default=5024, help="port of the first DAQ")
+    parser.add_argument("--spread", choices=("ports", "hosts"), default="ports",
+                        help="give each DAQ its own port or its own loopback address")
+    parser.add_argument("--model", choices=MODELS + ("mixed",), default="34980A")
+    parser.add_argument("--command-latency", type=float, default=0.002, help="seconds per command")
+    parser.add_argument("--channel-delay", type=float, default=0.001, help="switch delay per scanned channel")
+    parser.add_argument("--time-scale", type=float, default=1.0, help="multiplies every simulated delay")
+    parser.add_argument("--signal", choices=SIGNALS, default="sine")
+    parser.add_argument("--noise", type=float, default=1.0, help="multiplies the reading noise")
+    parser.add_argument("--drop-rate", type=float, default=0.0, help="chance a message drops the session")
+    parser.add_argument("--power-cycle-rate", type=float, default=0.0,
+                        help="chance a message power cycles the DAQ, losing its setup")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="chance a message stalls")
+    parser.add_argument("--stall-time", type=float, default=10.0, help="seconds a stall lasts")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="chance a command queues an error")
+    parser.add_argument("--overload-rate", type=float, default=0.0, help="chance a reading is an overload")
+    parser.add_argument("--seed", type=int, default=None, help="seed for repeatable readings and faults")
+    parser.add_argument("--write-config", metavar="FILE", help="write a logger config file for the DAQs")
+    parser.add_argument("--channels", type=int, default=20, help="channels per DAQ in the config file")
+    options = parser.parse_args()
+
+    profile = SimulatorProfile(options.command_latency, options.channel_delay, options.time_scale,
+                               options.signal, options.noise, options.drop_rate, options.power_cycle_rate,
+                               options.stall_rate, options.stall_time, options.error_rate,
+                               options.overload_rate)
+    addresses = simulator_addresses(options.count, options.host, options.port, options.spread)
+    daqs = make_daqs(addresses, options.model, profile, options.seed)
+    if options.write_config:
+        write_config(options.write_config, addresses, daqs, options.channels)
+        print("Wrote %s" % options.write_config)
+
+    async def serve():
+        servers = await start_servers(addresses, daqs)
+        print("%d simulated DAQs on %s %d to %s %d" % (len(servers), addresses[0][0], addresses[0][1],
+                                                       addresses[-1][0], addresses[-1][1]))
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    except OSError as error:
+        print("Could not start the simulator: %s" % error)
+        sys.exit(1)
+    finally:
+        totals = {}
+        for daq in daqs:
+            for name, count in daq.stats.items():
+                totals[name] = totals.get(name, 0) + count
+        print(", ".join("%d %s" % (count, name) for name, count in totals.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Warm startup from a configuration saved on the DAQ. After a full setup
+    the DAQ state is stored in a numbered slot with *SAV and the slot is
+    named after the config fingerprint. A small cache file on the host
+    remembers which configuration each DAQ serial number holds.
+
+    On the next start with the same config on the same DAQ the state comes
+    back with *RCL instead of *RST and every channel command. The recalled
+    scan list and channel setup are read back and compared, any mismatch
+    falls back to the full configuration.
+
+Usage:
+    cache = load_state_cache("daq_state_cache.json")
+    chan_numbers = warm_start(daq_conn, cache, serial_number, fingerprint)
+    if not chan_numbers:
+        chan_numbers = full_setup(daq_conn)
+        remember_state(daq_conn, cache, serial_number, fingerprint, chan_numbers)
+        save_state_cache("daq_state_cache.json", cache)
+"""
+
+import json
+import DAQ_commands as DAQ_cmd
+
+# Stored state slot, the 34972A and 34980A both have slots 1 to 5
+STATE_SLOT = 5
+
+
+def state_name(fingerprint):
+    """Name for the state slot, up to 12 characters starting with a letter
+    """
+    return "L" + fingerprint[:11].upper()
+
+
+def load_state_cache(file_name):
+    """Read the cache of DAQ states, an empty cache if there is none yet
+    """
+    try:
+        with open(file_name, 'r') as cache_file:
+            return json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state_cache(file_name, cache):
+    try:
+        with open(file_name, 'w') as cache_file:
+            json.dump(cache, cache_file, indent=1)
+    except OSError:
+        print("Could not write the DAQ state cache %s" % file_name)
+        return False
+    return True
+
+
+def warm_start(daq_conn, cache, serial_number, fingerprint):
+    """Recall our configuration from the DAQ state slot
+    Returns the scan list if the DAQ holds the state for this fingerprint and
+    it checks out after *RCL, False if the DAQ needs a full setup.
+    """
+    entry = cache.get(serial_number)
+    if not entry or entry["fingerprint"] != fingerprint:
+        return False
+    slot = entry["slot"]
+    name = DAQ_cmd.query_daq(daq_conn, ":MEMory:STATe:NAME? %d" % slot)
+    if not name or name.strip('"') != state_name(fingerprint):
+        print("DAQ state %d is not ours, configuring from scratch" % slot)
+        return False
+    if not DAQ_cmd.wait_for_opc(daq_conn, "*RCL %d" % slot, DAQ_cmd.RESET_TIMEOUT):
+        print("Could not recall DAQ state %d" % slot)
+        return False
+    config_state = DAQ_cmd.daq_config_state(daq_conn, entry["chan_numbers"])
+    if config_state != entry["config_state"]:
+        print("Recalled DAQ state %d does not match the config, configuring from scratch" % slot)
+        return False
+    print("Recalled DAQ state %d" % slot)
+    return entry["chan_numbers"]
+
+
+def remember_state(daq_conn, cache, serial_number, fingerprint, chan_numbers, slot=STATE_SLOT):
+    """Save the configured DAQ state in slot and note it in the cache
+    """
+    config_state = DAQ_cmd.daq_config_state(daq_conn, chan_numbers)
+    if not config_state:
+        return False
+    errors = DAQ_cmd.execute_daq_batches(daq_conn, [["*SAV %d" % slot, "DAQ"],
+                                                    [":MEMory:STATe:NAME %d,\"%s\"" % (slot, state_name(fingerprint)), "DAQ"]])
+    if errors:
+        cache.pop(serial_number, None)
+        return False
+    cache[serial_number] = {"fingerprint": fingerprint,
+                            "slot": slot,
+                            "chan_numbers": chan_numbers,
+                            "config_state": config_state}
+    return True
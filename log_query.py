@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Pull a time window and a few channels out of a CSV log without reading
+    the whole file. A sparse index of the byte offset and timestamp of every
+    INDEX_LINES-th line is kept next to the log, logs/test.csv.idx, the
+    window is found by binary search in it and only the lines from there to
+    the end of the window are read and parsed.
+
+    The index remembers how far into the log it reaches. A later query on a
+    log that is still being written indexes only the lines added since, a
+    log that was replaced or cut short is indexed again from the start.
+
+    A log rotated by log_rotation.py is queried as one log. Segments outside
+    the window are skipped by the spans in the manifest, the segment still
+    being written is indexed like any log and a compressed segment is read
+    through, compressed files cannot be seeked into.
+
+    Sweeps are written in time order, the index relies on that. In a log of
+    several DAQs the lines start with "<ip> <port>, " and --daq picks one.
+
+Usage:
+    titles, rows = query_log("logs/test.csv", start, end, ["101", "Fan Voltage"])
+    for timestamp, values in rows:
+        ...
+
+    ./log_query.py logs/mytest2.csv --start "12/06/2019 15:59:30" --end "12/06/2019 16:59:30" -c 101 -c 104
+    ./log_query.py logs/run.csv --daq "10.0.0.5 5024" --start 2019-12-06T16:00 --output window.csv
+"""
+
+import argparse
+import bisect
+import itertools
+import json
+import os
+import sys
+import time
+import binary_log
+import log_rotation
+
+# Lines between index entries
+INDEX_LINES = 256
+# Bytes at the start of a log kept in its index to notice the file was replaced
+INDEX_HEAD_BYTES = 256
+# Lines read looking for the header of a compressed segment, every DAQ has its header near the start
+HEADER_SEARCH_LINES = 1000
+# Formats accepted for --start and --end besides seconds since the epoch
+TIME_FORMATS = (binary_log.CSV_DATESTAMP, "%Y-%m-%dT%H:%M:%S", "%Y-%m-%dT%H:%M", "%Y-%m-%d %H:%M:%S",
+                "%Y-%m-%d %H:%M", "%Y-%m-%d")
+
+
+def index_name(csv_file_name):
+    """logs/test.csv -> logs/test.csv.idx
+    """
+    return str(csv_file_name) + ".idx"
+
+
+class DatestampParser:
+    """Turns "12/06/2019 15:59:24" into seconds since the epoch
+    time.strptime is slow, the minute is parsed once and the seconds added to it.
+    """
+    def __init__(self):
+        self.minute = None
+        self.minute_start = None
+
+    def __call__(self, datestamp):
+        minute = datestamp[:16]
+        if minute != self.minute:
+            self.minute_start = time.mktime(time.strptime(minute, binary_log.CSV_DATESTAMP[:-3]))
+            self.minute = minute
+        return self.minute_start + int(datestamp[17:19])
+
+
+def split_line(line):
+    """Split a log line into (daq, fields), daq is None in a log of one DAQ
+    The datestamp always has a "/", the "<ip> <port>" in front of it never does.
+    """
+    fields = [field.strip() for field in line.rstrip("\r\n").split(",")]
+    if fields and not fields[-1]:
+        fields.pop()
+    if len(fields) > 1 and "/" not in fields[0] and fields[0] != "Date Time":
+        return fields[0], fields[1:]
+    return None, fields
+
+
+class LogIndex:
+    """Sparse index of one CSV log file: [timestamp, offset] every INDEX_LINES lines
+    Also keeps the header of each DAQ in the log, by "<ip> <port>" or "" for a log of one DAQ,
+    lines counts the sweep lines indexed so far.
+    """
+    def __init__(self, csv_file_name):
+        self.csv_file_name = str(csv_file_name)
+        self.file_name = index_name(csv_file_name)
+        self.clear()
+
+    def clear(self):
+        self.entries = []
+        self.titles = {}
+        self.size = 0
+        self.lines = 0
+        self.head = ""
+
+    def load(self):
+        """Read the saved index, an index that does not match the log is dropped
+        """
+        try:
+            with open(self.file_name, 'r') as index_file:
+                saved = json.load(index_file)
+        except (OSError, ValueError):
+            return
+        if saved.get("lines_per_entry") != INDEX_LINES:
+            return
+        self.entries = saved["entries"]
+        self.titles = saved["titles"]
+        self.size = saved["size"]
+        self.lines = saved["lines"]
+        self.head = saved["head"]
+
+    def save(self):
+        temporary = self.file_name + ".tmp"
+        try:
+            with open(temporary, 'w') as index_file:
+                json.dump({"lines_per_entry": INDEX_LINES, "size": self.size, "lines": self.lines,
+                           "head": self.head, "titles": self.titles, "entries": self.entries}, index_file)
+            os.replace(temporary, self.file_name)
+        except OSError as error:
+            print("Cannot save the index %s: %s" % (self.file_name, error), file=sys.stderr)
+
+    def update(self):
+        """Bring the index up to the end of the log, returns the number of lines added
+        Only whole lines are indexed, a line still being written is left for the next update.
+        """
+        self.load()
+        with open(self.csv_file_name, 'rb') as csv_file:
+            head = csv_file.read(INDEX_HEAD_BYTES).decode("utf-8", "replace")
+            size = os.fstat(csv_file.fileno()).st_size
+            if size < self.size or head[:len(self.head)] != self.head:
+                self.clear()
+            if size == self.size:
+                return 0
+            if len(self.head) < INDEX_HEAD_BYTES:
+                self.head = head
+            parse = DatestampParser()
+            added = 0
+            offset = self.size
+            csv_file.seek(offset)
+            for line in csv_file:
+                if not line.endswith(b"\n"):
+                    break
+                if b"Date Time" in line[:40]:
+                    daq, fields = split_line(line.decode("utf-8", "replace"))
+                    self.titles[daq or ""] = fields[1:]
+                elif self.lines % INDEX_LINES:
+                    self.lines += 1
+                else:
+                    daq, fields = split_line(line.decode("utf-8", "replace"))
+                    try:
+                        self.entries.append([parse(fields[0]), offset])
+                        self.lines += 1
+                    except (ValueError, IndexError):
+                        # Not a sweep, index the next line instead
+                        pass
+                added += 1
+                offset += len(line)
+            self.size = offset
+        self.save()
+        return added
+
+    def offset_before(self, start):
+        """Offset of an index entry at or before the first line of start or later, 0 for the start of the file
+        """
+        if start is None:
+            return 0
+        position = bisect.bisect_left([entry[0] for entry in self.entries], start) - 1
+        if position < 0:
+            return 0
+        return self.entries[position][1]
+
+
+def parse_time(text):
+    """Seconds since the epoch from a --start or --end argument, local time
+    """
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for time_format in TIME_FORMATS:
+        try:
+            return time.mktime(time.strptime(text, time_format))
+        except ValueError:
+            continue
+    raise ValueError("Cannot read the time %r, use \"MM/DD/YYYY HH:MM:SS\" or \"YYYY-MM-DDTHH:MM:SS\"" % text)
+
+
+def column_positions(titles, columns):
+    """Positions in titles of the columns asked for by channel number, name or the whole title
+    All of them for None.
+    """
+    if columns is None:
+        return list(range(len(titles)))
+    positions = []
+    for wanted in columns:
+        for position, title in enumerate(titles):
+            channel, name, units = binary_log.CSV_COLUMN_RE.match(title).groups()
+            if str(wanted) in (title, name, channel):
+                positions.append(position)
+                break
+        else:
+            raise KeyError("No column %s in the log, it has: %s" % (wanted, ", ".join(titles)))
+    return positions
+
+
+def read_lines(lines, daq, start, end, parse):
+    """(timestamp, fields) of the sweep lines from start to end, stops at the first line after end
+    """
+    for line in lines:
+        line_daq, fields = split_line(line)
+        if line_daq != daq or not fields or fields[0] == "Date Time":
+            continue
+        try:
+            timestamp = parse(fields[0])
+        except (ValueError, IndexError):
+            continue
+        if start is not None and timestamp < start:
+            continue
+        if end is not None and timestamp > end:
+            return
+        yield timestamp, fields[1:]
+
+
+def segment_lines(segment, start):
+    """One file of a log opened at the index entry before start, a compressed segment at its start
+    """
+    if log_rotation.compression_of(segment):
+        # The index kept while the segment was written no longer has a log to go with
+        stale = index_name(os.path.splitext(segment)[0])
+        if os.path.isfile(stale):
+            os.remove(stale)
+        return log_rotation.open_segment(segment, 'rt')
+    index = LogIndex(segment)
+    index.update()
+    segment_file = open(segment, 'r')
+    segment_file.seek(index.offset_before(start))
+    return segment_file
+
+
+def query_log(csv_file_name, start=None, end=None, columns=None, daq=None, titles=None):
+    """Sweeps of a CSV log, rotated or not, from start to end (seconds since the epoch, None for no limit)
+    columns picks channels by number, name or header title, titles names the columns of a log
+    without a header. Returns (titles of the columns, iterator of (timestamp, [values])).
+    Raises KeyError for a column the log does not have.
+    """
+    segments = log_rotation.segment_files(csv_file_name)
+    entries = log_rotation.segment_entries(csv_file_name)
+    if entries is not None:
+        # Skip the segments the manifest says end before start or begin after end
+        segments = [entry["file"] for entry in entries
+                    if not (start is not None and entry["last"] is not None and entry["last"] < start)
+                    and not (end is not None and entry["first"] is not None and entry["first"] > end)]
+    if titles is None:
+        titles = header_titles(csv_file_name, daq)
+    if titles is None:
+        if columns is not None:
+            raise KeyError("%s has no header, the config file it was logged with is needed" % csv_file_name)
+        positions = None
+    else:
+        positions = column_positions(titles, columns)
+        titles = [titles[position] for position in positions]
+
+    def rows():
+        parse = DatestampParser()
+        for segment in segments:
+            with segment_lines(segment, start) as lines:
+                for timestamp, values in read_lines(lines, daq, start, end, parse):
+                    if positions is not None:
+                        values = [values[position] if position < len(values) else "" for position in positions]
+                    yield timestamp, values
+    return titles, rows()
+
+
+def header_titles(csv_file_name, daq=None):
+    """Column titles from the header of a log, None for a log without a header
+    """
+    for segment in log_rotation.segment_files(csv_file_name)[:1]:
+        if log_rotation.compression_of(segment):
+            with log_rotation.open_segment(segment, 'rt') as segment_file:
+                for line in itertools.islice(segment_file, HEADER_SEARCH_LINES):
+                    line_daq, fields = split_line(line)
+                    if fields and fields[0] == "Date Time" and line_daq == daq:
+                        return fields[1:]
+            return None
+        index = LogIndex(segment)
+        index.update()
+        return index.titles.get(daq or "")
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print a time window of a CSV log, using a cached index of the log")
+    parser.add_argument("log_file", help="CSV log, the name it was started with for a rotated log")
+    parser.add_argument("--start", help="first time, \"MM/DD/YYYY HH:MM:SS\", \"YYYY-MM-DDTHH:MM\" or epoch seconds")
+    parser.add_argument("--end", help="last time, same formats as --start")
+    parser.add_argument("-c", "--column", action="append", dest="columns",
+                        help="channel number, name or header title, repeat for more, all columns without it")
+    parser.add_argument("--daq", help="'<ip> <port>' of the DAQ to take from a log of several")
+    parser.add_argument("--config", help="config file the log was taken with, for a log without a header")
+    parser.add_argument("--output", help="CSV file to write, the screen without it")
+    options = parser.parse_args()
+
+    if not log_rotation.log_exists(options.log_file):
+        print("%s does not exist" % options.log_file)
+        sys.exit(1)
+    try:
+        start = parse_time(options.start) if options.start else None
+        end = parse_time(options.end) if options.end else None
+    except ValueError as error:
+        print(error)
+        sys.exit(1)
+    titles = None
+    if options.config:
+        import handle_config_file
+        import parse_config_file as pcf
+        with open(options.config, 'r') as config_file:
+            sensor_list, error_list = pcf.parse_config_file(handle_config_file.file_to_list(config_file))
+        sensors = sensor_list
+        for ip_addr, ip_port, daq_sensors in pcf.split_by_daq(sensor_list):
+            if "%s %s" % (ip_addr, ip_port) == options.daq:
+                sensors = daq_sensors
+        titles = [binary_log.column_title(column) for column in binary_log.schema_from_sensors(sensors)]
+    try:
+        titles, rows = query_log(options.log_file, start, end, options.columns, options.daq, titles)
+    except KeyError as error:
+        print(error.args[0])
+        sys.exit(1)
+
+    output = open(options.output, 'w') if options.output else sys.stdout
+    try:
+        if titles is not None:
+            output.write("Date Time, %s, \n" % ", ".join(titles))
+        count = 0
+        for timestamp, values in rows:
+            output.write("%s, %s, \n" % (time.strftime(binary_log.CSV_DATESTAMP, time.localtime(timestamp)),
+                                         ", ".join(values)))
+            count += 1
+    except BrokenPipeError:
+        sys.exit(0)
+    finally:
+        if options.output:
+            output.close()
+    if options.output:
+        print("%d sweeps written to %s" % (count, options.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Keep the min, mean and max of every channel over fixed periods of the
+    clock while the test runs, so reviews of a long soak test read a few
+    small files instead of the raw log. Each resolution goes to its own CSV
+    file next to the log: logs/test.csv with resolutions of 10, 60 and 3600
+    seconds gets logs/test.rollup_10s.csv, logs/test.rollup_1min.csv and
+    logs/test.rollup_1h.csv.
+
+    A sweep costs one pass over its channels per resolution, the readings are
+    converted to floats once for all of them. A line is written when its
+    period ends, the period still open is written when the log is closed.
+    Periods follow the local clock like log rotation, 3600 starts on the
+    hour. Overloads and readings that are not numbers are left out of the
+    statistics.
+
+    The rollup files have the layout of the CSV log: a header, then one line
+    per period, "<period start>, 101 min, 101 mean, 101 max, ..., sweeps, ".
+    A log of several DAQs starts each line with "<ip> <port>, ". log_query.py
+    and binary_log.py read them like any CSV log.
+
+Usage:
+    rollups = RollupSet("logs/test.csv", (10, 60, 3600), {None: sensors})
+    rollups.add(None, sweep)
+    rollups.flush()
+    rollups.close()
+"""
+
+import math
+import os
+import time
+import binary_log
+import log_rotation
+
+ROLLUP_STATS = ("min", "mean", "max")
+# The DAQ reads an overload as +/-9.9E+37, those readings are left out like ones that are not numbers
+OVERLOAD_READING = 9.9e37
+# Names of common resolutions for the file names, others are written in seconds
+RESOLUTION_NAMES = {60: "1min", 300: "5min", 900: "15min", 3600: "1h", 86400: "1d"}
+
+
+def resolution_name(seconds):
+    """10 -> "10s", 60 -> "1min", 3600 -> "1h"
+    """
+    return RESOLUTION_NAMES.get(seconds, "%ds" % seconds)
+
+
+def rollup_name(log_file_name, seconds):
+    """File of one resolution of a log, logs/test.csv -> logs/test.rollup_1min.csv
+    """
+    stem, suffix = os.path.splitext(str(log_file_name))
+    return "%s.rollup_%s.csv" % (stem, resolution_name(seconds))
+
+
+def stat_title(column, stat):
+    """Header text of one statistic of a column, "101 Front Ambient min (C)"
+    """
+    title = ("%s %s" % (column["name"], stat)).strip()
+    if column["channel"] is not None:
+        title = "%d %s" % (column["channel"], title)
+    if column["units"]:
+        title = "%s (%s)" % (title, column["units"])
+    return title
+
+
+class Period:
+    """Running statistics of every column of one DAQ over one period
+    """
+    def __init__(self, number, start, columns):
+        self.number = number
+        self.start = start
+        self.sweeps = 0
+        self.counts = [0] * columns
+        self.totals = [0.0] * columns
+        self.lows = [math.inf] * columns
+        self.highs = [-math.inf] * columns
+
+    def add(self, values):
+        counts = self.counts
+        totals = self.totals
+        lows = self.lows
+        highs = self.highs
+        for position, value in enumerate(values):
+            if value != value:
+                continue
+            counts[position] += 1
+            totals[position] += value
+            if value < lows[position]:
+                lows[position] = value
+            if value > highs[position]:
+                highs[position] = value
+        self.sweeps += 1
+
+    def text(self):
+        """The period as a log line without the DAQ, "<period start>, min, mean, max, ..., sweeps, "
+        """
+        fields = [time.strftime(binary_log.CSV_DATESTAMP, time.localtime(self.start))]
+        for count, total, low, high in zip(self.counts, self.totals, self.lows, self.highs):
+            if count:
+                fields.extend((repr(low), repr(total / count), repr(high)))
+            else:
+                fields.extend(("nan", "nan", "nan"))
+        fields.append(str(self.sweeps))
+        return ", ".join(fields) + ", "
+
+
+class Rollup:
+    """One resolution of the rollups, its open period per DAQ and the lines waiting to be written
+    """
+    def __init__(self, file_name, seconds):
+        self.file_name = file_name
+        self.seconds = seconds
+        self.periods = {}
+        self.lines = []
+        self.rollup_file = None
+
+    def add(self, daq, timestamp, values):
+        number = log_rotation.clock_period(timestamp, self.seconds)
+        period = self.periods.get(daq)
+        if period is None or period.number != number:
+            if period is not None:
+                self.finish(daq, period)
+            # The start of the period on the local clock
+            start = timestamp - (timestamp + time.localtime(timestamp).tm_gmtoff) % self.seconds
+            period = self.periods[daq] = Period(number, start, len(values))
+        period.add(values)
+
+    def finish(self, daq, period):
+        text = period.text()
+        self.lines.append(text if daq is None else "%s, %s" % (daq, text))
+
+    def write(self, sync=False):
+        """Write the lines of the finished periods so readers see them at once
+        """
+        if not self.lines:
+            return
+        if self.rollup_file is None:
+            self.rollup_file = open(self.file_name, 'w')
+        self.rollup_file.write("\n".join(self.lines) + "\n")
+        self.lines = []
+        self.rollup_file.flush()
+        if sync:
+            os.fsync(self.rollup_file.fileno())
+
+    def close(self):
+        for daq, period in self.periods.items():
+            self.finish(daq, period)
+        self.periods = {}
+        self.write(sync=True)
+        if self.rollup_file is not None:
+            self.rollup_file.close()
+
+
+class RollupSet:
+    """The rollups of a log at each resolution in seconds
+    The columns of each DAQ come from its first sweep, names and units from sensors_by_daq.
+    """
+    def __init__(self, log_file_name, resolutions, sensors_by_daq):
+        self.sensors_by_daq = sensors_by_daq
+        self.rollups = [Rollup(rollup_name(log_file_name, seconds), int(seconds)) for seconds in resolutions]
+        self.columns = {}
+
+    def add(self, daq, sweep):
+        """Add a [timestamp, channels, values] sweep to every resolution
+        """
+        if daq not in self.columns:
+            columns = binary_log.schema_from_sensors(self.sensors_by_daq.get(daq, []), sweep[1])
+            self.columns[daq] = len(columns)
+            header = "Date Time, %s, Sweeps, " % ", ".join(stat_title(column, stat) for column in columns
+                                                          for stat in ROLLUP_STATS)
+            for rollup in self.rollups:
+                rollup.lines.append(header if daq is None else "%s, %s" % (daq, header))
+        values = []
+        for value in sweep[2][:self.columns[daq]]:
+            value = binary_log.to_float(value)
+            values.append(value if abs(value) < OVERLOAD_READING else math.nan)
+        for rollup in self.rollups:
+            rollup.add(daq, sweep[0], values)
+
+    def flush(self, sync=False):
+        for rollup in self.rollups:
+            rollup.write(sync)
+
+    def close(self):
+        """Write the periods still open and close the files
+        """
+        for rollup in self.rollups:
+            rollup.close()
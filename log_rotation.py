@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Split a long test log into segments and compress the finished ones while
+    the test runs. logs/test.csv rotated becomes logs/test.0001.csv,
+    logs/test.0002.csv ... and a manifest, logs/test.manifest.json, that
+    lists every segment in order with its time span, sweep count and
+    compression. Finished segments are compressed with gzip or lzma by a
+    background thread, the manifest follows each segment to its new name.
+
+    Readers give the name the log was started with. segment_files() returns
+    the segments of a rotated log in order, or the file itself when the log
+    was not rotated, and open_segment() opens any of them compressed or not,
+    so a rotated set reads as one log.
+
+Usage:
+    manifest = Manifest("logs/test.csv", "csv")
+    compressor = SegmentCompressor(manifest, "gzip")
+    compressor.compress(entry)
+    compressor.close()
+
+    for segment in segment_files("logs/test.csv"):
+        with open_segment(segment, 'rt') as log_file:
+            ...
+"""
+
+import gzip
+import json
+import lzma
+import os
+import queue
+import shutil
+import threading
+import time
+
+# Compression method: file suffix and how to open it
+COMPRESSIONS = {"gzip": (".gz", gzip.open), "lzma": (".xz", lzma.open)}
+
+
+def manifest_name(log_file_name):
+    """logs/test.csv -> logs/test.manifest.json
+    """
+    stem, suffix = os.path.splitext(str(log_file_name))
+    return stem + ".manifest.json"
+
+
+def segment_name(log_file_name, number):
+    """Segment number of a log, logs/test.csv -> logs/test.0001.csv
+    """
+    stem, suffix = os.path.splitext(str(log_file_name))
+    return "%s.%04d%s" % (stem, number, suffix)
+
+
+def clock_period(timestamp, seconds):
+    """Which period of that many seconds on the local clock a timestamp is in, 3600 changes on the hour
+    """
+    return int((timestamp + time.localtime(timestamp).tm_gmtoff) // seconds)
+
+
+def log_exists(log_file_name):
+    """True when a log of that name exists, as one file or as rotated segments
+    """
+    return os.path.isfile(str(log_file_name)) or os.path.isfile(manifest_name(log_file_name))
+
+
+def load_manifest(log_file_name):
+    """The manifest of a rotated log, None when the log was not rotated
+    """
+    try:
+        with open(manifest_name(log_file_name), 'r') as manifest_file:
+            return json.load(manifest_file)
+    except FileNotFoundError:
+        return None
+
+
+def segment_entries(log_file_name, daq=None):
+    """Manifest entries of the segments of one DAQ in order, None for a log that was not rotated
+    Paths in the entries are made relative to the current directory.
+    """
+    manifest = load_manifest(log_file_name)
+    if manifest is None:
+        return None
+    folder = os.path.dirname(manifest_name(log_file_name))
+    entries = []
+    for entry in manifest["segments"]:
+        if entry["daq"] == daq:
+            entry = dict(entry)
+            entry["file"] = os.path.join(folder, entry["file"])
+            entries.append(entry)
+    return entries
+
+
+def segment_files(log_file_name, daq=None):
+    """Files of a log in order, its segments when it was rotated
+    """
+    entries = segment_entries(log_file_name, daq)
+    if entries is None:
+        return [str(log_file_name)]
+    return [entry["file"] for entry in entries]
+
+
+def compression_of(file_name):
+    """Compression method of a segment going by its suffix, None when it is not compressed
+    """
+    for compression, (suffix, opener) in COMPRESSIONS.items():
+        if str(file_name).endswith(suffix):
+            return compression
+    return None
+
+
+def open_segment(file_name, mode='rb'):
+    """Open a log segment whether it was compressed or not
+    """
+    compression = compression_of(file_name)
+    if compression:
+        return COMPRESSIONS[compression][1](file_name, mode)
+    return open(file_name, mode)
+
+
+class Manifest:
+    """The segments of a rotated log, saved as JSON each time it changes
+    Segment entries are {"file", "daq", "first", "last", "sweeps", "bytes", "compression"},
+    first and last are the timestamps of the first and last sweep, None while the segment is written.
+    """
+    def __init__(self, log_file_name, log_format):
+        self.file_name = manifest_name(log_file_name)
+        self.folder = os.path.dirname(self.file_name)
+        self.lock = threading.Lock()
+        self.data = {"log": os.path.basename(str(log_file_name)), "format": log_format, "segments": []}
+        self.save()
+
+    def add(self, file_name, daq=None):
+        """Add a segment being written, returns its entry
+        """
+        entry = {"file": os.path.relpath(file_name, self.folder or "."), "daq": daq, "first": None, "last": None,
+                 "sweeps": 0, "bytes": 0, "compression": None}
+        with self.lock:
+            self.data["segments"].append(entry)
+        self.save()
+        return entry
+
+    def update(self, entry, **changes):
+        with self.lock:
+            entry.update(changes)
+        self.save()
+
+    def path(self, entry):
+        return os.path.join(self.folder, entry["file"])
+
+    def save(self):
+        """Write the manifest to a temporary file and move it into place so readers never see half of it
+        """
+        with self.lock:
+            temporary = self.file_name + ".tmp"
+            with open(temporary, 'w') as manifest_file:
+                json.dump(self.data, manifest_file, indent=1)
+            os.replace(temporary, self.file_name)
+
+
+class SegmentCompressor:
+    """Background thread that compresses finished segments one after the other
+    """
+    def __init__(self, manifest, compression="gzip"):
+        if compression not in COMPRESSIONS:
+            raise ValueError("Log compression must be one of: %s" % ", ".join(COMPRESSIONS))
+        self.manifest = manifest
+        self.compression = compression
+        self.queue = queue.Queue()
+        self.compressed = 0
+        self.thread = threading.Thread(target=self.run, name="log compressor", daemon=True)
+        self.thread.start()
+
+    def compress(self, entry):
+        """Queue the segment of a manifest entry for compression, never blocks
+        """
+        self.queue.put(entry)
+
+    def run(self):
+        suffix, opener = COMPRESSIONS[self.compression]
+        while True:
+            entry = self.queue.get()
+            if entry is None:
+                return
+            source = self.manifest.path(entry)
+            target = source + suffix
+            try:
+                with open(source, 'rb') as segment, opener(target + ".tmp", 'wb') as compressed:
+                    shutil.copyfileobj(segment, compressed, 1024 * 1024)
+                os.replace(target + ".tmp", target)
+            except OSError as error:
+                print("Cannot compress the log segment %s: %s" % (source, error))
+                continue
+            self.manifest.update(entry, file=entry["file"] + suffix, compression=self.compression,
+                                 bytes=os.path.getsize(target))
+            os.remove(source)
+            self.compressed += 1
+
+    def close(self):
+        """Finish the segments still queued
+        """
+        self.queue.put(None)
+        self.thread.join()
@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Write the test log from a background thread so a slow disk never holds
+    up a sweep. The logger hands whole sweeps to put(), which only adds them
+    to a bounded queue. The writer thread takes everything waiting at once,
+    formats it and writes it with a single write call.
+
+    When the file is flushed and synced to disk is set by the durability policy:
+    "every-sweep" - after every write, each sweep is on disk before the next is taken
+    "every-N"     - after every sync_sweeps sweeps
+    "every-T"     - every sync_seconds seconds, also when no sweeps arrive
+
+    The first line of every DAQ's block is a header with the channel numbers,
+    names and units from its Sensor list. When the disk falls so far behind
+    that the queue is full new sweeps are dropped and counted, acquisition
+    never waits.
+
+    log_format "binary" writes the chunked binary log of binary_log.py
+    instead, one file per DAQ. Every sync rewrites the open chunk as the tail
+    of the file, the chunks stay binary_log.CHUNK_ROWS long whatever the
+    durability policy.
+
+    A log can be split into segments by size or by clock period, finished
+    segments are compressed in the background, see log_rotation.py.
+    Rollups of every channel at coarser resolutions are kept next to the log
+    by the same thread, see log_rollups.py.
+
+Usage:
+    log = LogWriter("logs/test.csv", {None: sensors}, "every-T", sync_seconds=1.0)
+    log.put(sweep)
+    log.close()
+    print(log.summary())
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import binary_log
+import log_rollups
+import log_rotation
+
+DURABILITY_POLICIES = ("every-sweep", "every-N", "every-T")
+LOG_FORMATS = ("csv", "binary")
+# Sweeps waiting for the disk before new sweeps are dropped
+QUEUE_SWEEPS = 10000
+# Sweeps written between checks of the segment size when rotating by size
+ROTATE_CHECK_SWEEPS = 100
+
+
+def sweep_to_text(sweep, datestamp=None):
+    """Format a [timestamp, channels, values] sweep as "datestamp, value, value, " for the screen and log file
+    """
+    timestamp, channels, values = sweep
+    if datestamp is None:
+        datestamp = time.strftime("%m/%d/%Y %H:%M:%S", time.localtime(timestamp))
+    text = "%s, " % datestamp
+    for value in values:
+        text = text + "%s, " % value
+    return text
+
+
+def log_header(channels, sensors, extra_columns=()):
+    """Header line for sweeps of channels, "Date Time, 101 Front Ambient (C), ... "
+    Names and units come from the Sensor list, a channel without a Sensor gets its number only.
+    """
+    by_channel = {}
+    for sensor in sensors:
+        if sensor.channel.isdigit():
+            by_channel[int(sensor.channel)] = sensor
+    text = "Date Time, "
+    for channel in channels:
+        sensor = by_channel.get(int(channel))
+        if sensor is None:
+            text = text + "%d, " % channel
+        else:
+            text = text + "%d %s (%s), " % (channel, sensor.name.strip('"'), sensor.sen_units)
+    for column in extra_columns:
+        text = text + "%s, " % column
+    return text
+
+
+class LogWriter:
+    """Background writer for one log file
+    sensors_by_daq maps the tag each line starts with to that DAQ's Sensor list,
+    {None: sensors} for a log of one DAQ whose lines are not tagged.
+    A binary log of several DAQs gets a file per DAQ, see binary_log.daq_log_name().
+    rotate_bytes and rotate_seconds start a new segment once the segment has
+    grown that big or a new period of the clock starts (3600 rotates on the
+    hour), see log_rotation.py. Finished segments are compressed with
+    compression, None keeps them as they are.
+    rollup_seconds lists the resolutions of the min/mean/max rollups kept
+    next to the log, see log_rollups.py.
+    """
+    def __init__(self, log_file_name, sensors_by_daq, durability="every-T", sync_sweeps=100, sync_seconds=1.0,
+                 queue_sweeps=QUEUE_SWEEPS, extra_columns=(), log_format="csv", rotate_bytes=0, rotate_seconds=0,
+                 compression=None, rollup_seconds=()):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError("Log durability must be one of: %s" % ", ".join(DURABILITY_POLICIES))
+        if log_format not in LOG_FORMATS:
+            raise ValueError("Log format must be one of: %s" % ", ".join(LOG_FORMATS))
+        self.log_file_name = log_file_name
+        self.log_format = log_format
+        self.sensors_by_daq = sensors_by_daq
+        self.durability = durability
+        self.sync_sweeps = max(1, int(sync_sweeps))
+        self.sync_seconds = float(sync_seconds)
+        self.extra_columns = list(extra_columns)
+        self.rotate_bytes = rotate_bytes
+        self.rotate_seconds = rotate_seconds
+        self.queue = queue.Queue(queue_sweeps)
+        self.headed = set()
+        self.written = 0
+        self.dropped = 0
+        self.syncs = 0
+        self.longest_sync = 0.0
+        self.failed = False
+        self.closed = False
+        # {tag: BinaryLogWriter}, opened on the first sweep of each DAQ
+        self.binary_logs = {}
+        self.log_file = None
+        self.manifest = None
+        self.compressor = None
+        if rotate_bytes or rotate_seconds:
+            self.manifest = log_rotation.Manifest(log_file_name, log_format)
+            if compression:
+                self.compressor = log_rotation.SegmentCompressor(self.manifest, compression)
+        self.rollups = None
+        if rollup_seconds:
+            self.rollups = log_rollups.RollupSet(log_file_name, rollup_seconds, sensors_by_daq)
+        self.segment = 0
+        self.open_segment()
+        if log_format == "csv":
+            self.open_csv()
+        self.thread = threading.Thread(target=self.run, name="log writer", daemon=True)
+        self.thread.start()
+        # Sweeps still queued are written when the logger exits any other way than close()
+        atexit.register(self.close)
+
+    def put(self, sweep, daq=None, extra=()):
+        """Queue a [timestamp, channels, values] sweep for the log, never blocks
+        extra holds the values of the extra columns. Returns False when the sweep was dropped.
+        """
+        try:
+            self.queue.put_nowait((daq, sweep, extra))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def run(self):
+        """Writer thread, take what is waiting, write it in one go and sync when the policy says so
+        """
+        unsynced = 0
+        last_sync = time.monotonic()
+        while True:
+            timeout = None
+            if self.durability == "every-T":
+                timeout = max(0.0, last_sync + self.sync_seconds - time.monotonic())
+            try:
+                items = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                items = []
+            # Everything else already waiting goes in the same write
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in items
+            items = [item for item in items if item is not None]
+            if items:
+                self.write(items)
+                unsynced += len(items)
+
+            now = time.monotonic()
+            if self.durability == "every-sweep":
+                due = unsynced > 0
+            elif self.durability == "every-N":
+                due = unsynced >= self.sync_sweeps
+            else:
+                due = now - last_sync >= self.sync_seconds
+            if (due or stop) and unsynced:
+                self.sync()
+                unsynced = 0
+            if due or stop:
+                last_sync = now
+            if stop:
+                return
+
+    def segment_file(self, daq=None):
+        """File the sweeps of a DAQ go to in the current segment
+        """
+        file_name = self.log_file_name
+        if self.log_format == "binary":
+            file_name = binary_log.daq_log_name(file_name, daq)
+        if self.manifest is not None:
+            file_name = log_rotation.segment_name(file_name, self.segment)
+        return file_name
+
+    def open_segment(self):
+        """Start the next segment, its files are opened with its first sweep
+        Every segment starts with its own headers.
+        """
+        self.segment += 1
+        self.segment_bytes = 0
+        self.segment_period = None
+        self.headed = set()
+        # {manifest key: [manifest entry, first timestamp, last timestamp, sweeps]}
+        self.segment_entries = {}
+        self.log_file = None
+
+    def open_csv(self):
+        file_name = self.segment_file()
+        self.log_file = open(file_name, 'w')
+        self.add_entry(None, file_name)
+
+    def add_entry(self, daq, file_name):
+        entry = self.manifest.add(file_name, daq) if self.manifest is not None else None
+        self.segment_entries[daq] = [entry, None, None, 0]
+
+    def close_segment(self):
+        """Sync and close the files of the segment, note their spans in the manifest and queue them for compression
+        """
+        self.sync()
+        if self.log_format == "binary":
+            for log in self.binary_logs.values():
+                log.close()
+            self.binary_logs = {}
+        elif self.log_file is not None:
+            self.log_file.close()
+        if self.manifest is None:
+            return
+        for entry, first, last, sweeps in self.segment_entries.values():
+            self.manifest.update(entry, first=first, last=last, sweeps=sweeps,
+                                 bytes=os.path.getsize(self.manifest.path(entry)))
+            if self.compressor is not None:
+                self.compressor.compress(entry)
+
+    def rotate(self):
+        try:
+            self.close_segment()
+            self.open_segment()
+        except (OSError, ValueError) as error:
+            print("Cannot start a new segment of the log %s, logging stopped: %s" % (self.log_file_name, error))
+            self.failed = True
+
+    def write(self, items):
+        """Write queued sweeps, starting a new segment where a period ends or the segment is full
+        """
+        if self.rollups is not None:
+            self.add_rollups(items)
+        run = []
+        for item in items:
+            if self.rotate_seconds:
+                period = log_rotation.clock_period(item[1][0], self.rotate_seconds)
+                if self.segment_period is None:
+                    self.segment_period = period
+                elif period != self.segment_period:
+                    self.write_run(run)
+                    run = []
+                    self.rotate()
+                    self.segment_period = period
+            run.append(item)
+            if self.rotate_bytes and len(run) >= ROTATE_CHECK_SWEEPS:
+                self.write_run(run)
+                run = []
+                if self.segment_bytes >= self.rotate_bytes:
+                    self.rotate()
+        self.write_run(run)
+        if self.rotate_bytes and self.segment_bytes >= self.rotate_bytes:
+            self.rotate()
+
+    def add_rollups(self, items):
+        try:
+            for daq, sweep, extra in items:
+                self.rollups.add(daq, sweep)
+            self.rollups.flush()
+        except (OSError, ValueError) as error:
+            print("Cannot write the rollups of the log %s, rollups stopped: %s" % (self.log_file_name, error))
+            self.rollups = None
+
+    def write_run(self, items):
+        if not items:
+            return
+        if self.failed:
+            self.dropped += len(items)
+            return
+        if self.log_format == "binary":
+            self.write_binary(items)
+        else:
+            self.write_csv(items)
+
+    def note_sweep(self, daq, timestamp):
+        """Keep the span and sweep count of a segment file for the manifest
+        """
+        span = self.segment_entries[daq]
+        if span[1] is None or timestamp < span[1]:
+            span[1] = timestamp
+        if span[2] is None or timestamp > span[2]:
+            span[2] = timestamp
+        span[3] += 1
+
+    def write_csv(self, items):
+        """Format queued sweeps and write them with one call, headers first for DAQs not seen before
+        """
+        if self.log_file is None:
+            try:
+                self.open_csv()
+            except OSError as error:
+                print("Cannot write the log %s, logging stopped: %s" % (self.log_file_name, error))
+                self.failed = True
+                self.dropped += len(items)
+                return
+        lines = []
+        last_second = None
+        datestamp = None
+        for daq, sweep, extra in items:
+            if daq not in self.headed:
+                self.headed.add(daq)
+                header = log_header(sweep[1], self.sensors_by_daq.get(daq, []), self.extra_columns)
+                lines.append(header if daq is None else "%s, %s" % (daq, header))
+            # Sweeps in the same second share a datestamp
+            second = int(sweep[0])
+            if second != last_second:
+                last_second = second
+                datestamp = time.strftime("%m/%d/%Y %H:%M:%S", time.localtime(sweep[0]))
+            text = sweep_to_text(sweep, datestamp)
+            for value in extra:
+                text = text + "%s, " % value
+            lines.append(text if daq is None else "%s, %s" % (daq, text))
+            self.note_sweep(None, sweep[0])
+        text = "\n".join(lines) + "\n"
+        try:
+            self.log_file.write(text)
+        except (OSError, ValueError) as error:
+            print("Cannot write the log %s, logging stopped: %s" % (self.log_file_name, error))
+            self.failed = True
+            self.dropped += len(items)
+            return
+        self.segment_bytes += len(text)
+        self.written += len(items)
+
+    def write_binary(self, items):
+        """Append queued sweeps to the binary log of their DAQ, the columns come from the first sweep
+        """
+        try:
+            for daq, sweep, extra in items:
+                log = self.binary_logs.get(daq)
+                if log is None:
+                    columns = binary_log.schema_from_sensors(self.sensors_by_daq.get(daq, []), sweep[1],
+                                                             self.extra_columns)
+                    file_name = self.segment_file(daq)
+                    log = self.binary_logs[daq] = binary_log.BinaryLogWriter(file_name, columns)
+                    self.add_entry(daq, file_name)
+                values = list(sweep[2]) + list(extra)
+                log.append(sweep[0], values)
+                self.note_sweep(daq, sweep[0])
+                self.segment_bytes += 8 + log.values[0].itemsize * len(values)
+        except (OSError, ValueError) as error:
+            print("Cannot write the log %s, logging stopped: %s" % (self.log_file_name, error))
+            self.failed = True
+            self.dropped += len(items)
+            return
+        self.written += len(items)
+
+    def sync(self):
+        """Flush the log and fsync it to disk
+        """
+        if self.failed:
+            return
+        started = time.perf_counter()
+        try:
+            if self.log_format == "binary":
+                for log in self.binary_logs.values():
+                    log.flush()
+                    os.fsync(log.fileno())
+            elif self.log_file is not None:
+                self.log_file.flush()
+                os.fsync(self.log_file.fileno())
+        except (OSError, ValueError) as error:
+            print("Cannot sync the log %s, logging stopped: %s" % (self.log_file_name, error))
+            self.failed = True
+            return
+        self.syncs += 1
+        self.longest_sync = max(self.longest_sync, time.perf_counter() - started)
+
+    def close(self):
+        """Write and sync everything queued then close the file, safe to call more than once
+        The last segment of a rotated log is compressed before close() returns.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        atexit.unregister(self.close)
+        # The end marker waits for room, the queue always drains
+        self.queue.put(None)
+        self.thread.join()
+        try:
+            self.close_segment()
+        except (OSError, ValueError) as error:
+            print("Cannot close the log %s: %s" % (self.log_file_name, error))
+        if self.rollups is not None:
+            try:
+                self.rollups.close()
+            except (OSError, ValueError) as error:
+                print("Cannot close the rollups of the log %s: %s" % (self.log_file_name, error))
+        if self.compressor is not None:
+            self.compressor.close()
+
+    def summary(self):
+        """One line report of what was written and synced
+        """
+        text = "Log %s: %d sweeps written, %d dropped, %d syncs (%s), longest sync %.1f ms" % (
+            self.log_file_name, self.written, self.dropped, self.syncs, self.durability, self.longest_sync * 1000)
+        if self.manifest is not None:
+            text = text + ", %d segments" % self.segment
+        return text
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Connect to, configure and scan several DAQs at the same time from one
+    event loop. Each DAQ runs in its own task, so a slow or stalled unit
+    never holds up the sweeps of the others.
+
+Usage:
+    daq_list = parse_config_file.split_by_daq(sensor_list)
+    multi_daq.acquire_all(daq_list, collection_interval, on_sweep)
+"""
+
+import asyncio
+import time
+import DAQ_async
+import daq_session
+import DAQ_commands as DAQ_cmd
+import DAQ_errors
+import parse_config_file as pcf
+import parse_readings
+from daq_metrics import LatencyHistogram
+from sweep_scheduler import SweepScheduler
+
+
+class DAQStats:
+    """Sweep counts and :READ? latencies for one DAQ
+    The latencies go into a daq_metrics.LatencyHistogram, its size does not grow with the run.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.sweeps = 0
+        self.readings = 0
+        self.failed_sweeps = 0
+        self.latencies = LatencyHistogram()
+        self.started = False
+        self.finished = False
+        self.scheduler = None
+        self.outages = []
+
+    def add_sweep(self, latency, num_readings):
+        self.sweeps += 1
+        self.readings += num_readings
+        self.latencies.record(latency)
+
+    def summary(self):
+        """Return a throughput and latency report with the sweep lateness on a second line
+        """
+        if self.scheduler is not None:
+            return self.throughput() + "\n%s: %s" % (self.name, self.scheduler.summary())
+        return self.throughput()
+
+    def throughput(self):
+        """Return a one line throughput and latency report
+        """
+        latencies = self.latencies
+        if not latencies.count:
+            return "%s: no sweeps collected, %d failed" % (self.name, self.failed_sweeps)
+        run_time = self.finished - self.started
+        return ("%s: %d sweeps (%d failed, %d reconnects), %d readings, %.2f readings/s, "
+                "latency mean %.3f s, p95 %.3f s, max %.3f s" %
+                (self.name, self.sweeps, self.failed_sweeps, len(self.outages), self.readings,
+                 self.readings / run_time if run_time > 0 else 0.0, latencies.mean(), latencies.percentile(95),
+                 latencies.max))
+
+
+async def reconnect_daq(ip_addr, ip_port, name):
+    """Reconnect with an exponential backoff until the DAQ answers again
+    Returns the connection and the DAQ identity
+    """
+    wait = daq_session.RECONNECT_FIRST_WAIT
+    while True:
+        print("%s: reconnecting" % name)
+        handshake = await DAQ_async.handshake(ip_addr, ip_port, 10)
+        if handshake:
+            daq_conn, daq_prompt, daq_identity, latencies = handshake
+            if daq_identity:
+                print("%s: handshake %s" % (name, DAQ_cmd.handshake_report(latencies)))
+                return daq_conn, daq_identity
+            daq_conn.close()
+        await asyncio.sleep(wait)
+        wait = min(wait * 2, daq_session.RECONNECT_MAX_WAIT)
+
+
+async def run_daq(ip_addr, ip_port, sensors, collection_interval, on_sweep, stats, reading_format="full",
+                  missed_sweep_policy="skip"):
+    """Connect to one DAQ, configure its channels and scan until cancelled
+    Sweeps run on the deadlines of a SweepScheduler kept in stats.scheduler. A
+    dropped session is reconnected, the DAQ is only set up again when it no
+    longer holds the configuration, see daq_session.py.
+    on_sweep(name, sweep, lateness) is called with every [timestamp, channels, values] sweep, values are
+    decimals, and how many seconds after its deadline the sweep started
+    """
+    loop = asyncio.get_running_loop()
+    handshake = await DAQ_async.handshake(ip_addr, ip_port, 10)
+    if not handshake:
+        return False
+    daq_conn, daq_prompt, daq_identity, latencies = handshake
+
+    async def setup():
+        """Sync, reset and configure the DAQ, returns the scan list and the configuration it holds
+        """
+        await DAQ_async.sync_daq_time_local_clock(daq_conn)
+        if not await DAQ_async.reset_daq_factory_cfg(daq_conn):
+            print("%s: Problem resetting DAQ" % stats.name)
+        chan_numbers = await DAQ_async.configure_daq_channels(daq_conn, pcf.sensors_to_list(sensors))
+        await DAQ_async.configure_daq(daq_conn, chan_numbers, reading_format)
+        print("%s: scanning %s" % (stats.name, chan_numbers))
+        return chan_numbers, await DAQ_async.daq_config_state(daq_conn, chan_numbers)
+
+    async def sleep(seconds):
+        """Sleep with a keepalive whenever the session has been idle for KEEPALIVE_INTERVAL
+        """
+        end = loop.time() + seconds
+        while end - loop.time() > daq_session.KEEPALIVE_INTERVAL:
+            await asyncio.sleep(daq_session.KEEPALIVE_INTERVAL)
+            await DAQ_async.is_alive(daq_conn)
+        await asyncio.sleep(max(0.0, end - loop.time()))
+
+    try:
+        if daq_identity:
+            print("%s: %s %s %s %s" % ((stats.name,) + tuple(daq_identity)))
+            print("%s: handshake %s" % (stats.name, DAQ_cmd.handshake_report(latencies)))
+        else:
+            print("%s: Cannot get DAQ identity" % stats.name)
+        chan_numbers, config_state = await setup()
+        channels = DAQ_cmd.expand_channel_list(chan_numbers)
+
+        stats.started = loop.time()
+        stats.scheduler = SweepScheduler(collection_interval, missed_sweep_policy)
+        while True:
+            lateness = await stats.scheduler.wait_async(sleep)
+            sweep_start = loop.time()
+            sweep_time = time.time()
+            try:
+                response = await DAQ_async.collect_sensor_response(daq_conn)
+                lost = not response and not await DAQ_async.is_alive(daq_conn)
+            except (EOFError, OSError):
+                response = ""
+                lost = True
+            stats.finished = loop.time()
+            sweeps, unfinished = parse_readings.parse_response(response, channels, reading_format, sweep_time)
+            if sweeps:
+                stats.add_sweep(stats.finished - sweep_start, len(sweeps[0][2]))
+                on_sweep(stats.name, sweeps[0], lateness)
+            else:
+                stats.failed_sweeps += 1
+            if not lost:
+                continue
+
+            # The session dropped, resume if the DAQ still holds our configuration
+            daq_conn.close()
+            daq_conn, identity = await reconnect_daq(ip_addr, ip_port, stats.name)
+            if (daq_identity and identity[2] == daq_identity[2] and config_state and
+                    await DAQ_async.daq_config_state(daq_conn, chan_numbers) == config_state):
+                print("%s: DAQ still holds the configuration, scanning resumed" % stats.name)
+                resumed = True
+            else:
+                print("%s: DAQ lost the configuration, setting it up again" % stats.name)
+                chan_numbers, config_state = await setup()
+                channels = DAQ_cmd.expand_channel_list(chan_numbers)
+                resumed = False
+            daq_identity = identity
+            stats.outages.append([loop.time() - stats.finished, resumed])
+    finally:
+        if not daq_conn.closed:
+            try:
+                await DAQ_async.put_in_local_mode(daq_conn)
+                daq_conn.write(b"\x04")
+            except (EOFError, OSError):
+                pass
+        daq_conn.close()
+
+
+async def run_all(daq_list, collection_interval, on_sweep, all_stats, reading_format="full",
+                  missed_sweep_policy="skip"):
+    """Run every DAQ in its own task until all of them stop or we are cancelled
+    """
+    tasks = []
+    for ip_addr, ip_port, sensors in daq_list:
+        stats = DAQStats("%s %s" % (ip_addr, ip_port))
+        all_stats.append(stats)
+        tasks.append(asyncio.create_task(
+            run_daq(ip_addr, ip_port, sensors, collection_interval, on_sweep, stats, reading_format,
+                    missed_sweep_policy)))
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    for stats, result in zip(all_stats, results):
+        if isinstance(result, Exception):
+            print("%s stopped: %r" % (stats.name, result))
+
+
+def acquire_all(daq_list, collection_interval, on_sweep, reading_format="full", missed_sweep_policy="skip"):
+    """Scan every DAQ in daq_list until Ctrl-C then report per DAQ throughput and latency
+    """
+    all_stats = []
+    try:
+        asyncio.run(run_all(daq_list, collection_interval, on_sweep, all_stats, reading_format,
+                            missed_sweep_policy))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print("######### DAQ throughput and latency ##########")
+        for stats in all_stats:
+            print(stats.summary())
+        print(DAQ_errors.error_summary())
+    return all_stats
@@ -269,6 +269,36 @@ def sensors_to_list(sensor_list):
     return a_list
 
 
+def split_by_daq(sensor_list):
+    """Split the sensor list into one entry per DAQ address
+    Channels belong to the Address line above them. Channels listed before the
+    first Address line belong to the first DAQ.
+    Returns a list of [ip, port, sensors]
+    """
+    daq_list = []
+    leading_sensors = []
+    current_daq = False
+    for sensor in sensor_list:
+        ip_addr = sensor.found_ip()
+        if ip_addr:
+            ip_port = sensor.found_port()
+            current_daq = False
+            for daq in daq_list:
+                if daq[0] == ip_addr and daq[1] == ip_port:
+                    print("DAQ %s %s is listed more than once, its channels are combined" % (ip_addr, ip_port))
+                    current_daq = daq
+            if not current_daq:
+                current_daq = [ip_addr, ip_port, []]
+                daq_list.append(current_daq)
+        elif current_daq:
+            current_daq[2].append(sensor)
+        else:
+            leading_sensors.append(sensor)
+    if daq_list:
+        daq_list[0][2] = leading_sensors + daq_list[0][2]
+    return daq_list
+
+
 def e_notation_to_dec(e_nota):
     """Agilent format of Engineering Notation (m * 10^n) to a decimal number
     +1.90380000E+01
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Bulk parser for :READ?, FETCh? and R? responses. A whole response of one
+    or more sweeps is turned into NumPy arrays of values, timestamps and
+    channel numbers in one pass instead of one regex and one
+    e_notation_to_dec call per field.
+
+    Values match parse_config_file.e_notation_to_dec exactly. The overload
+    reading +9.9E+37 (and -9.9E+37) becomes NaN and exponents of any length
+    are understood.
+
+    numpy is optional (pip install numpy). Without it parse_response parses
+    one reading at a time with the same results.
+
+Usage:
+    values, timestamps, channel_ids, leftover = parse_buffer(response, channels, "full")
+    sweeps, leftover = parse_response(response, channels, "full")
+"""
+
+import functools
+import math
+import re
+import time
+import DAQ_commands as DAQ_cmd
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# The DAQ reports an overload or open thermocouple as +9.9E+37
+OVERLOAD = 9.9e37
+
+# 10**e the way e_notation_to_dec computes it, so m * 10**e rounds the same
+POW10_MIN = -400
+POW10_MAX = 400
+
+
+def _pow10(exponent):
+    try:
+        return 10 ** float(exponent)
+    except OverflowError:
+        return math.inf
+
+
+POW10 = [_pow10(exponent) for exponent in range(POW10_MIN, POW10_MAX + 1)]
+
+# Split a reading into mantissa and exponent, "+1.90380000E+01" -> "+1.90380000", "+01"
+READING_RE = re.compile(r"\s*([+-]?[\d.]+)(?:[Ee]([+-]?\d+))?\s*$")
+
+
+def value_to_dec(e_nota):
+    """One DAQ reading to a decimal number rounded to 6 places like e_notation_to_dec
+    +1.90380000E+01 -> 19.038
+    +9.90000000E+37 -> nan
+    """
+    found = READING_RE.match(e_nota)
+    if not found:
+        raise ValueError("Not a DAQ reading: %r" % e_nota)
+    m = float(found.group(1))
+    e = int(found.group(2) or 0)
+    if POW10_MIN <= e <= POW10_MAX:
+        value = m * POW10[e - POW10_MIN]
+    else:
+        value = m * _pow10(e)
+    if math.isinf(value) or abs(value) >= OVERLOAD:
+        return math.nan
+    return round(value, 6)
+
+
+def _round6(values):
+    """round(value, 6) for every value without a Python call per value
+    rint(value * 1e6) / 1e6 is exact unless value * 1e6 sits next to a .5 tie
+    or is too large to hold the fraction, those few go through round() itself.
+    """
+    scaled = values * 1e6
+    rounded = np.rint(scaled) / 1e6
+    fraction = np.abs(scaled - np.floor(scaled) - 0.5)
+    with np.errstate(invalid='ignore'):
+        unsure = np.flatnonzero((fraction < 0.01) | (np.abs(values) >= 1e7))
+    for i in unsure:
+        if math.isfinite(values[i]):
+            rounded[i] = round(float(values[i]), 6)
+    return rounded
+
+
+# A reading with every digit as 0 and every sign as +, the key of its layout
+LAYOUT_KEY = str.maketrans("123456789-", "000000000+")
+
+
+@functools.lru_cache(maxsize=1)
+def _layout_bytes():
+    """Table that maps every byte of a reading to its byte in the layout key
+    """
+    return np.frombuffer(bytes(range(256)).decode('latin-1').translate(LAYOUT_KEY).encode('latin-1'),
+                         dtype=np.uint8)
+
+
+@functools.lru_cache(maxsize=32)
+def _reading_layout(layout_key, columns):
+    """Work out where the digits of each field sit in a fixed width reading like "+0.00000000E+00,"
+    Returns (digit byte positions, their place values shaped (digits, columns),
+    the divisor of each field for its decimal places, the sign byte of each field or -1),
+    or None if the reading is not columns plain numbers.
+    """
+    used = []
+    place_values = []
+    divisors = []
+    sign_cols = []
+    position = 0
+    for field in re.split(r"[,Ee]", layout_key)[:-1]:
+        found = re.fullmatch(r"(\+?)(0*)(?:\.(0*))?", field)
+        if not found or not 0 < len(found.group(2) + (found.group(3) or "")) <= 15:
+            return None
+        sign_cols.append(position if found.group(1) else -1)
+        digits = [position + i for i, char in enumerate(field) if char == "0"]
+        for place, digit_col in enumerate(reversed(digits)):
+            weights = [0.0] * columns
+            weights[len(divisors)] = 10.0 ** place
+            used.insert(0, digit_col)
+            place_values.insert(0, weights)
+        divisors.append(10.0 ** len(found.group(3) or ""))
+        position += len(field) + 1
+    if len(divisors) != columns:
+        return None
+    order = np.argsort(used)
+    return (np.array(used)[order], np.array(place_values)[order], np.array(divisors), sign_cols)
+
+
+def _reading_end(text, fields_per_reading):
+    """Length of the first reading in text including the comma after it
+    """
+    end = -1
+    for i in range(fields_per_reading):
+        end = text.find(",", end + 1)
+        if end < 0:
+            return len(text) + 1
+    return end + 1
+
+
+def _parse_fixed_width(text, num_readings, columns):
+    """Parse readings that all have the same layout, as the DAQ sends them, straight from the bytes
+    The bytes become a (readings, width) matrix and one matrix product turns
+    the digit columns into numbers.
+    Returns an array shaped (readings, columns) or None if the layout varies.
+    """
+    width, remainder = divmod(len(text) + 1, num_readings)
+    if remainder:
+        return None
+    layout_key = text[:width].translate(LAYOUT_KEY)
+    if not layout_key.endswith(","):
+        return None
+    layout = _reading_layout(layout_key, columns)
+    if layout is None:
+        return None
+    used, place_values, divisors, sign_cols = layout
+
+    rows = np.frombuffer(text.encode('ascii') + b",", dtype=np.uint8).reshape(num_readings, width)
+    # Every reading has to have the layout of the first
+    key_rows = np.frombuffer(layout_key.encode('ascii'), dtype=np.uint8)
+    if not (_layout_bytes()[rows] == key_rows).all():
+        return None
+
+    # The sums are whole numbers below 2**53 so the float product is exact
+    numbers = (rows[:, used].astype(np.float64) - ord("0")) @ place_values
+    numbers /= divisors
+    for column, sign_col in enumerate(sign_cols):
+        if sign_col >= 0:
+            numbers[rows[:, sign_col] == ord("-"), column] *= -1
+    return numbers
+
+
+def _local_to_epoch(naive_seconds):
+    """Seconds since 1970 on the DAQ wall clock to epoch seconds, like time.mktime per hour
+    """
+    hours = np.floor_divide(naive_seconds, 3600)
+    unique_hours, index = np.unique(hours, return_inverse=True)
+    offsets = np.array([time.mktime(time.gmtime(int(hour) * 3600)[:8] + (-1,)) - int(hour) * 3600
+                        for hour in unique_hours], dtype=np.float64)
+    return naive_seconds + offsets[index]
+
+
+def parse_buffer(response, channels, reading_format="full", sweep_time=0.0, sweep_interval=0.0, first_sweep=0):
+    """Parse a response of one or more sweeps into arrays shaped (sweeps, channels)
+    channels is the scan list in scan order. sweep_time, sweep_interval and
+    first_sweep rebuild the timestamps the relative and values formats leave
+    out, see DAQ_commands.parse_sweeps.
+    Returns values, timestamps, channel ids and the text of an unfinished sweep
+    """
+    if np is None:
+        raise ImportError("parse_buffer needs numpy: pip install numpy")
+    fields_per_reading = DAQ_cmd.READING_FORMATS[reading_format]
+    num_channels = len(channels)
+    empty = np.empty((0, num_channels))
+    if not response or not num_channels:
+        return empty, empty, empty.astype(np.int64), response
+
+    # Find where the last whole sweep ends, the rest waits for the next response
+    text = response.strip()
+    fields_per_sweep = fields_per_reading * num_channels
+    num_fields = text.count(",") + 1
+    num_sweeps = num_fields // fields_per_sweep
+    if num_sweeps == 0:
+        return empty, empty, empty.astype(np.int64), text
+    if num_sweeps * fields_per_sweep < num_fields:
+        cut = _reading_end(text, fields_per_reading) * num_sweeps * num_channels - 1
+        if text[cut:cut + 1] != "," or text.count(",", 0, cut) != num_sweeps * fields_per_sweep - 1:
+            commas = np.flatnonzero(np.frombuffer(text.encode('ascii'), dtype=np.uint8) == ord(","))
+            cut = commas[num_sweeps * fields_per_sweep - 1]
+        text, leftover = text[:cut], text[cut + 1:]
+    else:
+        leftover = ""
+
+    # Every value becomes a mantissa and an exponent column, the other fields are plain numbers
+    columns = fields_per_reading + 1
+    num_readings = num_sweeps * num_channels
+    numbers = _parse_fixed_width(text, num_readings, columns)
+    if numbers is None:
+        numbers = np.fromstring(re.sub(r"[Ee]", ",", text), sep=",")
+        if len(numbers) != num_readings * columns:
+            raise ValueError("Response does not hold %d whole %s readings" % (num_readings, reading_format))
+        numbers = numbers.reshape(num_readings, columns)
+
+    exponents = numbers[:, 1].astype(np.int64)
+    in_table = (exponents >= POW10_MIN) & (exponents <= POW10_MAX)
+    scale = np.array(POW10)[np.clip(exponents, POW10_MIN, POW10_MAX) - POW10_MIN]
+    for i in np.flatnonzero(~in_table):
+        scale[i] = _pow10(int(exponents[i]))
+    with np.errstate(over='ignore', invalid='ignore'):
+        values = numbers[:, 0] * scale
+    overload = ~np.isfinite(values) | (np.abs(values) >= OVERLOAD)
+    values[overload] = 0.0
+    values = _round6(values)
+    values[overload] = np.nan
+
+    if reading_format == "full":
+        dates = (numbers[:, 2].astype(np.int64) - 1970).astype('datetime64[Y]')
+        dates = dates.astype('datetime64[M]') + (numbers[:, 3].astype(np.int64) - 1)
+        dates = dates.astype('datetime64[D]') + (numbers[:, 4].astype(np.int64) - 1)
+        seconds = numbers[:, 7]
+        whole_seconds = np.floor(seconds)
+        naive = (dates.astype(np.int64) * 86400 + numbers[:, 5].astype(np.int64) * 3600 +
+                 numbers[:, 6].astype(np.int64) * 60 + whole_seconds.astype(np.int64))
+        timestamps = (_local_to_epoch(naive.astype(np.float64)) + seconds) - whole_seconds
+        channel_ids = numbers[:, 8].astype(np.int64)
+    elif reading_format == "relative":
+        timestamps = sweep_time + numbers[:, 2]
+        channel_ids = np.tile(np.asarray(channels, dtype=np.int64), num_sweeps)
+    else:
+        sweep_numbers = np.repeat(np.arange(first_sweep, first_sweep + num_sweeps), num_channels)
+        timestamps = sweep_time + sweep_numbers * sweep_interval
+        channel_ids = np.tile(np.asarray(channels, dtype=np.int64), num_sweeps)
+
+    shape = (num_sweeps, num_channels)
+    return values.reshape(shape), timestamps.reshape(shape), channel_ids.reshape(shape), leftover
+
+
+def parse_response(response, channels, reading_format="full", sweep_time=0.0, sweep_interval=0.0, first_sweep=0):
+    """Parse a response of one or more sweeps into [timestamp, channels, values] sweeps
+    Values are decimal numbers, NaN for an overload. Uses parse_buffer when numpy is installed.
+    Returns the sweeps and the text of an unfinished sweep
+    """
+    if np is not None:
+        values, timestamps, channel_ids, leftover = parse_buffer(
+            response, channels, reading_format, sweep_time, sweep_interval, first_sweep)
+        sweeps = [[float(timestamps[i, 0]), channel_ids[i].tolist(), values[i].tolist()]
+                  for i in range(len(values))]
+        return sweeps, leftover
+
+    fields = response.strip().split(",") if response and response.strip() else []
+    sweeps = DAQ_cmd.parse_sweeps(fields, channels, reading_format, sweep_time, sweep_interval, first_sweep)
+    for sweep in sweeps:
+        sweep[2] = [value_to_dec(value) for value in sweep[2]]
+    used = len(sweeps) * len(channels) * DAQ_cmd.READING_FORMATS[reading_format]
+    return sweeps, ",".join(fields[used:])
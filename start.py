@@ -11,9 +11,84 @@ import time
 import handle_config_file
 import parse_config_file as pcf
 import DAQ_commands as DAQ_cmd
+import DAQ_async
+import DAQ_errors
+import daq_metrics
+import multi_daq
+from sweep_scheduler import SweepScheduler
+from daq_session import DAQSession
+import daq_state_cache
+import daq_reconcile
+import log_rotation
+from log_writer import LogWriter
+from sweep_ring import SweepPublisher
+from sweep_feed import start_feed
+from sweep_pipeline import Pipeline, PipelineError, ResponseParser, Enricher
 from pathlib import Path
 config_path = "config/"
 test_log_path = "logs/"
+# "read" - the host times each sweep with a :READ?
+# "buffered" - the DAQ times the sweeps itself and the host drains its memory with R?
+scan_mode = "read"
+# Seconds between draining DAQ memory in buffered mode when sweeps are faster than this
+buffer_poll_interval = 1.0
+# What the DAQ sends with each reading, see DAQ_commands.READING_FORMATS
+# "full" - value, DAQ date/time and channel number
+# "relative" - value and seconds since the scan started
+# "values" - value only, the fewest bytes on the wire
+reading_format = "full"
+# What to do when sweeps fall a whole interval behind, see sweep_scheduler.py
+# "skip" - drop the missed sweeps, "catch_up" - run them back to back
+missed_sweep_policy = "skip"
+# Add how late each sweep started against its deadline, in seconds, as the last column of the log so
+# every sweep can be audited. Not in buffered mode, the DAQ times those sweeps itself
+log_sweep_lateness = True
+# When the log is flushed and synced to disk, see log_writer.py
+# "every-sweep", "every-N" - every log_sync_sweeps sweeps, "every-T" - every log_sync_seconds
+log_durability = "every-T"
+log_sync_sweeps = 100
+log_sync_seconds = 1.0
+# "csv" - text lines, "binary" - chunked columns a time window can be read from quickly,
+# see binary_log.py, ./binary_log.py to-csv converts it
+log_format = "csv"
+# Start a new log segment every log_rotate_mb megabytes or every log_rotate_hours
+# hours on the clock, 0 for one file, see log_rotation.py
+log_rotate_mb = 0
+log_rotate_hours = 0
+# Compress finished segments in the background with "gzip" or "lzma", None to leave them
+log_compression = "gzip"
+# Keep the min/mean/max of every channel over these periods in seconds next to the log,
+# e.g. (10, 60, 3600), () for none, see log_rollups.py
+log_rollups = ()
+# Share every sweep with other programs on this computer through a memory-mapped
+# ring of this name holding the latest sweep_ring_sweeps sweeps, None for none, see sweep_ring.py
+sweep_ring = None
+sweep_ring_sweeps = 3600
+# Send every sweep live to subscribers on "unix:/tmp/daq_sweeps.sock" or "udp:127.0.0.1:9106",
+# a subscriber more than sweep_feed_buffer sweeps behind loses its oldest, None for none, see sweep_feed.py
+sweep_feed = None
+sweep_feed_buffer = 1000
+# Parsing, printing, writing and sharing run in stages behind the acquisition loop, each on its
+# own thread behind a queue of pipeline_queue_sweeps items. What a stage does when its queue is
+# full, see sweep_pipeline.py: "block" - hold up the stage before it, back to acquisition,
+# "drop-oldest" - drop the oldest waiting item, "drop-newest" - drop the new item
+pipeline_queue_sweeps = 1000
+pipeline_policies = {"parse": "block", "enrich": "block", "console": "drop-oldest", "file": "block",
+                     "network": "drop-oldest"}
+# Save the configured DAQ with *SAV and bring it back with *RCL when the same
+# config runs on the same DAQ again, see daq_state_cache.py
+warm_startup = True
+state_cache_file = "daq_state_cache.json"
+# Read back the DAQ channel setup and change only what differs from the config
+# instead of *RST and every channel command, see daq_reconcile.py
+incremental_config = True
+# Time every stage of a sweep per DAQ and count sweeps, readings, bytes and
+# errors, see daq_metrics.py. Off costs nothing.
+collect_metrics = False
+# Serve them on http://127.0.0.1:<port>/ and /metrics, 0 for no server
+metrics_port = 9105
+# Seconds between metrics summary lines, 0 for none
+metrics_summary_interval = 60
 
 try:
     config_file_name = sys.argv[1]
@@ -31,7 +106,7 @@ def get_test_log_name(test_log_file_name, test_log_path):
     """
     if test_log_file_name:
         test_log_file_name = Path(test_log_path + "/" + test_log_file_name)
-        if test_log_file_name.is_file():
+        if log_rotation.log_exists(test_log_file_name):
             print("Please use another file name file exists")
             test_log_file_name = False
         else:
@@ -47,7 +122,7 @@ def get_test_log_name(test_log_file_name, test_log_path):
             return "screen_only", False
 
         test_log_file_name = Path(test_log_path + "/" + proposed_test_log_file)
-        if not test_log_file_name.is_file():
+        if not log_rotation.log_exists(test_log_file_name):
             print("Will attempt to log to %s" % test_log_file_name)
 
         else:
@@ -57,7 +132,96 @@ def get_test_log_name(test_log_file_name, test_log_path):
     return test_log_file_name, True
 
 
-
+def start_metrics():
+    """Time the DAQ I/O and serve the metrics when collect_metrics is set
+    Returns the daq_metrics.Metrics of the run or None
+    """
+    if not collect_metrics:
+        return None
+    metrics = daq_metrics.Metrics()
+    metrics.instrument_module(DAQ_cmd)
+    metrics.instrument_module(DAQ_async)
+    if metrics_port and daq_metrics.serve_metrics(metrics, metrics_port):
+        print("Metrics on http://127.0.0.1:%d/" % metrics_port)
+    return metrics
+
+
+def build_pipeline(sensors_by_daq, log, publisher, feed, metrics, instrument=None, parser=None, lateness=False):
+    """Stages from parsing (when there is a parser) and enriching the sweeps to the console, the log file
+    and the shared memory ring and live feed, see sweep_pipeline.py
+    """
+    pipeline = Pipeline(metrics, instrument)
+    parse = None
+    if parser is not None:
+        parse = pipeline.add_stage("parse", parser, policy=pipeline_policies["parse"],
+                                   queue_items=pipeline_queue_sweeps)
+    enrich = pipeline.add_stage("enrich", Enricher(sensors_by_daq, lateness, metrics, instrument), after=parse,
+                                policy=pipeline_policies["enrich"], queue_items=pipeline_queue_sweeps)
+
+    def to_console(record):
+        print(record.text)
+
+    def to_file(record):
+        log.put(record.sweep, record.daq, record.extra)
+
+    def to_network(record):
+        if publisher:
+            publisher.publish(record.sweep, record.daq)
+        if feed:
+            feed.publish(record.sweep, record.daq)
+
+    pipeline.add_stage("console", to_console, after=enrich, policy=pipeline_policies["console"],
+                       queue_items=pipeline_queue_sweeps)
+    if log:
+        pipeline.add_stage("file", to_file, after=enrich, policy=pipeline_policies["file"],
+                           queue_items=pipeline_queue_sweeps)
+    if publisher or feed:
+        pipeline.add_stage("network", to_network, after=enrich, policy=pipeline_policies["network"],
+                           queue_items=pipeline_queue_sweeps)
+    return pipeline
+
+
+def close_outputs(pipeline, log, publisher, feed):
+    """Drain the pipeline, then close the log, ring and feed and print what each of them did
+    """
+    pipeline.close()
+    print(pipeline.summary())
+    if log:
+        log.close()
+        print(log.summary())
+    if publisher:
+        publisher.close()
+    if feed:
+        feed.close()
+        print(feed.summary())
+
+
+def acquire_from_all_daqs(daq_list, collection_interval, log_file_name, log_to_file, metrics=None):
+    """Scan several DAQs at once. Every line is tagged with the DAQ it came from.
+    """
+    sensors_by_daq = {"%s %s" % (ip_addr, ip_port): sensors for ip_addr, ip_port, sensors in daq_list}
+    publisher = SweepPublisher(sweep_ring, sensors_by_daq, sweep_ring_sweeps) if sweep_ring else None
+    feed = start_feed(sweep_feed, sensors_by_daq, sweep_feed_buffer) if sweep_feed else None
+    log = None
+    if log_to_file:
+        log = LogWriter(log_file_name, sensors_by_daq, log_durability, log_sync_sweeps, log_sync_seconds,
+                        extra_columns=["Lateness (s)"] if log_sweep_lateness else (), log_format=log_format,
+                        rotate_bytes=log_rotate_mb * 1000000, rotate_seconds=log_rotate_hours * 3600,
+                        compression=log_compression, rollup_seconds=log_rollups)
+    # multi_daq parses the sweeps, the pipeline starts at enrich
+    pipeline = build_pipeline(sensors_by_daq, log, publisher, feed, metrics, lateness=log_sweep_lateness)
+
+    def on_sweep(daq_name, sweep, lateness):
+        pipeline.put((daq_name, sweep, lateness))
+        if metrics and metrics.summary_due(metrics_summary_interval):
+            print(metrics.summary())
+
+    try:
+        multi_daq.acquire_all(daq_list, collection_interval, on_sweep, reading_format, missed_sweep_policy)
+    finally:
+        close_outputs(pipeline, log, publisher, feed)
+        if metrics:
+            print(metrics.summary())
 
 
 def main():
@@ -86,11 +250,12 @@ def main():
     # TODO: Should the integer value be limited? 1 to 3600 seconds?
     collection_interval = False
     while not collection_interval:
-        collection_interval = input("Enter integer in seconds between sensor collections: ")
+        # Sweeps run on a fixed grid of deadlines so fractions of a second work
+        collection_interval = input("Enter seconds between sensor collections: ")
         try:
-            collection_interval = abs(int(collection_interval))  # change string to a integer and the the ABS()
+            collection_interval = abs(float(collection_interval))
         except ValueError:
-            print("You entered '%s'. The value must be an integer." % str(collection_interval))
+            print("You entered '%s'. The value must be a number." % str(collection_interval))
             collection_interval = False
 
 
@@ -110,123 +275,155 @@ def main():
     if error_list:
         pcf.list_errors(error_list, config_file.name)
 
-    # Fetch the DAQ IP form the sensor list
-    for items in range(0, (len(chan_list))):
-        ip_addr = chan_list[items].found_ip()
-        ip_port = chan_list[items].found_port()
-        if ip_addr:
-            print("Found: %s %s" % (ip_addr, ip_port))
-            break
-
-    # Telnet to DAQ and configure then read the sensors
-    # Connect to DAQ
-    tel_conn = DAQ_cmd.connect_daq(ip_addr, ip_port, 10)
-    if not tel_conn:
-        print("Can't reach IP address: %s %s" % (ip_addr, ip_port))
-        exit()
-
-    # Check if we get a welcome connection and get the DAQ prompt
-    welcome = DAQ_cmd.welcome_daq(tel_conn)
-    if welcome:
-        daq_prompt = welcome[1]
-        print(daq_prompt)
-    else:
-        print("Issues getting login message.")
-
-    # Identify the DAQ
-    daq_identity = DAQ_cmd.get_idn(tel_conn)
-    if daq_identity:
-        print(daq_identity)
-        print("DAQ Manufacturer:  %s"% daq_identity[0])
-        print("DAQ Model:         %s"% daq_identity[1])
-        print("DAQ Serial Number: %s"% daq_identity[2])
-        print("DAQ Firmware:      %s"% daq_identity[3])
-    else:
-        print("Cannot get DAQ identity")
-
-    # Sync DAQ with local machine time
-    DAQ_cmd.sync_daq_time_local_clock(tel_conn)
+    # Fetch the DAQ IPs form the sensor list
+    daq_list = pcf.split_by_daq(chan_list)
+    for ip_addr, ip_port, sensors in daq_list:
+        print("Found: %s %s with %d channels" % (ip_addr, ip_port, len(sensors)))
+    if not daq_list:
+        print("No DAQ Address found in the config file")
+        sys.exit()
 
+    metrics = start_metrics()
 
-    # Reset the DAQ before configuring
-    if DAQ_cmd.reset_daq_factory_cfg(tel_conn, daq_prompt):
-        print("DAQ reset")
-    else:
-        print("Problem resetting DAQ")
-
+    # More than one DAQ, scan them all at the same time
+    if len(daq_list) > 1:
+        acquire_from_all_daqs(daq_list, collection_interval, log_file_name, log_to_file, metrics)
+        sys.exit()
+    ip_addr, ip_port, sensors = daq_list[0]
 
     # Channel configuration list
-    sensors_in_a_list = pcf.sensors_to_list(chan_list)
+    sensors_in_a_list = pcf.sensors_to_list(sensors)
+    channels = []
+    fields_per_reading = DAQ_cmd.READING_FORMATS[reading_format]
+    # A buffered scan's sweeps are timed from its start, a new start begins a new scan for the parser
+    scan_start = time.time()
+
+    def setup_scan(tel_conn):
+        """Sync, reset and configure or recall the DAQ then start scanning, runs again if a reconnected DAQ lost its setup
+        """
+        nonlocal channels, scan_start
+        # Sync DAQ with local machine time
+        DAQ_cmd.sync_daq_time_local_clock(tel_conn)
+
+        # Everything the setup sends, the same commands on the same DAQ can come back from its state memory
+        cmd_list, chan_order = DAQ_cmd.plan_channel_config(sensors_in_a_list)
+        chan_numbers = DAQ_cmd.compress_channel_list(chan_order)
+        scan_interval = collection_interval if scan_mode == "buffered" else False
+        fingerprint = DAQ_cmd.config_fingerprint(cmd_list + DAQ_cmd.scan_setup_cmds(chan_numbers, scan_interval,
+                                                                                     reading_format=reading_format))
+        state_cache = daq_state_cache.load_state_cache(state_cache_file) if warm_startup else {}
+        if not daq_state_cache.warm_start(tel_conn, state_cache, session.identity[2], fingerprint):
+            if incremental_config:
+                # Only send the channel commands whose settings differ on the DAQ
+                chan_numbers = daq_reconcile.reconcile_daq_channels(tel_conn, sensors_in_a_list)
+            else:
+                # Reset the DAQ before configuring
+                if DAQ_cmd.reset_daq_factory_cfg(tel_conn, session.prompt):
+                    print("DAQ reset")
+                else:
+                    print("Problem resetting DAQ")
+
+                # Configuring DAQ channels
+                chan_numbers = DAQ_cmd.configure_daq_channels(tel_conn, sensors_in_a_list)
+            print("######### channels configured ##########")
+            print(chan_numbers)
+
+            # Configure the daq to scan the channels (sensors)
+            if scan_mode == "buffered":
+                DAQ_cmd.configure_buffered_scan(tel_conn, chan_numbers, collection_interval,
+                                                reading_format=reading_format)
+            else:
+                DAQ_cmd.configure_daq(tel_conn, chan_numbers, reading_format)
+            if warm_startup and daq_state_cache.remember_state(tel_conn, state_cache, session.identity[2],
+                                                               fingerprint, chan_numbers):
+                daq_state_cache.save_state_cache(state_cache_file, state_cache)
+
+        channels = DAQ_cmd.expand_channel_list(chan_numbers)
+        if scan_mode == "buffered":
+            scan_start = time.time()
+            DAQ_cmd.start_scan(tel_conn)
+        return chan_numbers
+
+    # Telnet to DAQ, the session reconnects by itself if the connection drops
+    session = DAQSession(ip_addr, ip_port, setup_scan)
+    if not session.connect():
+        print("Can't reach or identify the DAQ at: %s %s" % (ip_addr, ip_port))
+        exit()
+    print(session.prompt)
+    print("Handshake %s" % DAQ_cmd.handshake_report(session.handshake_times))
 
-    # Configuring DAQ channels
-    chan_numbers = DAQ_cmd.configure_daq_channels(tel_conn, sensors_in_a_list)
-    print("######### channels configured ##########")
-    print(chan_numbers)
+    # Identify the DAQ
+    daq_identity = session.identity
+    print(daq_identity)
+    print("DAQ Manufacturer:  %s"% daq_identity[0])
+    print("DAQ Model:         %s"% daq_identity[1])
+    print("DAQ Serial Number: %s"% daq_identity[2])
+    print("DAQ Firmware:      %s"% daq_identity[3])
 
-    # Configure the daq to scan the channels (sensors)
-    DAQ_cmd.configure_daq(tel_conn, chan_numbers)
+    session.configure()
 
-    # open/create the log file
+    # open/create the log file, it is written from a background thread
+    log = None
     if log_to_file:
-        log_file = open(log_file_name, 'w')
-    else:
-        log_file = "screen_only"
-
-    # Now collect and display sensor data
-    while True:
-        try:
-            # Read from DAQ one set of sensor data and return it as a raw string
-            sensor_line = DAQ_cmd.collect_sensor_line(tel_conn, daq_prompt)
-
-            # Get a datestamp
-            datestamp = sensor_line[2] + "/" + sensor_line[3] + "/" + sensor_line[1] + " " + sensor_line[4] + ":" + \
-                        sensor_line[5] + ":" + sensor_line[6][0:2]
-
-            # TODO write to screen and log_file if it has been opened. This needs to be worked on more!!!
-            print("%s, " % datestamp, end="")
-            for i in range(0, len(sensor_line), 8):
-                print("%s, " % pcf.e_notation_to_dec(sensor_line[i]), end="")
-            print("")
-            # Write to log file if enabled
-            # TODO: Need to add header and clean up this mess
-            if log_to_file:
-                log_file.write("%s, " % datestamp)
-                for i in range(0, len(sensor_line), 8):
-                    log_file.write("%s, " % pcf.e_notation_to_dec(sensor_line[i]))
-                log_file.write("\n")
-
-
-
-            try:
-                time.sleep(collection_interval)
-            except (KeyboardInterrupt, SystemExit):
-                # TODO: Clean up things here before exiting
-                if log_to_file:
-                    log_file.close()
-                DAQ_cmd.put_in_local_mode(tel_conn, daq_prompt)
-                tel_conn.write(b"\x04")
-                sys.exit()
-
-        except (KeyboardInterrupt, SystemExit):
-            # TODO: Clean up things here before exiting
-            if log_to_file:
-                log_file.close()
-            DAQ_cmd.put_in_local_mode(tel_conn, daq_prompt)
-            tel_conn.write(b"\x04")
-            sys.exit()
-
-
-
-
-    #    print("TODO: Put a choice here to choose between reset or just disconnect remote.")
-    DAQ_cmd.put_in_local_mode(tel_conn, daq_prompt)
-    # Reset the DAQ to factory defaults before closing connection
-    #if DAQ_cmd.reset_daq_factory_cfg(tel_conn, daq_prompt):
-        #put_in_local_mode(tel_conn, daq_prompt)
-    #    print("DAQ Reset")
-    #else:
-    #    print("Problem resetting DAQ")
-    tel_conn.write(b"\x04")
+        log_lateness = log_sweep_lateness and scan_mode != "buffered"
+        log = LogWriter(log_file_name, {None: sensors}, log_durability, log_sync_sweeps, log_sync_seconds,
+                        extra_columns=["Lateness (s)"] if log_lateness else (), log_format=log_format,
+                        rotate_bytes=log_rotate_mb * 1000000, rotate_seconds=log_rotate_hours * 3600,
+                        compression=log_compression, rollup_seconds=log_rollups)
+    publisher = SweepPublisher(sweep_ring, {None: sensors}, sweep_ring_sweeps) if sweep_ring else None
+    feed = start_feed(sweep_feed, {None: sensors}, sweep_feed_buffer) if sweep_feed else None
+
+    # Parsing, printing and writing run behind the acquisition loop in the pipeline
+    daq_name = "%s %s" % (ip_addr, ip_port)
+    parser = ResponseParser(reading_format, scan_mode == "buffered", collection_interval)
+    pipeline = build_pipeline({None: sensors}, log, publisher, feed, metrics, daq_name, parser,
+                              log_sweep_lateness and scan_mode != "buffered")
+
+    # Now collect sensor data, the loop only talks to the DAQ
+    scheduler = SweepScheduler(collection_interval, missed_sweep_policy)
+    # Each lap times the stage that just finished
+    if metrics:
+        stopwatch = metrics.stopwatch(daq_name)
+        stopwatch.start()
+    try:
+        while True:
+            if scan_mode == "buffered":
+                # Take every sweep the DAQ has finished since the last drain
+                response = session.call(DAQ_cmd.drain_buffered_response, fields_per_reading)
+                if metrics:
+                    stopwatch.lap("acquire")
+                pipeline.put((None, response, channels, scan_start, None, scan_start))
+                session.sleep(max(collection_interval, buffer_poll_interval))
+                if metrics:
+                    stopwatch.lap("wait")
+            else:
+                # Wait for the deadline of the next sweep then read one set of sensor data as a raw string
+                lateness = scheduler.wait(session.sleep)
+                if metrics:
+                    stopwatch.lap("wait")
+                sweep_time = time.time()
+                response = session.call(DAQ_cmd.collect_sensor_response)
+                if metrics:
+                    stopwatch.lap("acquire")
+                pipeline.put((None, response, channels, sweep_time, lateness, None))
+
+            if metrics and metrics.summary_due(metrics_summary_interval):
+                print(metrics.summary())
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    except PipelineError as error:
+        print("Acquisition stopped: %s" % error)
+
+    # Whatever was acquired is parsed, printed and written before the summaries
+    close_outputs(pipeline, log, publisher, feed)
+    if scan_mode != "buffered":
+        print(scheduler.summary())
+    print("%d reconnects" % len(session.outages))
+    print(DAQ_errors.error_summary())
+    if metrics:
+        print(metrics.summary())
+    session.hand_back(stop_scan=scan_mode == "buffered")
+    sys.exit()
 
 
 if __name__ == "__main__":
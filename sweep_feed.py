@@ -0,0 +1,504 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Send every sweep live to any number of programs at once, a dashboard, an
+    alarm daemon or a second recorder, without the scan ever waiting on them.
+    The logger packs each sweep once into a small binary frame and hands the
+    same frame to every subscriber's queue. A background thread sends the
+    queues out over a Unix-domain socket or UDP.
+
+    Each subscriber's queue holds at most buffer_frames frames. When a
+    subscriber falls that far behind its oldest frame is dropped to make
+    room, so a slow subscriber loses its oldest sweeps rather than slowing
+    acquisition or the other subscribers. Every subscriber has counters of
+    the frames sent and dropped and of how far behind it is, in frames and
+    in seconds.
+
+    Addresses:
+    "unix:/tmp/daq_sweeps.sock" - subscribers connect to the socket, Linux and macOS
+    "udp:127.0.0.1:9106"        - subscribers send "SUB" to the port and again every
+                                  SUBSCRIBE_SECONDS, one that goes quiet for three times
+                                  that is dropped. A frame must fit in one datagram,
+                                  about 8000 channels.
+
+    Frame, little endian:
+        length (uint32, bytes after it), "DQ", kind (uint8, 1 sweep, 2 schema),
+        version (uint8), DAQ name length (uint16), readings (uint16),
+        sequence (uint64), timestamp (float64), DAQ name (utf-8), then
+        a sweep:  readings x float64, NaN for readings that are not numbers
+        a schema: JSON of the columns, sent before a DAQ's first sweep and to
+                  every new subscriber
+    The sequence counts every sweep the logger published, a gap seen by a
+    subscriber is the sweeps it lost.
+
+Usage:
+    feed = start_feed("unix:/tmp/daq_sweeps.sock", {None: sensors})
+    feed.publish(sweep)
+    feed.close()
+    print(feed.summary())
+
+    with SweepSubscriber("unix:/tmp/daq_sweeps.sock") as subscriber:
+        for daq, sequence, timestamp, readings in subscriber:
+            ...
+
+    ./sweep_feed.py unix:/tmp/daq_sweeps.sock
+"""
+
+import argparse
+import collections
+import json
+import math
+import os
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from array import array
+import binary_log
+
+FRAME_MAGIC = b"DQ"
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct("<I2sBBHHQd")
+FRAME_LENGTH = struct.Struct("<I")
+SWEEP_FRAME = 1
+SCHEMA_FRAME = 2
+# Frames kept for a subscriber before its oldest are dropped
+BUFFER_FRAMES = 1000
+# UDP subscribers say "SUB" this often, "UNSUB" when they leave
+SUBSCRIBE_SECONDS = 5.0
+SUBSCRIBE = b"SUB"
+UNSUBSCRIBE = b"UNSUB"
+MAX_DATAGRAM = 65507
+
+
+def parse_address(address):
+    """"unix:/tmp/x.sock" -> ("unix", "/tmp/x.sock"), "udp:127.0.0.1:9106" -> ("udp", ("127.0.0.1", 9106))
+    """
+    kind, separator, where = address.partition(":")
+    if kind == "unix" and where:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("Unix-domain sockets are not available here, use udp:<host>:<port>")
+        return kind, where
+    if kind == "udp" and where:
+        host, separator, port = where.rpartition(":")
+        if host and port.isdigit():
+            return kind, (host, int(port))
+    raise ValueError("Feed address must be unix:<path> or udp:<host>:<port>, not %r" % address)
+
+
+def pack_frame(kind, sequence, timestamp, daq, payload):
+    daq_bytes = (daq or "").encode()
+    readings = len(payload) // 8 if kind == SWEEP_FRAME else 0
+    length = FRAME_HEADER.size - FRAME_LENGTH.size + len(daq_bytes) + len(payload)
+    return FRAME_HEADER.pack(length, FRAME_MAGIC, kind, FRAME_VERSION, len(daq_bytes), readings, sequence,
+                             timestamp) + daq_bytes + payload
+
+
+def unpack_frame(frame):
+    """Returns (kind, sequence, timestamp, daq, payload) of a whole frame
+    """
+    length, magic, kind, version, daq_size, readings, sequence, timestamp = FRAME_HEADER.unpack_from(frame, 0)
+    if magic != FRAME_MAGIC or version != FRAME_VERSION:
+        raise ValueError("Not a sweep feed frame")
+    daq = bytes(frame[FRAME_HEADER.size:FRAME_HEADER.size + daq_size]).decode() or None
+    payload = frame[FRAME_HEADER.size + daq_size:FRAME_LENGTH.size + length]
+    return kind, sequence, timestamp, daq, payload
+
+
+class Subscriber:
+    """One subscriber on the logger's side: its queue of (timestamp, frame) and counters
+    """
+    def __init__(self, name, connection=None, address=None, buffer_frames=BUFFER_FRAMES):
+        self.name = name
+        self.connection = connection
+        self.address = address
+        self.frames = collections.deque(maxlen=buffer_frames)
+        self.unsent = None
+        self.sent = 0
+        self.dropped = 0
+        self.last_heard = time.monotonic()
+
+    def add(self, timestamp, frame):
+        """Queue a frame, a full queue drops its oldest, never blocks
+        """
+        if len(self.frames) == self.frames.maxlen:
+            self.dropped += 1
+        self.frames.append((timestamp, frame))
+
+    def lag(self):
+        """(frames waiting, seconds the oldest of them has waited since its sweep)
+        """
+        try:
+            oldest = self.frames[0][0]
+        except IndexError:
+            return 0, 0.0
+        return len(self.frames), max(0.0, time.time() - oldest)
+
+    def send(self, udp_socket=None):
+        """Send what is queued until the socket would block, returns True when all of it went
+        Raises OSError when the subscriber has gone.
+        """
+        while True:
+            if self.unsent is None:
+                try:
+                    timestamp, frame = self.frames.popleft()
+                except IndexError:
+                    return True
+                self.unsent = memoryview(frame)
+            try:
+                if udp_socket is not None:
+                    udp_socket.sendto(self.unsent, self.address)
+                    sent = len(self.unsent)
+                else:
+                    sent = self.connection.send(self.unsent)
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.unsent = self.unsent[sent:]
+            if not self.unsent:
+                self.unsent = None
+                self.sent += 1
+
+
+class SweepFeed:
+    """Publisher of the sweep feed, publish() packs a sweep once and queues it for every subscriber
+    The columns of each DAQ come from its first sweep, names and units from sensors_by_daq.
+    """
+    def __init__(self, address, sensors_by_daq, buffer_frames=BUFFER_FRAMES):
+        self.address = address
+        self.kind, self.where = parse_address(address)
+        self.sensors_by_daq = sensors_by_daq
+        self.buffer_frames = buffer_frames
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        # {daq: schema frame}, sent to every subscriber as it joins
+        self.schemas = {}
+        self.columns = {}
+        self.sequence = 0
+        self.subscribed = 0
+        self.gone = []
+        self.closed = False
+        if self.kind == "unix":
+            if os.path.exists(self.where):
+                os.remove(self.where)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.server.bind(self.where)
+            self.server.listen()
+        else:
+            self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.server.bind(self.where)
+        self.server.setblocking(False)
+        self.wake_reader, self.wake_writer = socket.socketpair()
+        self.wake_reader.setblocking(False)
+        self.wake_writer.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.server, selectors.EVENT_READ)
+        self.selector.register(self.wake_reader, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self.run, name="sweep feed", daemon=True)
+        self.thread.start()
+
+    def publish(self, sweep, daq=None):
+        """Queue a [timestamp, channels, values] sweep for every subscriber, never blocks
+        """
+        if daq not in self.columns:
+            columns = binary_log.schema_from_sensors(self.sensors_by_daq.get(daq, []), sweep[1])
+            self.columns[daq] = len(columns)
+            schema = pack_frame(SCHEMA_FRAME, self.sequence, sweep[0], daq, json.dumps(columns).encode())
+            self.queue_frame(sweep[0], schema, schema_of=[daq])
+        readings = sweep[2][:self.columns[daq]]
+        values = [binary_log.to_float(reading) for reading in readings]
+        values.extend([math.nan] * (self.columns[daq] - len(values)))
+        self.sequence += 1
+        frame = pack_frame(SWEEP_FRAME, self.sequence, sweep[0], daq, array("d", values).tobytes())
+        self.queue_frame(sweep[0], frame)
+
+    def queue_frame(self, timestamp, frame, schema_of=None):
+        """Queue a frame for every subscriber, schema_of=[daq] keeps it for subscribers still to come
+        """
+        with self.lock:
+            if schema_of is not None:
+                self.schemas[schema_of[0]] = frame
+            subscribers = list(self.subscribers.values())
+        if not subscribers:
+            return
+        for subscriber in subscribers:
+            subscriber.add(timestamp, frame)
+        try:
+            self.wake_writer.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            # The sender has wake ups waiting already
+            pass
+        except OSError:
+            pass
+
+    def add_subscriber(self, subscriber):
+        with self.lock:
+            for schema in self.schemas.values():
+                subscriber.add(time.time(), schema)
+            self.subscribers[subscriber.name] = subscriber
+        self.subscribed += 1
+
+    def remove_subscriber(self, subscriber):
+        with self.lock:
+            self.subscribers.pop(subscriber.name, None)
+            self.gone.append(subscriber)
+        if subscriber.connection is not None:
+            try:
+                self.selector.unregister(subscriber.connection)
+            except (KeyError, ValueError):
+                pass
+            subscriber.connection.close()
+
+    def accept(self):
+        """Take a new Unix-domain subscriber or a UDP subscribe message
+        """
+        if self.kind == "unix":
+            try:
+                connection, address = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            connection.setblocking(False)
+            subscriber = Subscriber("unix subscriber %d" % (self.subscribed + 1), connection,
+                                    buffer_frames=self.buffer_frames)
+            # Only a read of 0 bytes is expected, the subscriber hanging up
+            self.selector.register(connection, selectors.EVENT_READ, subscriber)
+            self.add_subscriber(subscriber)
+            return
+        while True:
+            try:
+                message, address = self.server.recvfrom(64)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                # An ICMP port unreachable from a subscriber that went away
+                continue
+            name = "udp %s:%d" % address[:2]
+            with self.lock:
+                subscriber = self.subscribers.get(name)
+            if message == UNSUBSCRIBE:
+                if subscriber is not None:
+                    self.remove_subscriber(subscriber)
+            elif message == SUBSCRIBE:
+                if subscriber is None:
+                    self.add_subscriber(Subscriber(name, address=address, buffer_frames=self.buffer_frames))
+                else:
+                    subscriber.last_heard = time.monotonic()
+
+    def run(self):
+        """Sender thread, send the queued frames without ever blocking on one subscriber
+        """
+        waiting = set()
+        while not self.closed:
+            timeout = 0.05 if waiting else SUBSCRIBE_SECONDS
+            for key, events in self.selector.select(timeout):
+                if key.fileobj is self.server:
+                    self.accept()
+                elif key.fileobj is self.wake_reader:
+                    try:
+                        while self.wake_reader.recv(4096):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                else:
+                    # A Unix-domain subscriber sent something or hung up
+                    try:
+                        if not key.fileobj.recv(4096):
+                            self.remove_subscriber(key.data)
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                    except OSError:
+                        self.remove_subscriber(key.data)
+            with self.lock:
+                subscribers = list(self.subscribers.values())
+            waiting = set()
+            now = time.monotonic()
+            for subscriber in subscribers:
+                if subscriber.address is not None and now - subscriber.last_heard > 3 * SUBSCRIBE_SECONDS:
+                    self.remove_subscriber(subscriber)
+                    continue
+                try:
+                    if not subscriber.send(self.server if self.kind == "udp" else None):
+                        waiting.add(subscriber.name)
+                except OSError:
+                    self.remove_subscriber(subscriber)
+
+    def stats(self):
+        """Counters of every subscriber, current and gone: name, sent, dropped, lag in frames and seconds
+        """
+        with self.lock:
+            subscribers = self.gone + list(self.subscribers.values())
+        stats = []
+        for subscriber in subscribers:
+            lag_frames, lag_seconds = subscriber.lag()
+            stats.append({"name": subscriber.name, "sent": subscriber.sent, "dropped": subscriber.dropped,
+                          "lag_frames": lag_frames, "lag_seconds": lag_seconds,
+                          "connected": subscriber not in self.gone})
+        return stats
+
+    def summary(self):
+        """Report of the sweeps published and what each subscriber got
+        """
+        lines = ["Feed %s: %d sweeps published, %d subscribers" % (self.address, self.sequence, self.subscribed)]
+        for stat in self.stats():
+            lines.append("    %s: %d sent, %d dropped, %d behind (%.1f s)%s" % (
+                stat["name"], stat["sent"], stat["dropped"], stat["lag_frames"], stat["lag_seconds"],
+                "" if stat["connected"] else ", gone"))
+        return "\n".join(lines)
+
+    def close(self):
+        """Stop sending, frames still queued are not sent
+        """
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.wake_writer.send(b"\0")
+        except OSError:
+            pass
+        self.thread.join()
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+        for subscriber in subscribers:
+            if subscriber.connection is not None:
+                subscriber.connection.close()
+        self.selector.close()
+        self.server.close()
+        self.wake_reader.close()
+        self.wake_writer.close()
+        if self.kind == "unix" and os.path.exists(self.where):
+            os.remove(self.where)
+
+
+def start_feed(address, sensors_by_daq, buffer_frames=BUFFER_FRAMES):
+    """Start publishing the sweep feed on address
+    Returns the SweepFeed or False when the address cannot be used.
+    """
+    try:
+        feed = SweepFeed(address, sensors_by_daq, buffer_frames)
+    except (OSError, ValueError) as error:
+        print("Cannot start the sweep feed on %s: %s" % (address, error))
+        return False
+    print("Sweep feed on %s" % address)
+    return feed
+
+
+class SweepSubscriber:
+    """A program's side of the feed, iterate it for (daq, sequence, timestamp, readings)
+    columns holds the schema of each DAQ once its schema frame arrived, missed counts
+    the sweeps lost to a full queue or the network going by the gaps in sequence.
+    """
+    def __init__(self, address, timeout=None):
+        self.kind, self.where = parse_address(address)
+        self.timeout = timeout
+        self.columns = {}
+        self.sequence = None
+        self.missed = 0
+        self.buffer = bytearray()
+        if self.kind == "unix":
+            self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.connection.connect(self.where)
+        else:
+            self.connection = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.connection.connect(self.where)
+            self.subscribe()
+        self.connection.settimeout(min(timeout or SUBSCRIBE_SECONDS, SUBSCRIBE_SECONDS))
+
+    def subscribe(self):
+        self.connection.send(SUBSCRIBE)
+        self.subscribed = time.monotonic()
+
+    def read_frame(self):
+        """The next whole frame, None when timeout passes without one
+        """
+        started = time.monotonic()
+        while True:
+            if self.kind == "udp":
+                if time.monotonic() - self.subscribed >= SUBSCRIBE_SECONDS:
+                    self.subscribe()
+            elif len(self.buffer) >= FRAME_LENGTH.size:
+                size = FRAME_LENGTH.size + FRAME_LENGTH.unpack_from(self.buffer, 0)[0]
+                if len(self.buffer) >= size:
+                    frame = bytes(self.buffer[:size])
+                    del self.buffer[:size]
+                    return frame
+            try:
+                if self.kind == "udp":
+                    return self.connection.recv(MAX_DATAGRAM)
+                data = self.connection.recv(65536)
+            except socket.timeout:
+                if self.timeout is not None and time.monotonic() - started >= self.timeout:
+                    return None
+                continue
+            if not data:
+                raise ConnectionError("The logger closed the sweep feed")
+            self.buffer.extend(data)
+
+    def receive(self):
+        """The next sweep as (daq, sequence, timestamp, readings), None when timeout passes without one
+        readings is an array of float64. Schema frames are taken in on the way.
+        """
+        while True:
+            frame = self.read_frame()
+            if frame is None:
+                return None
+            kind, sequence, timestamp, daq, payload = unpack_frame(frame)
+            if kind == SCHEMA_FRAME:
+                self.columns[daq] = json.loads(bytes(payload))
+                continue
+            if self.sequence is not None and sequence > self.sequence + 1:
+                self.missed += sequence - self.sequence - 1
+            self.sequence = sequence
+            readings = array("d")
+            readings.frombytes(payload)
+            return daq, sequence, timestamp, readings
+
+    def __iter__(self):
+        while True:
+            sweep = self.receive()
+            if sweep is None:
+                return
+            yield sweep
+
+    def close(self):
+        if self.kind == "udp":
+            try:
+                self.connection.send(UNSUBSCRIBE)
+            except OSError:
+                pass
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the sweeps of a running logger's sweep feed")
+    parser.add_argument("address", help="unix:<path> or udp:<host>:<port>, sweep_feed in start.py")
+    options = parser.parse_args()
+
+    try:
+        subscriber = SweepSubscriber(options.address)
+    except (OSError, ValueError) as error:
+        print("Cannot subscribe to %s: %s" % (options.address, error))
+        sys.exit(1)
+    try:
+        for daq, sequence, timestamp, readings in subscriber:
+            line = "%s, %s, " % (time.strftime(binary_log.CSV_DATESTAMP, time.localtime(timestamp)),
+                                 ", ".join("%g" % reading for reading in readings))
+            print(line if daq is None else "%s, %s" % (daq, line))
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    except (OSError, ValueError) as error:
+        print(error)
+    finally:
+        subscriber.close()
+        if subscriber.missed:
+            print("%d sweeps missed" % subscriber.missed, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Take everything but talking to the DAQ off the acquisition loop. The loop
+    only reads a response and hands it on, the rest runs in stages, each on
+    its own thread behind a bounded queue:
+        parse   - raw responses into [timestamp, channels, values] sweeps
+        enrich  - the screen and log text of each sweep, its extra columns and
+                  the names and units of its channels from the Sensor list
+        sinks   - console, file and network, each gets every enriched sweep
+    A slow stage holds up only the stages behind it, the next sweep starts on
+    time as long as the queues have room.
+
+    What a stage does when its queue is full is its backpressure policy:
+    "block"       - the stage before it waits for room, up to acquisition
+    "drop-oldest" - the oldest waiting item is dropped to make room
+    "drop-newest" - the new item is dropped
+
+    Every stage counts the items in, out and dropped, the time it spent on
+    them and the longest its queue got, and times each item in the run's
+    daq_metrics.Metrics when there is one. close() lets every stage finish
+    its queue, in order, before it returns.
+
+    A stage that fails on an item counts it as an error and goes on with the
+    next. Should a stage thread stop anyway, putting to it raises
+    PipelineError instead of waiting forever for room, and close() ends the
+    run for the stages after it.
+
+Usage:
+    pipeline = Pipeline(metrics, "192.168.1.10 5024")
+    parse = pipeline.add_stage("parse", ResponseParser("full"))
+    enrich = pipeline.add_stage("enrich", Enricher({None: sensors}), after=parse)
+    pipeline.add_stage("console", lambda record: print(record.text), after=enrich, policy="drop-oldest")
+    pipeline.put((None, response, channels, time.time(), lateness, None))
+    pipeline.close()
+    print(pipeline.summary())
+"""
+
+import collections
+import threading
+import time
+import binary_log
+import parse_readings
+from log_writer import sweep_to_text
+
+BACKPRESSURE_POLICIES = ("block", "drop-oldest", "drop-newest")
+# Items a stage queue holds before its policy applies
+QUEUE_ITEMS = 1000
+# The end of the run, passed down every stage after the items before it
+STOP = object()
+
+# A sweep ready for the sinks: daq is None for a single DAQ, text is the screen and log line,
+# extra the values of the extra log columns and columns the schema of the sweep's channels
+SweepRecord = collections.namedtuple("SweepRecord", "daq sweep text extra columns")
+
+
+class PipelineError(RuntimeError):
+    """A stage thread has stopped, nothing put to it would ever be taken
+    """
+
+
+class Stage:
+    """One stage on its own thread, work(item) returns the items for the stages after it, None for none
+    """
+    def __init__(self, name, work, policy="block", queue_items=QUEUE_ITEMS, metrics=None, instrument=None):
+        if policy not in BACKPRESSURE_POLICIES:
+            raise ValueError("Backpressure policy must be one of: %s" % ", ".join(BACKPRESSURE_POLICIES))
+        self.name = name
+        self.work = work
+        self.policy = policy
+        self.queue_items = max(1, int(queue_items))
+        self.metrics = metrics
+        self.instrument = instrument
+        self.outputs = []
+        self.items = collections.deque()
+        self.condition = threading.Condition()
+        self.taken_in = 0
+        self.sent_out = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy = 0.0
+        self.deepest = 0
+        # running goes False when the thread ends, stopped is True only when it ended on STOP
+        self.running = True
+        self.stopped = False
+        self.thread = threading.Thread(target=self.run, name="pipeline %s" % name, daemon=True)
+
+    def put(self, item):
+        """Queue an item, what happens when the queue is full is up to the policy
+        Returns False when an item was dropped, raises PipelineError when the stage thread has stopped.
+        """
+        with self.condition:
+            if not self.running:
+                raise PipelineError("Pipeline stage %s has stopped" % self.name)
+            if len(self.items) >= self.queue_items and item is not STOP:
+                if self.policy == "drop-newest":
+                    self.dropped += 1
+                    return False
+                if self.policy == "drop-oldest":
+                    self.items.popleft()
+                    self.dropped += 1
+                    self.items.append(item)
+                    self.condition.notify_all()
+                    return False
+                while len(self.items) >= self.queue_items:
+                    self.condition.wait()
+                    if not self.running:
+                        raise PipelineError("Pipeline stage %s has stopped" % self.name)
+            self.items.append(item)
+            if item is not STOP:
+                self.deepest = max(self.deepest, len(self.items))
+            self.condition.notify_all()
+        return True
+
+    def get(self):
+        with self.condition:
+            while not self.items:
+                self.condition.wait()
+            item = self.items.popleft()
+            # Wake a stage blocked on a full queue
+            self.condition.notify_all()
+            return item
+
+    def run(self):
+        try:
+            while True:
+                item = self.get()
+                if item is STOP:
+                    self.stopped = True
+                    self.forward(STOP)
+                    return
+                self.handle(item)
+        finally:
+            with self.condition:
+                self.running = False
+                # Wake a stage waiting for room, it finds this one gone
+                self.condition.notify_all()
+
+    def handle(self, item):
+        """Run work on one item and pass its results on, a failure costs only that item
+        """
+        self.taken_in += 1
+        started = time.perf_counter()
+        try:
+            results = self.work(item)
+            elapsed = time.perf_counter() - started
+            self.busy += elapsed
+            if self.metrics:
+                self.metrics.record(self.name, item[0] or self.instrument, elapsed)
+            for result in results or ():
+                self.sent_out += 1
+                self.forward(result)
+        except Exception as error:
+            print("Pipeline stage %s failed on an item: %s" % (self.name, error))
+            self.errors += 1
+
+    def forward(self, item):
+        """Put an item to every stage after this one, a stage that has stopped is left out from then on
+        """
+        for output in list(self.outputs):
+            try:
+                output.put(item)
+            except PipelineError as error:
+                print("%s, stage %s no longer feeds it" % (error, self.name))
+                self.outputs.remove(output)
+
+    def stats(self):
+        return {"name": self.name, "in": self.taken_in, "out": self.sent_out, "dropped": self.dropped,
+                "errors": self.errors, "busy": self.busy, "deepest": self.deepest, "waiting": len(self.items),
+                "policy": self.policy}
+
+
+class Pipeline:
+    """Stages joined by queues, the first stage added takes what put() is given
+    Items are tuples whose first field is the DAQ name, None for a single DAQ, so
+    the metrics of each stage are kept per DAQ (instrument when it is None).
+    """
+    def __init__(self, metrics=None, instrument=None):
+        self.metrics = metrics
+        self.instrument = instrument
+        self.stages = []
+        self.started = time.monotonic()
+        self.closed = False
+
+    def add_stage(self, name, work, after=None, policy="block", queue_items=QUEUE_ITEMS):
+        """Add a stage and start its thread, after is the stage that feeds it, the first stage has none
+        Several stages after the same one each get every item it puts out.
+        """
+        stage = Stage(name, work, policy, queue_items, self.metrics, self.instrument)
+        if after is not None:
+            after.outputs.append(stage)
+        self.stages.append(stage)
+        stage.thread.start()
+        return stage
+
+    def put(self, item):
+        """Hand an item to the first stage, blocks only when that stage's policy is "block" and it is full
+        Raises PipelineError when the first stage has stopped.
+        """
+        return self.stages[0].put(item)
+
+    def close(self):
+        """Let every stage finish what it has queued then stop their threads, safe to call more than once
+        """
+        if self.closed or not self.stages:
+            return
+        self.closed = True
+        try:
+            self.stages[0].put(STOP)
+        except PipelineError:
+            pass
+        # Every stage is added after the one feeding it, so it is joined after it too
+        for stage in self.stages:
+            stage.thread.join()
+            if not stage.stopped:
+                # It stopped before passing STOP on, the stages after it would wait for it forever
+                for output in stage.outputs:
+                    try:
+                        output.put(STOP)
+                    except PipelineError:
+                        pass
+
+    def summary(self):
+        """Throughput of every stage, the items it took, passed on and dropped and the time spent on each
+        """
+        seconds = max(time.monotonic() - self.started, 1e-9)
+        parts = []
+        for stage in self.stages:
+            stats = stage.stats()
+            part = "%s %d in (%.1f/s), %d out, %d dropped, %.0f us each, queue max %d" % (
+                stats["name"], stats["in"], stats["in"] / seconds, stats["out"], stats["dropped"],
+                stats["busy"] / stats["in"] * 1e6 if stats["in"] else 0.0, stats["deepest"])
+            if stats["errors"]:
+                part += ", %d errors" % stats["errors"]
+            parts.append(part)
+        return "Pipeline: " + " | ".join(parts)
+
+
+class ResponseParser:
+    """Parse stage, (daq, response, channels, sweep time, lateness, scan) to (daq, sweep, lateness)
+    A buffered scan's response can end part way into a sweep, that part is kept for the next
+    response of the same scan. scan identifies the scan, the start time of a buffered scan, and
+    sweep time is when the sweep was read or when the buffered scan started.
+    """
+    def __init__(self, reading_format="full", buffered=False, interval=0.0):
+        self.reading_format = reading_format
+        self.buffered = buffered
+        self.interval = interval
+        self.scan = None
+        self.unfinished = ""
+        self.taken = 0
+
+    def __call__(self, item):
+        daq, response, channels, sweep_time, lateness, scan = item
+        if not self.buffered:
+            sweeps, unfinished = parse_readings.parse_response(response, channels, self.reading_format, sweep_time)
+            if not sweeps:
+                print("No readings returned by the DAQ")
+            return [(daq, sweep, lateness) for sweep in sweeps]
+        if scan != self.scan:
+            # The DAQ started a new scan, after a reconnect, the old leftovers are not part of it
+            self.scan = scan
+            self.unfinished = ""
+            self.taken = 0
+        if self.unfinished:
+            response = self.unfinished + "," + response if response else self.unfinished
+        sweeps, self.unfinished = parse_readings.parse_response(response, channels, self.reading_format, sweep_time,
+                                                                self.interval, self.taken)
+        self.taken += len(sweeps)
+        return [(daq, sweep, lateness) for sweep in sweeps]
+
+
+class Enricher:
+    """Enrich stage, (daq, sweep, lateness) to a SweepRecord
+    The text is built once for every sink, sweeps in the same second share a datestamp. With
+    lateness set the sweep lateness is an extra column. The columns come from sensors_by_daq.
+    Sweeps are counted in metrics, under instrument for a single DAQ.
+    """
+    def __init__(self, sensors_by_daq, lateness=False, metrics=None, instrument=None):
+        self.sensors_by_daq = sensors_by_daq
+        self.lateness = lateness
+        self.metrics = metrics
+        self.instrument = instrument
+        # {(daq, channels): columns}
+        self.schemas = {}
+        self.second = None
+        self.datestamp = None
+
+    def __call__(self, item):
+        daq, sweep, lateness = item
+        key = (daq, tuple(sweep[1]))
+        columns = self.schemas.get(key)
+        if columns is None:
+            columns = self.schemas[key] = binary_log.schema_from_sensors(self.sensors_by_daq.get(daq, []), sweep[1])
+        second = int(sweep[0])
+        if second != self.second:
+            self.second = second
+            self.datestamp = time.strftime(binary_log.CSV_DATESTAMP, time.localtime(sweep[0]))
+        text = sweep_to_text(sweep, self.datestamp)
+        extra = ()
+        if self.lateness and lateness is not None:
+            extra = ["%.4f" % lateness]
+            text = text + "%s, " % extra[0]
+        if daq is not None:
+            text = "%s, %s" % (daq, text)
+        if self.metrics:
+            self.metrics.count_sweeps(daq or self.instrument, [sweep])
+        return [SweepRecord(daq, sweep, text, extra, columns)]
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Share the latest sweeps with other programs on the test station through a
+    memory-mapped ring buffer, so plotting, limit checks and test sequencers
+    no longer tail the log file. The logger publishes every parsed sweep into
+    a fixed number of slots, any local process attaches to the ring by name
+    and reads the latest sweeps straight out of the shared memory. Readers
+    never lock or signal anything, the logger does not know they are there.
+
+    The ring is a file in /dev/shm (the temp folder where there is none),
+    mapped by the logger and by every reader. The header holds the channel
+    numbers, names and units of the columns and a sequence counter, the
+    number of sweeps published so far. Each sweep is a float64 timestamp and
+    a float64 per column, readings that are not numbers are NaN.
+
+    Every sweep is written to its slot twice, once in each half of the ring,
+    and the counter moves on only after both copies are written. The latest
+    n sweeps are then always one contiguous run of rows, handed out as numpy
+    arrays on the shared memory (memoryviews without numpy) without copying.
+    The logger keeps writing meanwhile, intact() tells a reader whether the
+    rows it looked at were overwritten, read_latest() copies them and checks.
+
+    File layout, native byte order:
+        "DAQRING\\1", schema length (uint32), slots (uint32), columns (uint32),
+        state (uint32, 1 once the logger closed the ring), sequence (uint64)
+        JSON schema, padded to 8 bytes
+        timestamps (float64 x 2 x slots)
+        readings (float64 x 2 x slots x columns), one row per sweep
+
+Usage:
+    publisher = SweepPublisher("daq_sweeps", {None: sensors})
+    publisher.publish(sweep)
+    publisher.close()
+
+    ring = SweepRing("daq_sweeps")
+    sequence, timestamps, readings = ring.latest(100)
+    ... use them ...
+    if not ring.intact(sequence, len(timestamps)):
+        ... the oldest rows were overwritten while in use ...
+    timestamps, readings = ring.read_latest(100, ["101", "Fan Voltage"])
+
+    ./sweep_ring.py daq_sweeps -n 10
+    ./sweep_ring.py daq_sweeps --follow -c 101 -c 102
+"""
+
+import argparse
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+import binary_log
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+RING_MAGIC = b"DAQRING\x01"
+RING_HEADER = struct.Struct("=8sIIII")
+SEQUENCE = struct.Struct("=Q")
+STATE = struct.Struct("=I")
+STATE_OFFSET = RING_HEADER.size - STATE.size
+# The sequence counter follows the header, 8 byte aligned so it is written in one store
+SEQUENCE_OFFSET = RING_HEADER.size
+RING_OPEN = 0
+RING_CLOSED = 1
+# Sweeps kept in a ring
+RING_SWEEPS = 3600
+RING_FOLDER = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+# Times read_latest() reads again when the logger overwrote the rows while copying them
+READ_RETRIES = 10
+
+
+def ring_file_name(name, daq=None):
+    """File of a ring, "daq_sweeps" -> /dev/shm/daq_sweeps.ring, a DAQ of several gets its own
+    """
+    return binary_log.daq_log_name(os.path.join(RING_FOLDER, name + ".ring"), daq)
+
+
+class SweepRingWriter:
+    """The logger's side of one ring, publish() adds a sweep
+    A new ring file replaces any old one, readers still on the old one see it closed.
+    """
+    def __init__(self, file_name, columns, slots=RING_SWEEPS):
+        self.file_name = file_name
+        self.columns = columns
+        self.slots = int(slots)
+        schema = json.dumps({"columns": columns, "slots": self.slots, "pid": os.getpid(),
+                             "created": time.strftime("%Y-%m-%dT%H:%M:%S")}).encode()
+        schema_size = binary_log.pad8(len(schema))
+        self.timestamps_offset = SEQUENCE_OFFSET + SEQUENCE.size + schema_size
+        self.readings_offset = self.timestamps_offset + 8 * 2 * self.slots
+        size = self.readings_offset + 8 * 2 * self.slots * len(columns)
+        self.row = struct.Struct("=%dd" % len(columns))
+        self.sequence = 0
+        temporary = file_name + ".tmp"
+        self.ring_file = open(temporary, 'w+b')
+        try:
+            self.ring_file.truncate(size)
+            self.map = mmap.mmap(self.ring_file.fileno(), size)
+            RING_HEADER.pack_into(self.map, 0, RING_MAGIC, schema_size, self.slots, len(columns), RING_OPEN)
+            SEQUENCE.pack_into(self.map, SEQUENCE_OFFSET, 0)
+            self.map[SEQUENCE_OFFSET + SEQUENCE.size:SEQUENCE_OFFSET + SEQUENCE.size + len(schema)] = schema
+            self.close_old()
+            os.replace(temporary, file_name)
+        except (OSError, ValueError):
+            self.ring_file.close()
+            os.remove(temporary)
+            raise
+
+    def close_old(self):
+        """Mark a ring left by an earlier run closed so its readers move to the new one
+        """
+        try:
+            with open(self.file_name, 'r+b') as old_file:
+                if old_file.read(len(RING_MAGIC)) == RING_MAGIC:
+                    old_file.seek(STATE_OFFSET)
+                    old_file.write(STATE.pack(RING_CLOSED))
+        except OSError:
+            pass
+
+    def publish(self, timestamp, readings):
+        """Write a sweep to both copies of its slot then count it
+        """
+        slot = self.sequence % self.slots
+        values = [binary_log.to_float(reading) for reading in readings]
+        if len(values) != len(self.columns):
+            values = (values + [math.nan] * len(self.columns))[:len(self.columns)]
+        for copy in (slot, slot + self.slots):
+            struct.pack_into("=d", self.map, self.timestamps_offset + 8 * copy, timestamp)
+            self.row.pack_into(self.map, self.readings_offset + self.row.size * copy, *values)
+        self.sequence += 1
+        SEQUENCE.pack_into(self.map, SEQUENCE_OFFSET, self.sequence)
+
+    def close(self):
+        STATE.pack_into(self.map, STATE_OFFSET, RING_CLOSED)
+        self.map.close()
+        self.ring_file.close()
+
+
+class SweepPublisher:
+    """Publishes the sweeps of each DAQ to its own ring, opened with the DAQ's first sweep
+    The columns come from that sweep, names and units from sensors_by_daq. A ring
+    that cannot be written is reported once and left out, acquisition goes on.
+    """
+    def __init__(self, name, sensors_by_daq, slots=RING_SWEEPS):
+        self.name = name
+        self.sensors_by_daq = sensors_by_daq
+        self.slots = slots
+        self.rings = {}
+
+    def publish(self, sweep, daq=None):
+        """Publish a [timestamp, channels, values] sweep
+        """
+        ring = self.rings.get(daq)
+        if ring is None:
+            if daq in self.rings:
+                return False
+            columns = binary_log.schema_from_sensors(self.sensors_by_daq.get(daq, []), sweep[1])
+            file_name = ring_file_name(self.name, daq)
+            try:
+                ring = SweepRingWriter(file_name, columns, self.slots)
+            except (OSError, ValueError) as error:
+                print("Cannot share sweeps in %s: %s" % (file_name, error))
+                self.rings[daq] = None
+                return False
+            self.rings[daq] = ring
+            print("Sharing sweeps in %s" % file_name)
+        ring.publish(sweep[0], sweep[2])
+        return True
+
+    def close(self):
+        for ring in self.rings.values():
+            if ring is not None:
+                ring.close()
+        self.rings = {}
+
+
+class SweepRing:
+    """A reader attached to a ring by name, read only
+    columns is the schema, slots the sweeps the ring holds.
+    """
+    def __init__(self, name, daq=None):
+        self.file_name = ring_file_name(name, daq)
+        self.ring_file = open(self.file_name, 'rb')
+        try:
+            self.map = mmap.mmap(self.ring_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.ring_file.close()
+            raise ValueError("%s is empty" % self.file_name)
+        self.inode = os.fstat(self.ring_file.fileno()).st_ino
+        magic, schema_size, self.slots, num_columns, state = RING_HEADER.unpack_from(self.map, 0)
+        if magic != RING_MAGIC:
+            self.close()
+            raise ValueError("%s is not a sweep ring" % self.file_name)
+        schema_offset = SEQUENCE_OFFSET + SEQUENCE.size
+        self.schema = json.loads(bytes(self.map[schema_offset:schema_offset + schema_size]).rstrip(b"\0"))
+        self.columns = self.schema["columns"]
+        self.timestamps_offset = schema_offset + schema_size
+        self.readings_offset = self.timestamps_offset + 8 * 2 * self.slots
+
+    @property
+    def sequence(self):
+        """Sweeps published so far
+        """
+        return SEQUENCE.unpack_from(self.map, SEQUENCE_OFFSET)[0]
+
+    @property
+    def closed(self):
+        """True once the logger closed the ring or a new run replaced it, attach again to follow the new one
+        """
+        if STATE.unpack_from(self.map, STATE_OFFSET)[0] == RING_CLOSED:
+            return True
+        try:
+            return os.stat(self.file_name).st_ino != self.inode
+        except OSError:
+            return True
+
+    def view(self, offset, count, shape=None):
+        """count float64s at offset in the ring without copying them
+        """
+        if np is not None:
+            values = np.frombuffer(self.map, dtype="f8", count=count, offset=offset)
+            return values if shape is None else values.reshape(shape)
+        values = memoryview(self.map)[offset:offset + 8 * count]
+        # memoryview cannot take a shape with a 0 in it, an empty view is flat
+        return values.cast("d") if shape is None or not count else values.cast("d", shape)
+
+    def latest(self, count, after=None):
+        """Views of the latest count sweeps, oldest first, without copying
+        after limits them to the sweeps published after that sequence number.
+        Returns (sequence, timestamps, readings), readings has a row per sweep and a
+        column per channel. A slot may be mid write, so at most slots - 1 sweeps come back.
+        """
+        sequence = self.sequence
+        count = min(count, sequence, self.slots - 1)
+        if after is not None:
+            count = max(0, min(count, sequence - after))
+        first = (sequence - count) % self.slots
+        num_columns = len(self.columns)
+        timestamps = self.view(self.timestamps_offset + 8 * first, count)
+        readings = self.view(self.readings_offset + 8 * num_columns * first, count * num_columns,
+                             (count, num_columns))
+        return sequence, timestamps, readings
+
+    def intact(self, sequence, count):
+        """True when none of the count sweeps latest() returned at sequence has been overwritten since
+        """
+        return self.sequence + 1 - self.slots <= sequence - count
+
+    def read_latest(self, count, columns=None, after=None):
+        """Copies of the latest count sweeps of columns (channel numbers or names, all for None)
+        Returns (timestamps, {column title: readings}), the newest sequence number is
+        self.last_sequence. Raises KeyError for a column the ring does not have.
+        """
+        numbers = binary_log.column_numbers(self.columns, columns, self.file_name)
+        for attempt in range(READ_RETRIES):
+            sequence, timestamps, readings = self.latest(count, after)
+            if np is not None:
+                timestamps = timestamps.copy()
+                selected = {binary_log.column_title(self.columns[number]): readings[:, number].copy()
+                            for number in numbers}
+            else:
+                timestamps = list(timestamps)
+                selected = {binary_log.column_title(self.columns[number]): [row[number] for row in readings.tolist()]
+                            for number in numbers}
+            if self.intact(sequence, len(timestamps)):
+                self.last_sequence = sequence
+                return timestamps, selected
+        raise RuntimeError("The logger overwrote %s faster than it could be read" % self.file_name)
+
+    def close(self):
+        try:
+            self.map.close()
+        except BufferError:
+            # Arrays handed out still point into the map, it closes when they are gone
+            pass
+        self.ring_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the latest sweeps the logger shares in a sweep ring")
+    parser.add_argument("name", nargs="?", default="daq_sweeps", help="name of the ring, sweep_ring in start.py")
+    parser.add_argument("--daq", help="'<ip> <port>' of the DAQ when the logger scans several")
+    parser.add_argument("-n", "--count", type=int, default=10, help="sweeps to print")
+    parser.add_argument("-c", "--column", action="append", dest="columns", help="channel number or name")
+    parser.add_argument("--follow", action="store_true", help="keep printing new sweeps until Ctrl-C")
+    options = parser.parse_args()
+
+    try:
+        ring = SweepRing(options.name, options.daq)
+    except (OSError, ValueError) as error:
+        print("Cannot attach to the sweep ring: %s" % error)
+        sys.exit(1)
+    try:
+        timestamps, readings = ring.read_latest(options.count, options.columns)
+    except KeyError as error:
+        print(error.args[0])
+        ring.close()
+        sys.exit(1)
+    print("Date Time, %s, " % ", ".join(readings))
+    try:
+        while True:
+            for row, timestamp in enumerate(timestamps):
+                print("%s, %s, " % (time.strftime(binary_log.CSV_DATESTAMP, time.localtime(timestamp)),
+                                    ", ".join("%g" % values[row] for values in readings.values())))
+            if not options.follow:
+                break
+            while ring.sequence == ring.last_sequence:
+                if ring.closed:
+                    # The logger stopped or started over, follow the new ring when there is one
+                    ring.close()
+                    time.sleep(1.0)
+                    ring = SweepRing(options.name, options.daq)
+                    ring.last_sequence = 0
+                    break
+                time.sleep(0.05)
+            timestamps, readings = ring.read_latest(ring.slots, options.columns, ring.last_sequence)
+    except (KeyboardInterrupt, BrokenPipeError):
+        pass
+    except (OSError, ValueError) as error:
+        print("Lost the sweep ring: %s" % error)
+    finally:
+        ring.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Description:
+    Run sweeps on a fixed grid of monotonic deadlines, start + n * interval,
+    so the time a sweep takes never pushes the next one back and the logger
+    does not drift over a long test. Intervals can be fractions of a second.
+
+    A sweep that starts after its deadline is late. When a whole deadline has
+    been missed the policy decides what happens:
+    "skip"     - drop the missed deadlines and wait for the next one on the grid
+    "catch_up" - run the missed sweeps back to back until on time again
+
+    wait() returns how late each sweep started, the logger writes it with
+    the sweep (log_sweep_lateness in start.py) so every sweep can be
+    audited. The summary comes from a latency histogram that stays the same
+    size however long the test runs.
+
+Usage:
+    scheduler = SweepScheduler(0.5, "skip")
+    while True:
+        scheduler.wait()
+        take_a_sweep()
+    print(scheduler.summary())
+"""
+
+import asyncio
+import time
+from daq_metrics import LatencyHistogram
+
+MISSED_SWEEP_POLICIES = ("skip", "catch_up")
+
+
+class SweepScheduler:
+    """Deadlines for sweeps every interval seconds on the monotonic clock
+    lateness is a daq_metrics.LatencyHistogram of how late every sweep run started,
+    times are time.monotonic() seconds.
+    """
+    def __init__(self, interval, policy="skip", start=None):
+        if policy not in MISSED_SWEEP_POLICIES:
+            raise ValueError("Missed sweep policy must be one of: %s" % ", ".join(MISSED_SWEEP_POLICIES))
+        self.interval = float(interval)
+        self.policy = policy
+        self.start = time.monotonic() if start is None else start
+        self.sweep_number = 0
+        self.skipped = 0
+        self.lateness = LatencyHistogram()
+
+    def deadline(self):
+        """Monotonic time the next sweep is due
+        """
+        return self.start + self.sweep_number * self.interval
+
+    def next_sweep(self, now=None):
+        """Pick the sweep to run next and return the seconds to wait for it
+        Under the skip policy missed deadlines are dropped here.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.policy == "skip" and self.interval > 0:
+            missed = int((now - self.deadline()) // self.interval)
+            if missed > 0:
+                self.sweep_number += missed
+                self.skipped += missed
+        return max(0.0, self.deadline() - now)
+
+    def sweep_started(self, now=None):
+        """Record the lateness of the sweep that is starting and move on to the next deadline
+        Returns the lateness in seconds
+        """
+        if now is None:
+            now = time.monotonic()
+        lateness = now - self.deadline()
+        self.lateness.record(lateness)
+        self.sweep_number += 1
+        return lateness
+
+    def wait(self, sleep=time.sleep):
+        """Sleep until the next sweep is due then record it as started
+        sleep can be swapped for one that keeps the DAQ session alive.
+        Returns the lateness of the sweep in seconds
+        """
+        delay = self.next_sweep()
+        if delay > 0:
+            sleep(delay)
+        return self.sweep_started()
+
+    async def wait_async(self, sleep=asyncio.sleep):
+        """wait() for an event loop, other tasks run while this one sleeps
+        """
+        delay = self.next_sweep()
+        if delay > 0:
+            await sleep(delay)
+        return self.sweep_started()
+
+    def summary(self):
+        """Return a one line report of how late the sweeps started
+        """
+        lateness = self.lateness
+        if not lateness.count:
+            return "No sweeps run"
+        return ("%d sweeps every %.3f s, %d skipped, lateness mean %.4f s, p95 %.4f s, max %.4f s" %
+                (lateness.count, self.interval, self.skipped, lateness.mean(), lateness.percentile(95),
+                 lateness.max))
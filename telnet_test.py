@@ -1,6 +1,6 @@
 #!/usr/bin/env python3
 
-import telnetlib
+from DAQ_transport import DAQConnection
 
 HOST = "10.193.64.232"
 PORT = "5024"
@@ -8,9 +8,9 @@ prompt = "34980A> "
 # user = raw_input("Enter your remote account: ")
 # password = getpass.getpass()
 
-tn = telnetlib.Telnet(HOST, PORT)
+tn = DAQConnection(HOST, PORT, 10)
 
-(i, obj, res) = tn.expect([b"34980A>", "incorrect"], 5)
+(i, obj, res) = tn.expect([b"34980A>", b"incorrect"], 5)
 print(res.decode('ascii'))
 
 tn.read_until(b"34980A> ")
@@ -27,7 +27,5 @@ tn.read_until(b"34980A> ")
 # print("read: %s"% mytext.decode('ascii'))
 
 tn.write(b"\x04")
+print(tn.read_all().decode('ascii'))
 tn.close()
-
-
-print(tn.read_all().decode('ascii'))
\ No newline at end of file